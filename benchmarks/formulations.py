@@ -0,0 +1,94 @@
+import argparse
+import random
+import numpy as np
+from managers.data import Data
+from managers.storage import InstanceStore
+from solvers.gurobi import GurobiSolver
+
+# ------------------------------------------------------ Formulations benchmark ------------------------------------------------------
+#
+# Standard (one binary and one set of print variables for each printer) against aggregated (number of printers and total prints of
+# each scenario) formulation of GurobiSolver, on the instance types of the paper ("4.2.2" of 1_paper_results: N, D, S with
+# data_range_R=100 and N_p=50). For every instance both formulations are solved with the same MIPGap and time limit and the row
+# reports the size of the models, the objective values (and whether they are equal up to the gap), the runtime and the nodes of the
+# branch and bound, and whether the aggregated solve needed the standard model (fallback).
+# The instances are generated with the given seed, or loaded from a managers.storage folder (e.g. the converted dataset of the
+# paper) with --store.
+#
+# Usage: python -m benchmarks.formulations --instances 10 --types N100D100S50 N200D100S50 --MIPGap 0.001 --output formulations
+#
+# ------------------------------------------------------------------------------------------------------------------------------------
+
+PAPER_TYPES={
+    "N100D100S50":(100,100,50),
+    "N200D100S50":(200,100,50),
+    "N100D200S50":(200,200,50),
+    "N100D100S100":(100,100,100),
+    "N200D200S100":(200,200,100)
+}
+
+def paper_instance_sets(instances,types,seed=0):
+    np.random.seed(seed)
+    random.seed(seed)
+    return [{"instance_"+name:Data(*PAPER_TYPES[name],data_range_R=100,N_p=50) for name in types} for _ in range(instances)]
+
+def compare_formulations(data_instance,MIPGap=0.001,max_time=None,threads=None):
+    result=dict()
+    for formulation in ("standard","aggregated"):
+        solver=GurobiSolver(data_instance,MIPGap=MIPGap,max_time=max_time,builder="matrix",threads=threads,second_stage_solution=False,formulation=formulation)
+        solver.get_model().update()
+        num_vars,num_constrs=solver.get_model().NumVars,solver.get_model().NumConstrs
+        output=solver.solve()
+        result.update({formulation+"_variables":num_vars,formulation+"_constraints":num_constrs,formulation+"_obj":output["ObjValue"],
+                       formulation+"_runtime":output["Runtime"],formulation+"_nodes":output["Nodes"],formulation+"_status":output["Status"]})
+        if formulation=="aggregated":
+            result["fallback"]=solver.fallback is not None
+    gap=abs(result["standard_obj"]-result["aggregated_obj"])/max(abs(result["standard_obj"]),1e-10)
+    result["equal"]=bool(gap<=(MIPGap or 1e-4)+1e-9)
+    result["speedup"]=round(result["standard_runtime"]/max(result["aggregated_runtime"],1e-2),2)
+    return result
+
+def benchmark_formulations(instance_sets,MIPGap=0.001,max_time=None,threads=None):
+    results=list()
+    for indx,inst_group in enumerate(instance_sets):
+        for instance in inst_group:
+            result=dict({"instance":indx,"type":instance},**compare_formulations(inst_group[instance],MIPGap,max_time,threads))
+            results.append(result)
+            print(result)
+    return results
+
+def summary(results):
+    rows=list()
+    for instance_type in sorted(set(result["type"] for result in results)):
+        group=[result for result in results if result["type"]==instance_type]
+        rows.append({"type":instance_type,"instances":len(group),"equal":sum(result["equal"] for result in group),
+                     "fallbacks":sum(result["fallback"] for result in group),
+                     "standard_runtime":round(float(np.mean([result["standard_runtime"] for result in group])),2),
+                     "aggregated_runtime":round(float(np.mean([result["aggregated_runtime"] for result in group])),2),
+                     "standard_nodes":round(float(np.mean([result["standard_nodes"] for result in group])),1),
+                     "aggregated_nodes":round(float(np.mean([result["aggregated_nodes"] for result in group])),1),
+                     "variables_ratio":round(float(np.mean([result["aggregated_variables"]/result["standard_variables"] for result in group])),3)})
+    return rows
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser()
+    parser.add_argument("--types",nargs="+",default=list(PAPER_TYPES),choices=list(PAPER_TYPES))
+    parser.add_argument("--instances",type=int,default=10)
+    parser.add_argument("--store",default=None)
+    parser.add_argument("--MIPGap",type=float,default=0.001)
+    parser.add_argument("--max_time",type=float,default=None)
+    parser.add_argument("--threads",type=int,default=None)
+    parser.add_argument("--seed",type=int,default=0)
+    parser.add_argument("--output",default=None)
+    args=parser.parse_args()
+    if args.store is not None:
+        instance_sets=[{name:inst_group[name] for name in inst_group if name[len("instance_"):] in args.types} for inst_group in InstanceStore(args.store).instance_sets()][:args.instances]
+    else:
+        instance_sets=paper_instance_sets(args.instances,args.types,args.seed)
+    results=benchmark_formulations(instance_sets,args.MIPGap,args.max_time,args.threads)
+    for row in summary(results):
+        print(row)
+    if args.output is not None:
+        from utils.utils import from_dict_to_csv
+        from_dict_to_csv(results,args.output)
+        from_dict_to_csv(summary(results),args.output+"_summary")
@@ -0,0 +1,86 @@
+import argparse
+import random
+import numpy as np
+from timeit import default_timer as timer
+from managers.data import Data
+from solvers.gurobi import GurobiSolver
+
+# ------------------------------------------------------ Model build benchmark -------------------------------------------------------
+#
+# Time needed by GurobiSolver to build the TSS-3DKP model with the "loop" and the "matrix" builders, for every combination of
+# the number of items N, the number of scenarios S and the number of printers (printers_upperbound). Only the model generation is
+# measured: the upperbound is given explicitly, so _smart_upperbound is not executed, and the model is updated before stopping the
+# timer since Gurobi processes pending modifications lazily.
+# With --check every row also reports whether the models of the two builders are the same ("equivalent"): same columns (type,
+# bounds and objective, in the order of solvers.formulation.variable_layout) and same rows (coefficients, sense and right hand
+# side, in any order).
+#
+# Usage: python -m benchmarks.model_build --N 50 100 200 --S 50 100 500 --printers 1 5 10 --output model_build
+#        python -m benchmarks.model_build --N 50 100 --S 50 100 --printers 1 5 --check
+#
+# ------------------------------------------------------------------------------------------------------------------------------------
+
+def build_time(data_instance,printers_upperbound,builder):
+    start=timer()
+    solver=GurobiSolver(data_instance,printers_upperbound=printers_upperbound,builder=builder)
+    solver.get_model().update()
+    end=timer()
+    num_vars,num_constrs=solver.get_model().NumVars,solver.get_model().NumConstrs
+    solver.get_model().dispose()
+    return end-start,num_vars,num_constrs
+
+# Columns (type, bounds, objective) in the order of variable_layout, in which both builders add the variables, and rows (sorted
+# coefficients, sense, right hand side)
+def _gurobi_model(solver):
+    model=solver.get_model()
+    model.update()
+    variables=model.getVars()
+    columns=list(zip(model.getAttr("VType",variables),model.getAttr("LB",variables),model.getAttr("UB",variables),np.round(model.getAttr("Obj",variables),9)))
+    A=model.getA().tocsr()
+    A.eliminate_zeros()
+    constrs=model.getConstrs()
+    constraints=sorted((tuple(zip(A.indices[A.indptr[row]:A.indptr[row+1]].tolist(),np.round(A.data[A.indptr[row]:A.indptr[row+1]],9).tolist())),sense,round(rhs,9))
+                       for row,sense,rhs in zip(range(A.shape[0]),model.getAttr("Sense",constrs),model.getAttr("RHS",constrs)))
+    return columns,constraints,model.ModelSense
+
+def models_equivalent(data_instance,printers_upperbound):
+    models=[_gurobi_model(GurobiSolver(data_instance,printers_upperbound=printers_upperbound,builder=builder)) for builder in ("loop","matrix")]
+    return models[0]==models[1]
+
+def benchmark_model_build(Ns,Ss,printers,D=100,N_p=None,trials=1,seed=0,check=False):
+    results=list()
+    for N in Ns:
+        for S in Ss:
+            np.random.seed(seed)
+            random.seed(seed)
+            data_instance=Data(N,D,S,N_p=N_p)
+            for U in printers:
+                result={"N":N,"S":S,"printers_upperbound":U}
+                for builder in ("loop","matrix"):
+                    times=list()
+                    for _ in range(trials):
+                        elapsed,num_vars,num_constrs=build_time(data_instance,U,builder)
+                        times.append(elapsed)
+                    result[builder+"_time"]=round(min(times),4)
+                result["speedup"]=round(result["loop_time"]/max(result["matrix_time"],1e-9),1)
+                result["variables"],result["constraints"]=num_vars,num_constrs
+                if check:
+                    result["equivalent"]=models_equivalent(data_instance,U)
+                results.append(result)
+                print(result)
+    return results
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser()
+    parser.add_argument("--N",type=int,nargs="+",default=[50,100,200])
+    parser.add_argument("--S",type=int,nargs="+",default=[50,100,500])
+    parser.add_argument("--printers",type=int,nargs="+",default=[1,5,10])
+    parser.add_argument("--D",type=int,default=100)
+    parser.add_argument("--trials",type=int,default=1)
+    parser.add_argument("--check",action="store_true")
+    parser.add_argument("--output",default=None)
+    args=parser.parse_args()
+    results=benchmark_model_build(args.N,args.S,args.printers,D=args.D,trials=args.trials,check=args.check)
+    if args.output is not None:
+        from utils.utils import from_dict_to_csv
+        from_dict_to_csv(results,args.output)
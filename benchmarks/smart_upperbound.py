@@ -0,0 +1,77 @@
+import sys
+import argparse
+import random
+import numpy as np
+from timeit import default_timer as timer
+from managers.data import Data
+from solvers.solver import Solver
+
+# ---------------------------------------------------- Smart upperbound benchmark ----------------------------------------------------
+#
+# Time of Solver.smart_upperbound (vectorized over the scenarios) against the original loop implementation, kept here as
+# reference_smart_upperbound, for every combination of the number of scenarios S and the maximum demand D. Every row also checks
+# that the two implementations return the same upperbound, for the instance and for its expected value scenario.
+#
+# Usage: python -m benchmarks.smart_upperbound --S 100 1000 10000 --D 50 200 --output smart_upperbound
+#
+# ------------------------------------------------------------------------------------------------------------------------------------
+
+def reference_smart_upperbound(data_instance):
+    max_num_of_printers=0
+    for scenario in range(data_instance.S):
+        num_of_printers=1
+        time_counter=data_instance.T;
+        if time_counter==0:
+            return 1
+        for item in range(data_instance.N):
+            if item in data_instance.N_p:
+                total_items=data_instance.demand[scenario][item]
+                while total_items>0:
+                    num_of_items=min(int(time_counter/data_instance.t[item]),total_items)
+                    if num_of_items>0:
+                        time_counter=time_counter-num_of_items*data_instance.t[item]
+                        total_items=total_items-num_of_items
+                    if num_of_items==0:
+                        num_of_printers=num_of_printers+1
+                        time_counter=data_instance.T
+        if (num_of_printers>max_num_of_printers):
+            max_num_of_printers=num_of_printers;
+    return max(min(max_num_of_printers,sys.maxsize if data_instance.w_p==0 else int(data_instance.W/data_instance.w_p),sys.maxsize if data_instance.v_p==0 else int(data_instance.V/data_instance.v_p)),1)
+
+def benchmark_smart_upperbound(Ss,Ds,N=100,w_p=0,trials=1,seed=0):
+    results=list()
+    for S in Ss:
+        for D in Ds:
+            np.random.seed(seed)
+            random.seed(seed)
+            data_instance=Data(N,D,S,w_p=w_p,v_p=w_p)
+            # The instance generator can draw a printing time greater than T, on which the reference loop never ends
+            data_instance.t=np.minimum(data_instance.t,max(data_instance.T,1))
+            result={"S":S,"D":D,"N":N}
+            for name,function in (("loop",reference_smart_upperbound),("vectorized",Solver.smart_upperbound)):
+                times=list()
+                for _ in range(trials):
+                    start=timer()
+                    upperbound=function(data_instance)
+                    times.append(timer()-start)
+                result[name+"_time"]=round(min(times),5)
+                result[name+"_upperbound"]=upperbound
+            result["speedup"]=round(result["loop_time"]/max(result["vectorized_time"],1e-9),1)
+            expected=data_instance.expected()
+            result["identical"]=result["loop_upperbound"]==result["vectorized_upperbound"] and reference_smart_upperbound(expected)==Solver.smart_upperbound(expected)
+            results.append(result)
+            print(result)
+    return results
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser()
+    parser.add_argument("--S",type=int,nargs="+",default=[100,1000,10000])
+    parser.add_argument("--D",type=int,nargs="+",default=[50,200])
+    parser.add_argument("--N",type=int,default=100)
+    parser.add_argument("--trials",type=int,default=1)
+    parser.add_argument("--output",default=None)
+    args=parser.parse_args()
+    results=benchmark_smart_upperbound(args.S,args.D,N=args.N,trials=args.trials)
+    if args.output is not None:
+        from utils.utils import from_dict_to_csv
+        from_dict_to_csv(results,args.output)
@@ -0,0 +1,156 @@
+import sys
+import json
+import random
+import argparse
+import platform
+import itertools
+import numpy as np
+import gurobipy as gb
+from timeit import default_timer as timer
+from managers.data import Data
+from solvers.solver import Solver
+from solvers.gurobi import GurobiSolver
+from solvers.evaluation import StochasticEvaluator
+
+# ---------------------------------------------------------- Benchmark suite ---------------------------------------------------------
+#
+# Time of every stage of the pipeline, measured separately, for every combination of the grids of N, S, D, N_p and correlation
+# classes of managers.data.Data and of the seeds:
+#  - generation: Data(N,D,S,data_range_R,N_p=N_p,correlation=correlation) with np.random/random seeded with the seed.
+#  - smart_upperbound: Solver.smart_upperbound.
+#  - model_generator: GurobiSolver._model_generator with the model update (GurobiSolver.build_time), with the upperbound given.
+#  - solve: Gurobi optimization (model Runtime); _get_output is timed separately (get_output).
+#  - evaluation (with --evaluation): second stage of the solution evaluated on all the scenarios by StochasticEvaluator.
+# Every stage is repeated "repeat" times (the minimum is kept) except the solve. The rows also have the size of the model, the
+# status, the objective value and the nodes, and the file has the parameters of the run and the versions of Python, NumPy and
+# Gurobi, in JSON (and CSV with --csv).
+#
+# -- Compare mode --
+#   The rows of two runs with the same configuration (N, S, D, N_p, correlation, seed) are compared stage by stage: a stage is a
+#   regression when new_time>(1+threshold)*old_time and new_time-old_time>min_time (to ignore the noise of the fastest stages).
+#   Different objective values (beyond the MIPGap of the runs) are reported too. The exit code is 1 if something is flagged.
+#
+# Usage: python -m benchmarks.suite run --N 50 100 --S 50 100 --D 100 --correlations uncorrelated strongly --seeds 0 1 --output run.json
+#        python -m benchmarks.suite compare run.json new_run.json --threshold 0.2
+#
+# ------------------------------------------------------------------------------------------------------------------------------------
+
+STAGES=("generation","smart_upperbound","model_generator","solve","get_output","evaluation")
+CONFIGURATION=("N","S","D","N_p","correlation","seed")
+
+def _seed(seed):
+    np.random.seed(seed)
+    random.seed(seed)
+
+def _best_time(function,repeat):
+    times=list()
+    for _ in range(repeat):
+        start=timer()
+        value=function()
+        times.append(timer()-start)
+    return min(times),value
+
+def benchmark_configuration(N,S,D,N_p,correlation,seed,data_range_R=1000,MIPGap=0.001,max_time=None,builder="matrix",formulation="standard",
+                            threads=None,evaluation=False,repeat=3):
+    row={"N":N,"S":S,"D":D,"N_p":N_p,"correlation":correlation,"seed":seed}
+    def generate():
+        _seed(seed)
+        return Data(N,D,S,data_range_R=data_range_R,N_p=N_p,correlation=getattr(Data.Correlation,correlation))
+    row["generation"],data_instance=_best_time(generate,repeat)
+    row["smart_upperbound"],printers_upperbound=_best_time(lambda:Solver.smart_upperbound(data_instance),repeat)
+    build_times,solver=list(),None
+    for _ in range(repeat):
+        # Only the last model is solved: the previous ones are disposed before the next build is timed
+        if solver is not None:
+            solver.get_model().dispose()
+        solver=GurobiSolver(data_instance,MIPGap=MIPGap,max_time=max_time,printers_upperbound=printers_upperbound,builder=builder,formulation=formulation,threads=threads)
+        build_times.append(solver.build_time)
+    row["model_generator"]=min(build_times)
+    output=solver.solve()
+    row["solve"]=float(solver.get_model().Runtime)
+    row["get_output"],_=_best_time(solver._get_output,repeat)
+    if evaluation:
+        solution=output["Solution"]
+        row["evaluation"],_=_best_time(lambda:StochasticEvaluator(data_instance,threads=threads).second_stage_obj_value(solution["a"],solution["a_b"],output["Printers"]),1)
+    row.update({"printers_upperbound":printers_upperbound,"variables":solver.get_model().NumVars,"constraints":solver.get_model().NumConstrs,
+                "status":output["Status"],"obj_value":output["ObjValue"],"nodes":output["Nodes"],"mip_gap":output["MIPGap"]})
+    solver.get_model().dispose()
+    return row
+
+def run_suite(Ns,Ss,Ds,N_ps=(None,),correlations=("uncorrelated",),seeds=(0,),log=True,**kwargs):
+    rows=list()
+    for N,S,D,N_p,correlation,seed in itertools.product(Ns,Ss,Ds,N_ps,correlations,seeds):
+        row=benchmark_configuration(N,S,D,N if N_p is None else min(N,N_p),correlation,seed,**kwargs)
+        rows.append(row)
+        if log:
+            print(row)
+    return rows
+
+def environment():
+    return {"python":platform.python_version(),"numpy":np.__version__,"gurobi":".".join(str(v) for v in gb.gurobi.version()),
+            "platform":platform.platform(),"processor":platform.processor()}
+
+def save_run(file_name,rows,parameters):
+    with open(file_name,"w") as f:
+        json.dump({"environment":environment(),"parameters":parameters,"rows":rows},f,indent=1)
+
+def load_run(file_name):
+    with open(file_name) as f:
+        return json.load(f)
+
+def compare_runs(old,new,threshold=0.2,min_time=0.01):
+    key=lambda row:tuple(row[name] for name in CONFIGURATION)
+    old_rows={key(row):row for row in old["rows"]}
+    tolerance=max(old["parameters"].get("MIPGap") or 1e-4,new["parameters"].get("MIPGap") or 1e-4)
+    flagged=list()
+    for row in new["rows"]:
+        if key(row) not in old_rows:
+            continue
+        old_row=old_rows[key(row)]
+        for stage in STAGES:
+            if stage in row and stage in old_row and row[stage]>(1+threshold)*old_row[stage] and row[stage]-old_row[stage]>min_time:
+                flagged.append(dict(zip(CONFIGURATION,key(row)),stage=stage,old=old_row[stage],new=row[stage],ratio=round(row[stage]/max(old_row[stage],1e-12),2)))
+        if abs(row["obj_value"]-old_row["obj_value"])>tolerance*max(abs(old_row["obj_value"]),1):
+            flagged.append(dict(zip(CONFIGURATION,key(row)),stage="obj_value",old=old_row["obj_value"],new=row["obj_value"],ratio=None))
+    return flagged
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser()
+    commands=parser.add_subparsers(dest="command",required=True)
+    run=commands.add_parser("run")
+    run.add_argument("--N",type=int,nargs="+",default=[50,100])
+    run.add_argument("--S",type=int,nargs="+",default=[50,100])
+    run.add_argument("--D",type=int,nargs="+",default=[100])
+    run.add_argument("--N_p",type=int,nargs="+",default=[None])
+    run.add_argument("--correlations",nargs="+",default=["uncorrelated"],choices=[name for name in vars(Data.Correlation) if not name.startswith("_") and isinstance(getattr(Data.Correlation,name),str)])
+    run.add_argument("--seeds",type=int,nargs="+",default=[0])
+    run.add_argument("--data_range_R",type=int,default=1000)
+    run.add_argument("--MIPGap",type=float,default=0.001)
+    run.add_argument("--max_time",type=float,default=None)
+    run.add_argument("--builder",default="matrix",choices=["loop","matrix"])
+    run.add_argument("--formulation",default="standard",choices=["standard","aggregated"])
+    run.add_argument("--threads",type=int,default=None)
+    run.add_argument("--evaluation",action="store_true")
+    run.add_argument("--repeat",type=int,default=3)
+    run.add_argument("--output",required=True)
+    run.add_argument("--csv",action="store_true")
+    compare=commands.add_parser("compare")
+    compare.add_argument("old")
+    compare.add_argument("new")
+    compare.add_argument("--threshold",type=float,default=0.2)
+    compare.add_argument("--min_time",type=float,default=0.01)
+    args=parser.parse_args()
+    if args.command=="run":
+        parameters={name:value for name,value in vars(args).items() if name not in ("command","output","csv")}
+        rows=run_suite(args.N,args.S,args.D,args.N_p,args.correlations,args.seeds,data_range_R=args.data_range_R,MIPGap=args.MIPGap,max_time=args.max_time,
+                       builder=args.builder,formulation=args.formulation,threads=args.threads,evaluation=args.evaluation,repeat=args.repeat)
+        save_run(args.output,rows,parameters)
+        if args.csv:
+            from utils.utils import from_dict_to_csv
+            from_dict_to_csv(rows,args.output.rsplit(".",1)[0])
+    else:
+        flagged=compare_runs(load_run(args.old),load_run(args.new),args.threshold,args.min_time)
+        for row in flagged:
+            print(row)
+        print(str(len(flagged))+" regressions")
+        sys.exit(1 if len(flagged)>0 else 0)
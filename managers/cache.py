@@ -0,0 +1,133 @@
+import json
+import time
+import inspect
+import hashlib
+import sqlite3
+import numpy as np
+from solvers.solver import Solver
+from solvers.gurobi import GurobiSolver
+from managers.runner import _to_json
+
+# ------------------------------------------------------- Cache module ---------------------------------------------------------------
+#
+# This module keeps the results of the solvers in a SQLite file, so that running a notebook again after a small change only
+# solves the instances (or the parameters) that changed. The results are content addressed: the key is the SHA-256 of
+#  - the instance: the values of the arrays (w, r, v, t, m, N_p, demand, q) and of the parameters of the model (N, S, alpha, w_p,
+#    v_p, w_b, v_b, T, W, V), so two Data objects with the same values have the same key whatever their dtypes;
+#  - the solver: class, method ("solve", "wait_and_see_obj_value", "EEVS_obj_value", ...) and all the arguments of the
+#    constructor with their defaults (MIPGap, max_time, formulation, builder, ...). printers_upperbound=None is replaced by the
+#    smart upperbound. The arguments that do not change the result (log, threads, start) are not part of the key.
+# The results are stored as JSON (the arrays of a Solution are read back as NumPy arrays). With max_entries and/or max_size
+# (bytes of the stored results) the least recently used results are removed when the limits are exceeded.
+#
+# -- Classes --
+#  -ResultCache(path,max_entries=None,max_size=None): the cache file. solve(data_instance,solver_class=GurobiSolver,
+#               method="solve",**solver_kwargs) returns the cached result or runs the solver and stores its result; get, put,
+#               __contains__, __len__, size, clear and close work on the keys directly.
+#
+# -- Functions --
+#  -instance_hash(data_instance): hash of the values of the instance.
+#  -cache_key(data_instance,solver_class=GurobiSolver,method="solve",**solver_kwargs): key of a result.
+#
+# ------------------------------------------------------------------------------------------------------------------------------------
+
+INSTANCE_ARRAYS=("w","r","v","t","m","N_p","demand","q")
+INSTANCE_PARAMETERS=("N","S","alpha","w_p","v_p","w_b","v_b","T","W","V")
+EXCLUDED_ARGUMENTS=("self","data_instance","log","threads","start")
+
+def instance_hash(data_instance):
+    digest=hashlib.sha256()
+    digest.update(json.dumps([float(getattr(data_instance,name)) for name in INSTANCE_PARAMETERS]).encode())
+    for name in INSTANCE_ARRAYS:
+        array=np.ascontiguousarray(np.asarray(getattr(data_instance,name),dtype=np.float64))
+        digest.update(name.encode()+str(array.shape).encode()+array.tobytes())
+    return digest.hexdigest()
+
+def _solver_arguments(data_instance,solver_class,solver_kwargs):
+    signature=inspect.signature(solver_class.__init__)
+    bound=signature.bind_partial(None,data_instance,**solver_kwargs)
+    bound.apply_defaults()
+    arguments={name:value for name,value in bound.arguments.items() if name not in EXCLUDED_ARGUMENTS}
+    if "printers_upperbound" in signature.parameters and arguments.get("printers_upperbound") is None:
+        arguments["printers_upperbound"]=Solver.smart_upperbound(data_instance)
+    return arguments
+
+def cache_key(data_instance,solver_class=GurobiSolver,method="solve",**solver_kwargs):
+    solver={"class":solver_class.__module__+"."+solver_class.__qualname__,"method":method,
+            "arguments":_solver_arguments(data_instance,solver_class,solver_kwargs)}
+    return hashlib.sha256((instance_hash(data_instance)+json.dumps(solver,sort_keys=True,default=_to_json)).encode()).hexdigest()
+
+def _from_json(value):
+    if isinstance(value,dict) and isinstance(value.get("Solution"),dict):
+        value["Solution"]={name:np.asarray(array) if isinstance(array,list) else array for name,array in value["Solution"].items()}
+    return value
+
+class ResultCache:
+
+    def __init__(self,path,max_entries=None,max_size=None):
+        self.path=path
+        self.max_entries=max_entries
+        self.max_size=max_size
+        # Several processes (e.g. the workers of managers.runner) can use the same file
+        self.connection=sqlite3.connect(path,timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                                "solver TEXT, method TEXT, created REAL NOT NULL, accessed REAL NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+        self.connection.commit()
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def __contains__(self,key):
+        return self.connection.execute("SELECT 1 FROM results WHERE key=?",(key,)).fetchone() is not None
+
+    # Bytes of the stored results
+    def size(self):
+        return self.connection.execute("SELECT COALESCE(SUM(size),0) FROM results").fetchone()[0]
+
+    def get(self,key,default=None):
+        row=self.connection.execute("SELECT value FROM results WHERE key=?",(key,)).fetchone()
+        if row is None:
+            return default
+        with self.connection:
+            self.connection.execute("UPDATE results SET accessed=? WHERE key=?",(time.time(),key))
+        return _from_json(json.loads(row[0]))
+
+    def put(self,key,value,solver=None,method=None):
+        value=json.dumps(value,default=_to_json)
+        now=time.time()
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO results VALUES (?,?,?,?,?,?,?)",(key,value,len(value),solver,method,now,now))
+        self.evict()
+
+    # Remove the least recently used results until the limits are respected
+    def evict(self):
+        with self.connection:
+            if self.max_entries is not None:
+                self.connection.execute("DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY accessed DESC LIMIT -1 OFFSET ?)",(self.max_entries,))
+            if self.max_size is not None:
+                total=self.size()
+                if total>self.max_size:
+                    removed=list()
+                    for key,size in self.connection.execute("SELECT key,size FROM results ORDER BY accessed ASC").fetchall():
+                        if total<=self.max_size:
+                            break
+                        removed.append((key,))
+                        total-=size
+                    self.connection.executemany("DELETE FROM results WHERE key=?",removed)
+
+    def clear(self):
+        with self.connection:
+            self.connection.execute("DELETE FROM results")
+
+    def close(self):
+        self.connection.close()
+
+    def solve(self,data_instance,solver_class=GurobiSolver,method="solve",**solver_kwargs):
+        key=cache_key(data_instance,solver_class,method,**solver_kwargs)
+        result=self.get(key)
+        if result is None:
+            result=getattr(solver_class(data_instance,**solver_kwargs),method)()
+            self.put(key,result,solver_class.__qualname__,method)
+        return result
@@ -15,9 +15,25 @@ import time
 # class used is the uncorrelated one, since (as per the paper) it considers many different items for which
 # the weight, volume, and rewards vary heavily and can be realistic for disaster response missions.
 #
+# -- Views --
+# The attributes are stored in __slots__ and the NumPy arrays are read-only, so instances can share them: the
+# methods scenario(s), scenarios(indexes), expected() and with_params(**parameters) return new instances that
+# share all the arrays they do not change (scenario and scenarios with a slice never copy the demand matrix).
+# For the same reason copy.deepcopy only copies the N_p list and the arrays that are still writable. The methods
+# set_only_one_scenario, set_only_expected_scenario and force_no_printer_solutions change the instance itself.
+#
 # --------------------------------------------------------------------------------------------------------------
 
+# Read-only view of an array: the array of the caller stays writable
+def _frozen(value):
+  value=np.asarray(value).view()
+  value.flags.writeable=False
+  return value
+
 class Data:
+
+  __slots__=("N","D","S","data_range_R","w_p","v_p","alpha","w_b","v_b","w","r","v","t","m","N_p","demand","q","T","W","V","_printable_index")
+  _ARRAYS=("w","r","v","t","m","demand","q")
  
   # N: Number of items
   # D: Upper limit to the demand
@@ -63,18 +79,91 @@ class Data:
     self.W=int(np.round((np.random.rand()*(1-0.5)+0.5)*np.sum(np.dot(self.demand,self.w)*self.q)))
     self.V=int(np.round((np.random.rand()*(2-0.5)+0.5)*self.W))
 
+  # Arrays are stored read-only, so that they can be shared by copies and views
+  def __setattr__(self,name,value):
+    object.__setattr__(self,name,_frozen(value) if name in Data._ARRAYS and value is not None else value)
+
+  def __getstate__(self):
+    return {name:getattr(self,name) for name in Data.__slots__ if hasattr(self,name)}
+
+  # Also accepts the state of the instances pickled before __slots__ (a dict)
+  def __setstate__(self,state):
+    if isinstance(state,tuple):
+      state=dict(state[0] or {},**(state[1] or {}))
+    for name,value in state.items():
+      if name in Data.__slots__:
+        setattr(self,name,value)
+
+  def __copy__(self):
+    data=type(self).__new__(type(self))
+    for name in Data.__slots__:
+      if hasattr(self,name):
+        object.__setattr__(data,name,getattr(self,name))
+    data.N_p=list(self.N_p)
+    return data
+
+  def __deepcopy__(self,memo):
+    data=self.__copy__()
+    for name in Data._ARRAYS:
+      if hasattr(self,name) and getattr(self,name).flags.writeable:
+        setattr(data,name,np.array(getattr(self,name)))
+    return data
+
+  # Instance with only the given scenario (probability 1)
+  def scenario(self,scenario):
+    if scenario not in range(self.S):
+      raise IndexError("Scenario "+str(scenario)+" out of range")
+    return self.scenarios(slice(scenario,scenario+1),q=np.ones(1))
+
+  # Instance with the scenarios selected by "indexes" (slice, indexes or boolean mask) and probabilities q (default: the
+  # probabilities of the selected scenarios, normalized)
+  def scenarios(self,indexes,q=None):
+    demand=self.demand[indexes]
+    q=self.q[indexes]/np.sum(self.q[indexes]) if q is None else q
+    return self.with_params(demand=demand,q=q)
+
+  # Instance with one scenario, the expected demand
+  def expected(self):
+    return self.with_params(demand=(self.q@self.demand)[None,:],q=np.ones(1))
+
+  # Instance with the given parameters (e.g. alpha=0.5, w_p=100); the other parameters are shared. If only the demand is
+  # given, S follows its rows and q is uniform when the number of scenarios changes.
+  def with_params(self,**parameters):
+    unknown=set(parameters)-(set(Data.__slots__)-{"_printable_index"})
+    if unknown:
+      raise ValueError("Unknown parameters: "+str(sorted(unknown)))
+    data=self.__copy__()
+    for name,value in parameters.items():
+      setattr(data,name,[int(item) for item in value] if name=="N_p" else value)
+    if "demand" in parameters:
+      if "S" not in parameters:
+        data.S=len(data.demand)
+      if "q" not in parameters and len(data.q)!=data.S:
+        data.q=np.ones(data.S)/data.S
+    return data
+
   def set_only_one_scenario(self,scenario):
     if scenario not in range(self.S):
         return None
-    self.demand=np.array([self.demand[scenario]])
-    self.q=np.array([1])
-    self.S=1
+    self.demand,self.q,self.S=self.demand[scenario:scenario+1],np.ones(1),1
   def force_no_printer_solutions(self):
     self.w_p=self.W+1
   def set_only_expected_scenario(self):
-    self.demand=np.array([[np.sum([self.demand[scenario][item]*self.q[scenario] for scenario in range(self.S)]) for item in range(self.N)]])
-    self.q=np.array([1])
-    self.S=1
+    self.demand,self.q,self.S=(self.q@self.demand)[None,:],np.ones(1),1
+
+  # Return a boolean mask over the N items (True if the item is printable) and, for each item, its position
+  # inside N_p (-1 if not printable). The two arrays are computed once and cached until N_p changes, so the
+  # model builders can avoid the "item in N_p" and "N_p.index(item)" lookups on the list.
+  def get_printable_index(self):
+    N_p=tuple(int(item) for item in self.N_p)
+    cached=getattr(self,"_printable_index",None)
+    if cached is None or cached[0]!=N_p or len(cached[1])!=self.N:
+      mask=np.zeros(self.N,dtype=bool)
+      mask[list(N_p)]=True
+      position=np.full(self.N,-1,dtype=int)
+      position[list(N_p)]=np.arange(len(N_p))
+      self._printable_index=(N_p,mask,position)
+    return self._printable_index[1],self._printable_index[2]
 
   def get_instance_as_dict(self):
         instance={
@@ -86,6 +175,18 @@ class Data:
         }
         return instance
 
+  # Build an instance from the dict of get_instance_as_dict (lists or NumPy arrays) without running the generator.
+  # The arrays are kept as given (e.g. read-only memory maps of managers.storage), lists are converted to arrays.
+  @classmethod
+  def from_dict(cls,instance):
+    data=cls.__new__(cls)
+    for key in ("N","D","S","data_range_R","w_p","v_p","alpha","w_b","v_b","T","W","V"):
+      setattr(data,key,instance[key])
+    for key in ("w","r","v","t","m","demand","q"):
+      setattr(data,key,np.asarray(instance[key]))
+    data.N_p=[int(item) for item in instance["N_p"]]
+    return data
+
   def print_instance(self):
     print("-------------------------- Data Instance --------------------------")
     print("----------------- Items -----------------")
@@ -175,4 +276,51 @@ class Data:
           weights=np.array(weights_new)
           revenues=np.array(revenues_new)
                 
-      return weights, revenues
\ No newline at end of file
+      return weights, revenues
+
+    # Vectorized version of get_distributions for K instances at once: weights and revenues are (K,N) arrays drawn from the
+    # NumPy Generator "rng", with the same formulas (and dtypes) of get_distributions. int() truncation is np.trunc.
+    def get_distributions_batch(type,R,N,rng,K=1):
+      match type:
+        case Data.Correlation.uncorrelated:
+          weights= np.ceil(rng.random((K,N))*R).astype("int")
+          revenues= np.ceil(rng.random((K,N))*R).astype("int")
+        case Data.Correlation.weakly:
+          weights= np.ceil(rng.random((K,N))*R).astype("int")
+          revenues= np.trunc(rng.random((K,N))*(R/5+1)+weights-(R/10)).astype("int")
+        case Data.Correlation.strongly:
+          weights= np.ceil(rng.random((K,N))*R).astype("int")
+          revenues= np.trunc(weights+(R/10)).astype("int")
+        case Data.Correlation.inverse:
+          revenues= np.ceil(rng.random((K,N))*R).astype("int")
+          weights= np.trunc(revenues+(R/10)).astype("int")
+        case Data.Correlation.almost:
+          weights= np.ceil(rng.random((K,N))*R).astype("int")
+          revenues= np.trunc(rng.random((K,N))*(R*2/500+1)+weights+R/10-R/500).astype("int")
+        case Data.Correlation.subset:
+          weights= np.ceil(rng.random((K,N))*R).astype("int")
+          revenues= weights.copy()
+        case Data.Correlation.similar:
+          weights= np.ceil(rng.random((K,N))*(100+1)+100000-1).astype("int")
+          revenues= np.ceil(rng.random((K,N))*1000).astype("int")
+        case Data.Correlation.circle:
+          weights= np.ceil(rng.random((K,N))*R).astype("int")
+          revenues= (2/3)*np.sqrt(4*(R**2)-(weights-2*R)**2)
+        case Data.Correlation.multiple:
+          k_1,k_2,d=3*R/10,2*R/10,10
+          weights= np.ceil(rng.random((K,N))*R).astype("int")
+          revenues= weights+np.where(weights%d==0,k_1,k_2)
+        case Data.Correlation.ceiling:
+          weights= np.ceil(rng.random((K,N))*R).astype("int")
+          revenues= 5*np.ceil(weights/5)
+        case Data.Correlation.spanner:
+          v,m=2,10
+          base_weights= np.ceil(2*np.ceil(rng.random((K,v))*R).astype("int")/m)
+          base_revenues= np.ceil(2*np.ceil(rng.random((K,v))*R).astype("int")/m)
+          r=np.trunc(rng.random((K,N))*v).astype("int")
+          a=np.trunc(rng.random((K,N))*m).astype("int")+1
+          weights= np.take_along_axis(base_weights,r,axis=1)*a
+          revenues= np.take_along_axis(base_revenues,r,axis=1)*a
+        case _:
+          raise ValueError("Unknown correlation: "+str(type))
+      return weights, revenues
@@ -0,0 +1,67 @@
+import numpy as np
+from managers.data import Data
+from managers.storage import save_instances
+
+# ------------------------------------------------------- Generator module -----------------------------------------------------------
+#
+# This module generates K instances of the TSS-3DKP at once, with the distributions of Data.__instance_generator (section
+# "4.2.1 Instance Generation" of the paper) computed on stacked arrays: items (K,N), scenarios (K,S), demand (K,S,N). All the
+# random numbers come from a numpy.random.Generator, so the same seed always gives the same batch and the global state of
+# np.random/random is not used.
+#
+# -- Classes --
+#  -InstanceBatch: the stacked arrays of the batch. instance(k) returns the k-th instance as a Data object, instances() all of
+#                  them; the Data objects share the arrays of the batch (no copy). save(path) stores the batch with
+#                  managers.storage.
+#
+# -- Functions --
+#  -generate_batch(K,N,D,S,...,seed=None): generate a batch, with the same parameters of Data plus the seed (an int or a
+#                                          numpy.random.Generator).
+#
+# ------------------------------------------------------------------------------------------------------------------------------------
+
+class InstanceBatch:
+
+    def __init__(self,parameters,w,r,v,t,m,N_p,demand,q,T,W,V):
+        self.parameters=parameters
+        self.w,self.r,self.v,self.t,self.m=w,r,v,t,m
+        self.N_p=N_p
+        self.demand,self.q=demand,q
+        self.T,self.W,self.V=T,W,V
+
+    def __len__(self):
+        return len(self.T)
+
+    def instance(self,k):
+        instance=dict(self.parameters)
+        instance.update({"w":self.w[k],"r":self.r[k],"v":self.v[k],"t":self.t[k],"m":self.m[k],"N_p":self.N_p[k],
+                         "demand":self.demand[k],"q":self.q[k],"T":int(self.T[k]),"W":int(self.W[k]),"V":int(self.V[k])})
+        return Data.from_dict(instance)
+
+    def instances(self):
+        return [self.instance(k) for k in range(len(self))]
+
+    # Save the batch with managers.storage
+    def save(self,path,keys=None,metadata=None):
+        return save_instances(path,self.instances(),keys,metadata)
+
+def generate_batch(K,N,D,S,data_range_R=1000,w_p=5000,v_p=5000,alpha=0.8,w_b=1,v_b=1,N_p=None,correlation=None,seed=None):
+    rng=seed if isinstance(seed,np.random.Generator) else np.random.default_rng(seed)
+    N_p=N if N_p is None else min(N,N_p)
+    correlation=Data.Correlation.uncorrelated if correlation is None else correlation
+    w,r=Data.Correlation.get_distributions_batch(correlation,data_range_R,N,rng,K)
+    v=np.round((rng.random((K,N))*(5-0.2)+0.2)*w).astype("int")
+    t=np.ceil(rng.random((K,N))*10).astype("int")
+    m=np.round((rng.random((K,N))*(0.9-0.5)+0.5)*np.minimum(w,v)).astype("int")
+    # Random subset of N_p items for each instance, in increasing order
+    printable=np.sort(np.argsort(rng.random((K,N)),axis=1)[:,:N_p],axis=1)
+    max_demand_per_item=np.ceil(rng.random((K,1,N))*D)
+    demand=np.ceil(rng.random((K,S,N))*(max_demand_per_item+1)-1).astype("int")
+    q=np.full((K,S),1/S)
+    # Expected total printing time, weight of the demand, as in the generator of Data
+    expected_demand=np.einsum("ks,ksn->kn",q,demand)
+    T=np.round((rng.random(K)*(1-0.2)+0.2)*np.einsum("kn,kn->k",expected_demand,t)).astype("int")
+    W=np.round((rng.random(K)*(1-0.5)+0.5)*np.einsum("kn,kn->k",expected_demand,w)).astype("int")
+    V=np.round((rng.random(K)*(2-0.5)+0.5)*W).astype("int")
+    parameters={"N":N,"D":D,"S":S,"data_range_R":data_range_R,"w_p":w_p,"v_p":v_p,"alpha":alpha,"w_b":w_b,"v_b":v_b}
+    return InstanceBatch(parameters,w,r,v,t,m,printable,demand,q,T,W,V)
@@ -0,0 +1,129 @@
+import copy
+import numpy as np
+from scipy.optimize import nnls
+from timeit import default_timer as timer
+from solvers.gurobi import GurobiSolver
+from solvers.evaluation import StochasticEvaluator
+
+# ------------------------------------------------------- Reduction module -----------------------------------------------------------
+#
+# This module reduces the S scenarios of a Data instance (rows of "demand" with probabilities "q") to K representative scenarios,
+# so that the deterministic equivalent is solved at the cost of K scenarios. The distance between two scenarios is the Euclidean
+# distance of their demands, each item weighted by "item_weights" (default: 1, e.g. the revenues r to weight the errors on the
+# most valuable items). Methods:
+#  - "kmedoids": K medoids of the scenarios (alternating assignment/update, k-means++ initialisation); every medoid takes the
+#    probability of the scenarios assigned to it.
+#  - "forward": fast forward selection (Heitsch and Romisch): the scenarios are selected one at a time, each time the one that
+#    minimises the probability weighted distance of the non-selected scenarios from the selected ones; the probability of every
+#    non-selected scenario is then moved to its closest selected scenario.
+#  - "moments": the scenarios of "kmedoids", with probabilities recomputed by non-negative least squares to match the mean and
+#    the second moment of the demand of every item (and sum 1).
+# The reduced instance is a view of the original one (Data.scenarios) with the selected rows of "demand" and the new "q".
+#
+# -- Functions --
+#  -reduce_scenarios(data_instance,K,method="kmedoids",item_weights=None,seed=None): reduced Data and the indexes of the
+#                                                                                    selected scenarios.
+#  -out_of_sample_evaluation(data_instance,reduced_instance,...): solve the reduced instance and evaluate its first stage on all
+#                                                                the scenarios of the original one (solvers.evaluation).
+#
+# ------------------------------------------------------------------------------------------------------------------------------------
+
+def _distances(demand,item_weights):
+    X=np.asarray(demand,dtype=float)*np.sqrt(item_weights)[None,:]
+    squared=np.sum(X**2,axis=1)
+    return np.sqrt(np.maximum(squared[:,None]+squared[None,:]-2*X@X.T,0))
+
+# Probability of every scenario moved to its closest selected scenario
+def _redistribute(distances,q,selected):
+    closest=np.asarray(selected)[np.argmin(distances[:,selected],axis=1)]
+    return np.bincount(closest,weights=q,minlength=len(q))[selected]
+
+def _kmedoids(distances,q,K,rng,max_iterations=100):
+    S=len(q)
+    # k-means++ initialisation
+    medoids=[int(rng.choice(S,p=q/q.sum()))]
+    for _ in range(1,K):
+        closest=np.min(distances[:,medoids],axis=1)**2*q
+        medoids.append(int(rng.choice(S,p=closest/closest.sum())) if closest.sum()>0 else int(np.setdiff1d(np.arange(S),medoids)[0]))
+    medoids=np.array(medoids)
+    for _ in range(max_iterations):
+        assignment=np.argmin(distances[:,medoids],axis=1)
+        new_medoids=medoids.copy()
+        for cluster in range(K):
+            members=np.flatnonzero(assignment==cluster)
+            if len(members)>0:
+                new_medoids[cluster]=members[np.argmin(distances[np.ix_(members,members)]@q[members])]
+        if np.array_equal(np.sort(new_medoids),np.sort(medoids)):
+            break
+        medoids=new_medoids
+    return np.sort(medoids)
+
+def _forward_selection(distances,q,K):
+    S=len(q)
+    selected=list()
+    remaining=np.ones(S,dtype=bool)
+    min_distances=np.full(S,np.inf)
+    for _ in range(K):
+        # Cost of adding each candidate: probability weighted distance of the non-selected scenarios from the selected ones
+        cost=np.where(remaining,q,0.0)@np.minimum(min_distances[:,None],distances)
+        cost[~remaining]=np.inf
+        best=int(np.argmin(cost))
+        selected.append(best)
+        remaining[best]=False
+        min_distances=np.minimum(min_distances,distances[:,best])
+    return np.sort(np.array(selected))
+
+# Probabilities of the selected scenarios matching the first two moments of the demand of every item
+def _moment_matching(demand,q,selected):
+    demand=np.asarray(demand,dtype=float)
+    reduced=demand[selected]
+    scale=np.maximum(np.abs(q@demand),1)
+    A=np.vstack([(reduced/scale).T,((reduced/scale)**2).T,100*np.ones((1,len(selected)))])
+    b=np.concatenate([q@(demand/scale),q@((demand/scale)**2),[100.0]])
+    weights,_=nnls(A,b)
+    # NNLS can return only zeros: the selected scenarios are then equiprobable
+    if weights.sum()<=0:
+        return np.ones(len(selected))/len(selected)
+    return weights/weights.sum()
+
+def reduce_scenarios(data_instance,K,method="kmedoids",item_weights=None,seed=None):
+    if method not in ("kmedoids","forward","moments"):
+        raise ValueError("Unknown method: "+str(method))
+    S=data_instance.S
+    q=np.asarray(data_instance.q,dtype=float)
+    if K>=S:
+        return copy.copy(data_instance),np.arange(S)
+    item_weights=np.ones(data_instance.N) if item_weights is None else np.asarray(item_weights,dtype=float)
+    distances=_distances(data_instance.demand,item_weights)
+    if method=="forward":
+        selected=_forward_selection(distances,q,K)
+        reduced_q=_redistribute(distances,q,selected)
+    else:
+        rng=seed if isinstance(seed,np.random.Generator) else np.random.default_rng(seed)
+        selected=_kmedoids(distances,q,K,rng)
+        reduced_q=_redistribute(distances,q,selected) if method=="kmedoids" else _moment_matching(data_instance.demand,q,selected)
+    return data_instance.scenarios(selected,q=reduced_q),selected
+
+# Quality of the reduced instance: its first stage (solved with solver_class) is evaluated with the integer second stage of every
+# scenario of the original instance. QualityLoss is relative to the full problem value when full_obj_value is given (e.g. from a
+# previous solve of the full instance).
+def out_of_sample_evaluation(data_instance,reduced_instance,solver_class=GurobiSolver,full_obj_value=None,workers=1,**solver_kwargs):
+    start=timer()
+    result=solver_class(reduced_instance,**solver_kwargs).solve()
+    solve_time=timer()-start
+    solution=result["Solution"]
+    start=timer()
+    value=StochasticEvaluator(data_instance,workers=workers).second_stage_obj_value(solution["a"],solution["a_b"],result["Printers"])
+    evaluation={
+        "S":data_instance.S,
+        "K":reduced_instance.S,
+        "InSampleObjValue":result["ObjValue"],
+        "OutOfSampleObjValue":round(value,2),
+        "Printers":result["Printers"],
+        "ReducedRuntime":solve_time,
+        "EvaluationTime":timer()-start,
+    }
+    if full_obj_value is not None:
+        evaluation["FullObjValue"]=full_obj_value
+        evaluation["QualityLoss"]=(full_obj_value-value)/max(abs(full_obj_value),1e-10)
+    return evaluation
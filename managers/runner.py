@@ -0,0 +1,134 @@
+import os
+import json
+import inspect
+from timeit import default_timer as timer
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from solvers.gurobi import GurobiSolver
+
+# ------------------------------------------------------- Runner module --------------------------------------------------------------
+#
+# This module runs batches of solver jobs in parallel on a single machine. A job is a couple (Data, solver kwargs): for each job a
+# solver of class "solver_class" is created with the given kwargs and the method "method" is called ("solve", or for example
+# "wait_and_see_obj_value" and "EEVS_obj_value" of GurobiSolver).
+#
+# -- Core budget --
+#   The "cores" available are split between the processes of the pool and the threads of the solver: "threads" is passed to the
+#   solvers whose constructor accepts it (not to DPSolver or HeuristicSolver, which use one core), and a job with a "workers"
+#   kwarg (processes or threads of ProgressiveHedgingSolver, BendersSolver, LagrangianBound) uses that many times more cores.
+#   The pool has cores//(cores of the largest job) processes. Many small MIPs scale better with threads=1.
+#
+# -- Output and resume --
+#   Every result is appended to "output_file" (one JSON object per line with "key" and "result") as soon as its job ends.
+#   When the file already exists, the jobs whose key is already in the file are skipped, so an interrupted sweep can be resumed
+#   by calling run_jobs again with the same jobs and keys. Jobs that raise an exception are written with an "error" field and
+#   are run again on resume.
+#
+# -- Functions --
+#  -run_jobs(jobs,output_file,...): run the jobs and return a dict {key: result} with all the results in output_file.
+#  -load_results(output_file): read the completed results from output_file as a dict {key: result}.
+#  -instance_set_jobs(instance_sets,...): build keys and jobs from the instance sets of the notebooks (list of dicts type->Data).
+#  -group_results(results,keys): group the results by instance type, in the same format returned by the notebooks' get_results.
+#
+# ------------------------------------------------------------------------------------------------------------------------------------
+
+def _accepts(solver_class,name):
+    parameters=inspect.signature(solver_class.__init__).parameters
+    return name in parameters or any(parameter.kind==inspect.Parameter.VAR_KEYWORD for parameter in parameters.values())
+
+# Cores used by a job: the threads of the solver times its workers
+def _job_cores(solver_class,solver_kwargs,threads):
+    cores=threads if _accepts(solver_class,"threads") else 1
+    return cores*max(1,int(solver_kwargs.get("workers") or 1))
+
+def _run_job(data_instance,solver_kwargs,solver_class,method,threads,keep_solution):
+    start=timer()
+    if _accepts(solver_class,"threads"):
+        solver_kwargs=dict(solver_kwargs,threads=threads)
+    solver=solver_class(data_instance,**solver_kwargs)
+    result=getattr(solver,method)()
+    end=timer()
+    if not isinstance(result,dict):
+        result={"ObjValue":float(result)}
+    elif not keep_solution:
+        result.pop("Solution",None)
+    result["TotalTime"]=end-start
+    return result
+
+# NumPy values (e.g. the arrays of a kept "Solution") are written as plain lists and numbers
+def _to_json(value):
+    if hasattr(value,"tolist"):
+        return value.tolist()
+    raise TypeError("Object of type "+type(value).__name__+" is not JSON serializable")
+
+def load_results(output_file):
+    results=dict()
+    if not os.path.isfile(output_file):
+        return results
+    with open(output_file) as f:
+        for line in f:
+            line=line.strip()
+            if len(line)==0:
+                continue
+            try:
+                record=json.loads(line)
+            except json.JSONDecodeError:
+                # Last line of a run that was killed while writing
+                continue
+            if "error" not in record:
+                results[record["key"]]=record["result"]
+    return results
+
+def run_jobs(jobs,output_file,keys=None,solver_class=GurobiSolver,method="solve",cores=None,threads=1,keep_solution=False,log=False):
+    keys=[str(indx) for indx in range(len(jobs))] if keys is None else [str(key) for key in keys]
+    if len(keys)!=len(jobs) or len(set(keys))!=len(keys):
+        raise ValueError("keys must be unique and one for each job")
+    results=load_results(output_file)
+    pending=[(key,job) for key,job in zip(keys,jobs) if key not in results]
+    cores=os.cpu_count() if cores is None else cores
+    job_cores=max([_job_cores(solver_class,solver_kwargs,threads) for _,(_,solver_kwargs) in pending],default=1)
+    workers=max(1,min(len(pending),cores//job_cores))
+    if log:
+        print("Jobs: "+str(len(jobs))+", already done: "+str(len(jobs)-len(pending))+", workers: "+str(workers)+", threads per worker: "+str(threads))
+    if len(pending)==0:
+        return results
+    with ProcessPoolExecutor(max_workers=workers) as pool, open(output_file,'a') as out:
+        futures={pool.submit(_run_job,data_instance,solver_kwargs,solver_class,method,threads,keep_solution):key for key,(data_instance,solver_kwargs) in pending}
+        for future in as_completed(futures):
+            key=futures[future]
+            try:
+                result=future.result()
+                record={"key":key,"result":result}
+                results[key]=result
+            except Exception as e:
+                record={"key":key,"error":repr(e)}
+            out.write(json.dumps(record,default=_to_json)+"\n")
+            out.flush()
+            if log:
+                print("Completed job "+key+(" (error: "+record["error"]+")" if "error" in record else ""))
+    return results
+
+def instance_set_jobs(instance_sets,instance_type=None,allow_for_printer=True,**solver_kwargs):
+    keys,jobs=list(),list()
+    for indx, inst_group in enumerate(instance_sets):
+        for instance in inst_group:
+            if instance_type is None or instance==instance_type:
+                data_instance=inst_group[instance]
+                if not allow_for_printer:
+                    # View with the greater w_p: the caller's object is not modified
+                    data_instance=_without_printers(data_instance)
+                keys.append(str(indx)+"/"+instance+("" if allow_for_printer else "/no_printers"))
+                jobs.append((data_instance,solver_kwargs))
+    return keys,jobs
+
+def _without_printers(data_instance):
+    return data_instance.with_params(w_p=data_instance.W+1)
+
+def group_results(results,keys):
+    grouped=dict()
+    for key in keys:
+        if key in results:
+            instance=key.split("/")[1]
+            if instance not in grouped:
+                grouped[instance]=list()
+            grouped[instance].append(results[key])
+    return grouped
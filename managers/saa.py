@@ -0,0 +1,122 @@
+import os
+import numpy as np
+from scipy.stats import t as student
+from timeit import default_timer as timer
+from concurrent.futures import ProcessPoolExecutor
+from solvers.gurobi import GurobiSolver
+from solvers.out_of_sample import OutOfSampleEvaluator, sample_demand
+
+# -------------------------------------------------- Sample Average Approximation ----------------------------------------------------
+#
+# This module estimates how far the first stage of an instance is from the optimum of the true stochastic problem, whose demand
+# distribution is the one of the instance generator (solvers.out_of_sample.sample_demand), and chooses the number of scenarios
+# needed for a given precision. For a number of scenarios N:
+#  - M independent samples of N scenarios (equiprobable) are drawn, and the M SAA instances (views of the base instance, Data.with_params,
+#    with the new "demand", "q" and "S") are solved with any Solver subclass that reports a MIPGap (a bound of its solve), in
+#    parallel with "workers" processes; a ValueError is raised for the outputs without it.
+#  - Upper bound (maximisation): the mean of the M optimal values, whose expected value is not lower than the true optimum, with
+#    a Student t confidence interval. The values of the solves that did not prove optimality are raised by their MIPGap.
+#  - Lower bound: the first stages of the M solves are compared on a selection sample ("selection_scenarios"); the best one is
+#    the candidate solution, evaluated on an independent large reference sample (OutOfSampleEvaluator, the same for every N):
+#    its mean value is the lower bound, with its confidence interval. Choosing the candidate on the reference sample itself
+#    would bias the lower bound upwards (the maximum of M estimates).
+#  - Gap: UpperBound-LowerBound; the conservative gap goes from the lower end of the lower bound interval to the upper end of the
+#    upper bound interval. RelativeGap is the conservative gap over the lower bound.
+# sample_average_approximation repeats this multiplying N by "growth" until the RelativeGap is at most "target_gap" (or N
+# exceeds max_scenarios).
+#
+# -- Functions --
+#  -saa_instance(data_instance,scenarios,seed=None,max_demand=None): view of the instance with a new sample of scenarios.
+#  -saa_replications(data_instance,scenarios,replications=10,...): bounds and gap for N=scenarios.
+#  -sample_average_approximation(data_instance,scenarios=50,replications=10,...): saa_replications for growing N; returns the
+#                                                                                 result of the last N and "History", the
+#                                                                                 results of all the N.
+#
+# ------------------------------------------------------------------------------------------------------------------------------------
+
+def saa_instance(data_instance,scenarios,seed=None,max_demand=None):
+    return data_instance.with_params(demand=sample_demand(data_instance,scenarios,seed,max_demand),q=np.ones(scenarios)/scenarios)
+
+def _solve_replication(job):
+    solver_class,data_instance,solver_kwargs=job
+    result=solver_class(data_instance,**solver_kwargs).solve()
+    if result.get("MIPGap") is None:
+        raise ValueError(solver_class.__name__+" did not report a MIPGap: the upper bound needs solvers that bound their solution (e.g. HeuristicSolver with lp_bound=True)")
+    solution=result["Solution"]
+    return {
+        "ObjValue":result["ObjValue"],
+        "Bound":result["ObjValue"]+result["MIPGap"]*abs(result["ObjValue"]),
+        "Solution":{"a":np.asarray(solution["a"]),"a_b":solution["a_b"],"y":np.asarray(solution["y"])},
+        "Printers":result["Printers"],
+        "Runtime":result["Runtime"],
+    }
+
+def _interval(values,confidence):
+    mean=float(np.mean(values))
+    if len(values)<2:
+        return mean,(mean,mean)
+    half_width=float(student.ppf(0.5+confidence/2,len(values)-1))*float(np.std(values,ddof=1))/np.sqrt(len(values))
+    return mean,(float(mean-half_width),float(mean+half_width))
+
+def saa_replications(data_instance,scenarios,replications=10,solver_class=GurobiSolver,evaluator=None,selection_evaluator=None,reference_scenarios=10000,selection_scenarios=2000,confidence=0.95,workers=1,seed=None,max_demand=None,**solver_kwargs):
+    start=timer()
+    rng=seed if isinstance(seed,np.random.Generator) else np.random.default_rng(seed)
+    if evaluator is None:
+        evaluator=OutOfSampleEvaluator(data_instance,reference_scenarios,rng,max_demand,confidence)
+    if selection_evaluator is None:
+        selection_evaluator=OutOfSampleEvaluator(data_instance,selection_scenarios,rng,max_demand,confidence)
+    jobs=[(solver_class,saa_instance(data_instance,scenarios,rng,max_demand),solver_kwargs) for _ in range(replications)]
+    if workers>1:
+        with ProcessPoolExecutor(max_workers=min(workers,os.cpu_count() or 1,replications)) as pool:
+            solves=list(pool.map(_solve_replication,jobs))
+    else:
+        solves=[_solve_replication(job) for job in jobs]
+    solve_time=timer()-start
+    upper_bound,upper_interval=_interval([solve["Bound"] for solve in solves],confidence)
+    # Every distinct first stage is compared once on the selection sample, only the best one is evaluated on the reference sample
+    candidates=dict()
+    for solve in solves:
+        key=(tuple(solve["Solution"]["a"]),solve["Solution"]["a_b"],solve["Printers"])
+        if key not in candidates:
+            candidates[key]=(float(np.mean(selection_evaluator.values(solve["Solution"]))),solve)
+    _,best=max(candidates.values(),key=lambda pair:pair[0])
+    evaluation=evaluator.evaluate(best["Solution"])
+    lower_bound,lower_interval=evaluation["Mean"],evaluation["ConfidenceInterval"]
+    gap=upper_interval[1]-lower_interval[0]
+    return {
+        "Scenarios":scenarios,
+        "Replications":replications,
+        "UpperBound":upper_bound,
+        "UpperBoundCI":upper_interval,
+        "LowerBound":lower_bound,
+        "LowerBoundCI":(float(lower_interval[0]),float(lower_interval[1])),
+        "Gap":upper_bound-lower_bound,
+        "ConservativeGap":float(gap),
+        "RelativeGap":float(gap/max(abs(lower_bound),1e-10)),
+        "Solution":best["Solution"],
+        "Printers":best["Printers"],
+        "Candidates":len(candidates),
+        "ReplicationValues":[solve["ObjValue"] for solve in solves],
+        "SolveTime":solve_time,
+        "Runtime":timer()-start,
+    }
+
+def sample_average_approximation(data_instance,scenarios=50,replications=10,solver_class=GurobiSolver,target_gap=0.01,growth=2,max_scenarios=1000,reference_scenarios=10000,selection_scenarios=2000,confidence=0.95,workers=1,seed=None,max_demand=None,log=False,**solver_kwargs):
+    start=timer()
+    rng=seed if isinstance(seed,np.random.Generator) else np.random.default_rng(seed)
+    evaluator=OutOfSampleEvaluator(data_instance,reference_scenarios,rng,max_demand,confidence)
+    selection_evaluator=OutOfSampleEvaluator(data_instance,selection_scenarios,rng,max_demand,confidence)
+    history=list()
+    while True:
+        result=saa_replications(data_instance,scenarios,replications,solver_class,evaluator,selection_evaluator,confidence=confidence,workers=workers,seed=rng,max_demand=max_demand,**solver_kwargs)
+        history.append(result)
+        if log:
+            print("N="+str(scenarios)+": upper bound "+str(round(result["UpperBound"],2))+", lower bound "+str(round(result["LowerBound"],2))+", relative gap "+str(round(result["RelativeGap"],4)))
+        scenarios=int(np.ceil(scenarios*growth))
+        if result["RelativeGap"]<=target_gap or scenarios>max_scenarios:
+            break
+    result=dict(result)
+    result["Converged"]=result["RelativeGap"]<=target_gap
+    result["History"]=history
+    result["Runtime"]=timer()-start
+    return result
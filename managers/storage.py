@@ -0,0 +1,176 @@
+import os
+import json
+import pickle
+import numpy as np
+from managers.data import Data
+
+# ------------------------------------------------------- Storage module -------------------------------------------------------------
+#
+# This module stores sets of Data instances in a columnar binary format, instead of a single pickle or a JSON list of
+# get_instance_as_dict():
+#   <path>/index.json     : one record per instance with its key, its metadata (e.g. "type"), the scalar parameters (N, D, S, T,
+#                           W, V, ...), the offsets of its rows in every column and the original dtype of every array.
+#   <path>/<column>.npy   : the arrays of all the instances concatenated: w, r, v, t, m (N values per instance), N_p, q (S values)
+#                           and demand (S*N values, row major). Every column is saved with the smallest dtype that holds all
+#                           its values (e.g. int16 for the demand), the original dtype is restored when an instance is loaded.
+# The columns are opened with np.load(mmap_mode='r') only when an instance is requested, so loading a single instance (or all the
+# instances of one type) reads only its rows from disk. Instances are rebuilt with Data.from_dict, without the generator.
+#
+# -- Classes --
+#  -InstanceStore(path): read access to a stored set: keys(), select(**metadata), load(key), instance_sets().
+#
+# -- Functions --
+#  -save_instances(path,instances,keys=None,metadata=None): save a list of Data instances.
+#  -save_instance_sets(path,instance_sets): save the instance sets of the notebooks (list of dicts type->Data, as
+#                                           dataset/dataset_paper_analysis, or dict type->list of lists of Data, as
+#                                           dataset/dataset_scalability_analysis).
+#  -convert_pickle(pickle_file,path): convert one of the pickled datasets.
+#  -convert_json(json_file,path): convert a JSON file written by 3_datasets_migration.ipynb.
+#
+# ------------------------------------------------------------------------------------------------------------------------------------
+
+SCALARS=("N","D","S","data_range_R","w_p","v_p","alpha","w_b","v_b","T","W","V")
+ITEM_COLUMNS=("w","r","v","t","m")
+COLUMNS=ITEM_COLUMNS+("N_p","q","demand")
+
+def _scalar(value):
+    return value.item() if hasattr(value,"item") else value
+
+# Smallest dtype holding all the values: float64 if any value is not integer, otherwise the smallest signed integer type
+def _compact_dtype(values):
+    if values.size==0:
+        return np.dtype(np.int8)
+    if not np.issubdtype(values.dtype,np.integer):
+        if np.all(np.isfinite(values)) and np.all(values==np.round(values)) and np.abs(values).max()<2**62:
+            values=values.astype(np.int64)
+        else:
+            return np.dtype(np.float64)
+    low,high=values.min(),values.max()
+    for dtype in (np.int8,np.int16,np.int32):
+        if np.iinfo(dtype).min<=low and high<=np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+def save_instances(path,instances,keys=None,metadata=None):
+    keys=[str(indx) for indx in range(len(instances))] if keys is None else [str(key) for key in keys]
+    metadata=[dict() for _ in instances] if metadata is None else metadata
+    if len(keys)!=len(instances) or len(set(keys))!=len(keys) or len(metadata)!=len(instances):
+        raise ValueError("keys must be unique and, as metadata, one for each instance")
+    os.makedirs(path,exist_ok=True)
+    columns={column:list() for column in COLUMNS}
+    offsets={"items":0,"N_p":0,"scenarios":0,"demand":0}
+    records=list()
+    for key,data,meta in zip(keys,instances,metadata):
+        arrays={column:np.asarray(getattr(data,column)) for column in ITEM_COLUMNS+("q","demand")}
+        arrays["N_p"]=np.asarray(data.N_p,dtype=np.int64)
+        record={"key":key,"metadata":{name:_scalar(value) for name,value in meta.items()}}
+        record.update({name:_scalar(getattr(data,name)) for name in SCALARS})
+        record["offsets"]=dict(offsets)
+        record["lengths"]={"N_p":len(arrays["N_p"]),"demand_shape":list(arrays["demand"].shape)}
+        record["dtypes"]={column:arrays[column].dtype.str for column in COLUMNS}
+        records.append(record)
+        for column in COLUMNS:
+            columns[column].append(arrays[column].ravel())
+        offsets["items"]+=int(data.N)
+        offsets["N_p"]+=len(arrays["N_p"])
+        offsets["scenarios"]+=len(arrays["q"])
+        offsets["demand"]+=arrays["demand"].size
+    for column in COLUMNS:
+        values=np.concatenate(columns[column]) if len(columns[column])>0 else np.zeros(0)
+        np.save(os.path.join(path,column+".npy"),values.astype(_compact_dtype(values)))
+    with open(os.path.join(path,"index.json"),"w") as f:
+        json.dump({"version":1,"instances":records},f)
+    return InstanceStore(path)
+
+def save_instance_sets(path,instance_sets):
+    keys,instances,metadata=list(),list(),list()
+    if isinstance(instance_sets,dict):
+        # dataset_scalability_analysis: type -> list (one for each size) of lists of instances
+        for instance_type,groups in instance_sets.items():
+            for group,group_instances in enumerate(groups):
+                for indx,data in enumerate(group_instances):
+                    keys.append(str(instance_type)+"/"+str(group)+"/"+str(indx))
+                    instances.append(data)
+                    metadata.append({"type":instance_type,"group":group,"index":indx})
+    else:
+        # dataset_paper_analysis: list of dicts type -> instance, keys as managers.runner.instance_set_jobs
+        for indx,instance_set in enumerate(instance_sets):
+            for instance_type,data in instance_set.items():
+                keys.append(str(indx)+"/"+instance_type)
+                instances.append(data)
+                metadata.append({"type":instance_type,"set":indx})
+    return save_instances(path,instances,keys,metadata)
+
+def convert_pickle(pickle_file,path):
+    with open(pickle_file,"rb") as f:
+        instance_sets=pickle.load(f)
+    return save_instance_sets(path,instance_sets)
+
+def convert_json(json_file,path):
+    with open(json_file) as f:
+        records=json.load(f)
+    keys,instances,metadata=list(),list(),list()
+    for indx,record in enumerate(records):
+        meta={name:value for name,value in record.items() if name!="instance"}
+        keys.append(str(indx)+"/"+str(record.get("type","")))
+        instances.append(Data.from_dict(record["instance"]))
+        metadata.append(meta)
+    return save_instances(path,instances,keys,metadata)
+
+class InstanceStore:
+
+    def __init__(self,path):
+        self.path=path
+        with open(os.path.join(path,"index.json")) as f:
+            self.index=json.load(f)
+        self.records={record["key"]:record for record in self.index["instances"]}
+        self._columns=dict()
+
+    def __len__(self):
+        return len(self.records)
+
+    def keys(self):
+        return list(self.records.keys())
+
+    def metadata(self,key):
+        return self.records[key]["metadata"]
+
+    # Keys of the instances whose metadata (or scalar parameters) match all the given values, e.g. select(type="Uncorrelated")
+    def select(self,**conditions):
+        return [key for key,record in self.records.items() if all(record["metadata"].get(name,record.get(name))==value for name,value in conditions.items())]
+
+    def _column(self,column):
+        if column not in self._columns:
+            self._columns[column]=np.load(os.path.join(self.path,column+".npy"),mmap_mode="r")
+        return self._columns[column]
+
+    def load(self,key):
+        record=self.records[key]
+        offsets,dtypes=record["offsets"],record["dtypes"]
+        N=record["N"]
+        instance={name:record[name] for name in SCALARS}
+        for column in ITEM_COLUMNS:
+            instance[column]=self._column(column)[offsets["items"]:offsets["items"]+N]
+        instance["N_p"]=self._column("N_p")[offsets["N_p"]:offsets["N_p"]+record["lengths"]["N_p"]]
+        shape=record["lengths"]["demand_shape"]
+        instance["q"]=self._column("q")[offsets["scenarios"]:offsets["scenarios"]+shape[0]]
+        instance["demand"]=self._column("demand")[offsets["demand"]:offsets["demand"]+shape[0]*shape[1]].reshape(shape)
+        # Restore the original dtypes: only the rows of this instance are read from the memory maps
+        for column in ITEM_COLUMNS+("q","demand"):
+            instance[column]=instance[column].astype(np.dtype(dtypes[column]),copy=False)
+        return Data.from_dict(instance)
+
+    def __getitem__(self,key):
+        return self.load(key)
+
+    def load_many(self,keys):
+        return [self.load(key) for key in keys]
+
+    # Instances grouped as the notebooks' instance sets: list of dicts type->Data, one for each "set" of the metadata
+    def instance_sets(self,keys=None):
+        keys=self.keys() if keys is None else keys
+        sets=dict()
+        for key in keys:
+            meta=self.records[key]["metadata"]
+            sets.setdefault(meta.get("set",0),dict())[meta.get("type",key)]=self.load(key)
+        return [sets[indx] for indx in sorted(sets)]
@@ -0,0 +1,113 @@
+import os
+import sys
+import itertools
+import functools
+import numpy as np
+from timeit import default_timer as timer
+from concurrent.futures import ProcessPoolExecutor
+from solvers.solver import Solver
+from solvers.gurobi import GurobiSolver
+
+# ------------------------------------------------------- Sweep module ---------------------------------------------------------------
+#
+# This module runs the parameter sweeps of section 5 of the paper (alpha, k, l, m factors) building one GurobiSolver for each
+# instance and changing its coefficients with GurobiSolver.update_parameters, instead of deep-copying the instance sets and
+# building a new model for every value. The model is built once with the greatest printers upperbound needed by the settings, so
+# that every setting can be applied to it, and each solve starts from the solution of the previous one.
+#
+# -- Settings --
+#   A setting is a dict of parameters for update_parameters (e.g. {"alpha":0.5}) or a function that returns it from the Data
+#   instance, as the factors of the paper:
+#     - k_factor(k): w_p=round(W/k), v_p=round(V/k) (w_p=v_p=0 for k=sys.maxsize).
+#     - l_factor(l): v=w, m=round(l*w), w_b=v_b=1.
+#     - m_factor(m): T=int(m*sum_s q[s]*sum_{i in N_p} t[i]*demand[s,i]).
+#   parameter_grid(**values) returns the settings of all the combinations of the given values, e.g.
+#   parameter_grid(alpha=[0.5,1],w_b=[1,2]).
+#
+# -- Functions --
+#  -run_sweep(data_instance,settings,...): results of the settings on one instance, in the order of the settings. The
+#                                          TotalTime of the first result includes the time to build the model.
+#  -sweep_instance_sets(instance_sets,settings,...): run_sweep on the instances of the notebooks' instance sets (in parallel
+#                                                   with "workers" processes); returns one dict type->list of results for each
+#                                                   setting, in the same format of the notebooks' get_results.
+#
+# ------------------------------------------------------------------------------------------------------------------------------------
+
+# The factors are partial functions (not lambdas) so that the settings can be sent to the worker processes
+def _k_parameters(k,data):
+    return {"w_p":round(data.W/k) if k!=sys.maxsize else 0,"v_p":round(data.V/k) if k!=sys.maxsize else 0}
+
+def _l_parameters(l,data):
+    return {"v":data.w,"m":np.round(l*np.asarray(data.w)),"w_b":1,"v_b":1}
+
+def _m_parameters(m,data):
+    printable=np.asarray(data.N_p,dtype=int)
+    return {"T":int(m*np.sum(np.asarray(data.q)*(np.asarray(data.demand)[:,printable]@np.asarray(data.t)[printable])))}
+
+def k_factor(k):
+    return functools.partial(_k_parameters,k)
+
+def l_factor(l):
+    return functools.partial(_l_parameters,l)
+
+def m_factor(m):
+    return functools.partial(_m_parameters,m)
+
+def parameter_grid(**values):
+    names=list(values)
+    return [dict(zip(names,combination)) for combination in itertools.product(*[values[name] for name in names])]
+
+# Parameters of every setting for the instance. Every setting is applied to the original instance, so the parameters changed by
+# any setting are reset to their original value when a setting does not change them. Without printers, w_p is set after the
+# setting (as force_no_printer_solutions).
+def _parameters(data_instance,settings,allow_for_printer):
+    parameters=[dict(setting(data_instance) if callable(setting) else setting) for setting in settings]
+    names=set(name for setting in parameters for name in setting)|({"w_p"} if not allow_for_printer else set())
+    for indx,setting in enumerate(parameters):
+        parameters[indx]=dict({name:getattr(data_instance,name) for name in names},**setting)
+        if not allow_for_printer:
+            parameters[indx]["w_p"]=parameters[indx]["W"]+1 if "W" in setting else data_instance.W+1
+    return parameters
+
+def run_sweep(data_instance,settings,allow_for_printer=True,MIPGap=None,max_time=None,builder="matrix",threads=None,keep_solution=False):
+    parameters=_parameters(data_instance,settings,allow_for_printer)
+    # Upperbound valid for every setting
+    printers_upperbound=1
+    for setting in parameters:
+        printers_upperbound=max(printers_upperbound,Solver.smart_upperbound(data_instance.with_params(**setting)))
+    start=timer()
+    solver=GurobiSolver(data_instance,MIPGap=MIPGap,max_time=max_time,printers_upperbound=printers_upperbound,builder=builder,threads=threads,second_stage_solution=keep_solution)
+    build_time=timer()-start
+    results=list()
+    for setting in parameters:
+        start=timer()
+        solver.update_parameters(**setting)
+        result=solver.solve()
+        result["TotalTime"]=timer()-start
+        if not keep_solution:
+            del result["Solution"]
+        results.append(result)
+    results[0]["TotalTime"]+=build_time
+    return results
+
+def _run_sweep_job(job):
+    data_instance,settings,kwargs=job
+    return run_sweep(data_instance,settings,**kwargs)
+
+def sweep_instance_sets(instance_sets,settings,instance_type=None,workers=1,**kwargs):
+    jobs,types=list(),list()
+    for inst_group in instance_sets:
+        for instance in inst_group:
+            if instance_type is None or instance==instance_type:
+                jobs.append((inst_group[instance],settings,kwargs))
+                types.append(instance)
+    if workers>1:
+        with ProcessPoolExecutor(max_workers=min(workers,os.cpu_count() or 1,max(1,len(jobs)))) as pool:
+            sweeps=list(pool.map(_run_sweep_job,jobs))
+    else:
+        sweeps=[_run_sweep_job(job) for job in jobs]
+    results=[dict() for _ in settings]
+    for instance,sweep in zip(types,sweeps):
+        for indx,result in enumerate(sweep):
+            results[indx].setdefault(instance,list()).append(result)
+    return results
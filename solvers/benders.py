@@ -0,0 +1,234 @@
+import numpy as np
+import scipy.sparse as sp
+import gurobipy as gb
+from timeit import default_timer as timer
+from concurrent.futures import ThreadPoolExecutor
+from solvers.solver import Solver
+from solvers.gurobi import STATUS
+from solvers.evaluation import StochasticEvaluator
+
+# ------------------------------------------------------- Benders solver -------------------------------------------------------------
+#
+# This class solves the TSS-3DKP with an L-shaped (Benders) decomposition instead of the deterministic equivalent, so that its
+# size does not grow with S x printers_upperbound x |N_p|:
+#  - Master problem: first stage variables a, a_b, y, Constraints (12), (13), (14), (20), and one variable theta[s] for each
+#    scenario that overestimates its second stage value. Objective: max sum_s q[s]*theta[s].
+#  - Subproblems: LP relaxation of the second stage of each scenario. a, a_b and y only appear in the right hand side of
+#    Constraints (17), (18) and (19), so the duals of an optimal LP give the optimality cut
+#        theta[s] <= pi_d*demand[s] + pi_17*a + pi_18*a_b + T*pi_19*y
+#    that is valid for every first stage (multi-cut L-shaped method).
+#  - The cuts are added as lazy constraints by a callback every time Gurobi finds an integer master solution, after solving all
+#    the scenario LPs in parallel ("workers" threads, each with its own Gurobi environment and models).
+# Since the cuts come from the LP relaxation of the second stage, the master bound is an upper bound of the TSS-3DKP. The first
+# stage found by the master is then evaluated with the integer second stage of every scenario (solvers.evaluation), which gives
+# the reported ObjValue and the "p"/"a_s" of the solution; MIPGap is the gap between the two. The status is OPTIMAL only if this
+# gap is within the MIPGap of the master (default 1e-4), SUBOPTIMAL if the master was solved but the gap is greater, otherwise
+# the status of the master (e.g. TIME_LIMIT).
+#
+# -- Parent Class --
+#   The class BendersSolver inherit some methods from the abstract class "Solver" (solvers.solver.Solver)
+#
+# -- Methods --
+#  -solve(): solve the problem and retrieve a dict with the same keys of GurobiSolver.solve(). "Cuts" is the number of optimality
+#            cuts added, "Nodes" the nodes of the master problem. When the master has no incumbent (e.g. at the time limit), only
+#            the status is reported: ObjValue, MIPGap, Solution and Printers are None.
+#  -print_solution(): print the solution found. Must be called after solve() method.
+#
+# ------------------------------------------------------------------------------------------------------------------------------------
+
+# LP relaxation of the second stage of a scenario, with all the printers of the upperbound. The first stage enters only the
+# right hand sides, which are changed before each solve.
+class _RecourseLP:
+
+    def __init__(self,data,printers_upperbound,env):
+        N,N_p,U=data.N,len(data.N_p),printers_upperbound
+        mask,position=data.get_printable_index()
+        printable=np.asarray(data.N_p,dtype=int)
+        model=gb.Model(env=env)
+        model.addMVar((U,N_p),name="p")
+        model.addMVar(N,name="a_s")
+        P=np.arange(U*N_p).reshape(U,N_p)
+        a_s=U*N_p+np.arange(N)
+        size=U*N_p+N
+        #Constraint (15) and Constraint (16)
+        p_rows=np.broadcast_to(np.flatnonzero(mask)[None,:],(U,N_p))
+        A=sp.csr_matrix((np.ones(N+U*N_p),(np.concatenate([np.arange(N),p_rows.ravel()]),np.concatenate([a_s,P[:,position[mask]].ravel()]))),shape=(N,size))
+        self.demand=model.addMConstr(A,None,gb.GRB.LESS_EQUAL,np.zeros(N))
+        #Constraint (17)
+        A=sp.csr_matrix((np.ones(N),(np.arange(N),a_s)),shape=(N,size))
+        self.items=model.addMConstr(A,None,gb.GRB.LESS_EQUAL,np.zeros(N))
+        #Constraint (18)
+        A=sp.csr_matrix((np.tile(np.asarray(data.m,dtype=float)[printable],U),(np.zeros(U*N_p,dtype=int),P.ravel())),shape=(1,size))
+        self.material=model.addMConstr(A,None,gb.GRB.LESS_EQUAL,np.zeros(1))
+        #Constraint (19)
+        A=sp.csr_matrix((np.tile(np.asarray(data.t,dtype=float)[printable],U),(np.repeat(np.arange(U),N_p),P.ravel())),shape=(U,size))
+        self.time=model.addMConstr(A,None,gb.GRB.LESS_EQUAL,np.zeros(U))
+        r=np.asarray(data.r,dtype=float)
+        model.setMObjective(None,np.concatenate([np.tile(data.alpha*r[printable],U),r]),0.0,sense=gb.GRB.MAXIMIZE)
+        self.model=model
+        self.T=float(data.T)
+
+    # Value of the LP and coefficients of the cut: constant, a, a_b, y
+    def solve(self,demand,a,a_b,y):
+        self.demand.RHS=demand
+        self.items.RHS=a
+        self.material.RHS=np.array([a_b])
+        self.time.RHS=self.T*y
+        self.model.optimize()
+        pi_d,pi_17,pi_18,pi_19=self.demand.Pi,self.items.Pi,self.material.Pi,self.time.Pi
+        return float(self.model.ObjVal),float(np.dot(pi_d,demand)),pi_17,float(pi_18[0]),self.T*pi_19
+
+# Scenario LPs split in chunks, each chunk with its own environment so that the chunks can be solved by parallel threads
+class _RecourseLPs:
+
+    def __init__(self,data,printers_upperbound,workers):
+        self.data=data
+        self.chunks=[chunk for chunk in np.array_split(np.arange(data.S),max(1,workers)) if len(chunk)>0]
+        self.envs,self.models=list(),list()
+        for _ in self.chunks:
+            env=gb.Env(empty=True)
+            env.setParam('OutputFlag',0)
+            env.setParam('Threads',1)
+            env.start()
+            self.envs.append(env)
+            self.models.append(_RecourseLP(data,printers_upperbound,env))
+        self.pool=ThreadPoolExecutor(max_workers=len(self.chunks)) if len(self.chunks)>1 else None
+
+    def _solve_chunk(self,indx,a,a_b,y):
+        return [(scenario,)+self.models[indx].solve(np.asarray(self.data.demand[scenario],dtype=float),a,a_b,y) for scenario in self.chunks[indx]]
+
+    def solve(self,a,a_b,y):
+        if self.pool is None:
+            return self._solve_chunk(0,a,a_b,y)
+        return [cut for cuts in self.pool.map(lambda indx: self._solve_chunk(indx,a,a_b,y),range(len(self.chunks))) for cut in cuts]
+
+    def dispose(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+        for model,env in zip(self.models,self.envs):
+            model.model.dispose()
+            env.dispose()
+
+class BendersSolver(Solver):
+
+    def __init__(self,data_instance,max_time=None,log=False,MIPGap=None,printers_upperbound=None,workers=1,threads=None):
+        Solver.__init__(self,data_instance,printers_upperbound)
+        self.M=int(min(data_instance.W/data_instance.w_b,data_instance.V/data_instance.v_b)+2)
+        self.workers=workers
+        self.threads=threads
+        self.tolerance=1e-4 if MIPGap is None else MIPGap
+        self.output=None
+        self._model_generator()
+        if log:
+            _=self.model.setParam('OutputFlag',1)
+        if max_time is not None:
+            _=self.model.setParam('TimeLimit',max_time)
+        if MIPGap is not None:
+            _=self.model.setParam('MIPGap',MIPGap)
+        if threads is not None:
+            _=self.model.setParam('Threads',threads)
+
+    def _model_generator(self):
+        master=gb.Model()
+        master.setParam('OutputFlag',0)
+        master.setParam('LazyConstraints',1)
+        master.modelSense=gb.GRB.MAXIMIZE
+        data=self.data_instance
+        U=self.printers_upperbound
+        demand=np.asarray(data.demand)
+        r=np.asarray(data.r,dtype=float)
+        #Variables definition 1 stage + Constraint (22)+ Constraint (23). Carrying more than the maximum demand is useless.
+        A=master.addVars(data.N,vtype=gb.GRB.INTEGER,ub=demand.max(axis=0).tolist(),name='a')
+        a_b=master.addVar(vtype=gb.GRB.INTEGER,name="a_b")
+        y=master.addVars(U,vtype=gb.GRB.BINARY,name="y")
+        #Second stage value of each scenario, bounded by the value of its whole demand
+        theta=master.addVars(data.S,ub=(demand@(max(1,data.alpha)*r)).tolist(),name="theta")
+        #Constraint (12)
+        master.addConstr(gb.quicksum([A[i]*data.w[i] for i in range(data.N)])+a_b*data.w_b+gb.quicksum([y[i]*data.w_p for i in range(U)])<=data.W)
+        #Constraint (13)
+        master.addConstr(gb.quicksum([A[i]*data.v[i] for i in range(data.N)])+a_b*data.v_b+gb.quicksum([y[i]*data.v_p for i in range(U)])<=data.V)
+        #Constraint (14)
+        master.addConstr(a_b<=gb.quicksum([y[j]*self.M for j in range(U)]))
+        #Constraint (20)
+        for printer in range(U-1):
+            master.addConstr(y[printer+1]<=y[printer])
+        master.setObjective(gb.quicksum([data.q[s]*theta[s] for s in range(data.S)]))
+        self.model=master
+        self._a,self._a_b,self._y,self._theta=[A[i] for i in range(data.N)],a_b,[y[p] for p in range(U)],[theta[s] for s in range(data.S)]
+
+    def solve(self):
+        start=timer()
+        self.model._solver=self
+        self.model._cut_count=0
+        self._subproblems=_RecourseLPs(self.data_instance,self.printers_upperbound,self.workers)
+        try:
+            _=self.model.optimize(BendersSolver.__benders_callback)
+        finally:
+            self._subproblems.dispose()
+        self.runtime=timer()-start
+        if self.model.SolCount==0:
+            return self._status_output()
+        data=self.data_instance
+        a=np.rint(self.model.getAttr("X",self._a)).astype(int)
+        a_b=int(round(self._a_b.X))
+        y=np.rint(self.model.getAttr("X",self._y)).astype(int)
+        # Integer second stage of every scenario for the first stage of the master
+        values,p,a_s=StochasticEvaluator(data,workers=self.workers,threads=1).second_stage_solutions(a,a_b,int(y.sum()))
+        P=np.zeros((data.S,self.printers_upperbound,len(data.N_p)),dtype=int)
+        P[:,:p.shape[1],:]=p
+        self.solution={"a":a,"a_b":a_b,"p":P,"a_s":a_s.astype(int),"y":y}
+        self.obj_value=float(np.dot(values,data.q))
+        self.runtime=timer()-start
+        return self._get_output()
+
+    # No first stage was found (e.g. time limit before the first incumbent): only the status of the master
+    def _status_output(self):
+        status=int(self.model.status)
+        return {
+            "StatusCode":status,
+            "Status":STATUS[status],
+            "ObjValue":None,
+            "Solutions":0,
+            "Nodes":int(self.model.NodeCount),
+            "Cuts":int(self.model._cut_count),
+            "Runtime":round(self.runtime,2),
+            "MIPGap":None,
+            "Solution":None,
+            "Printers":None
+        }
+
+    def _get_output(self):
+        bound=float(self.model.ObjBound)
+        gap=max(0.0,bound-self.obj_value)/max(abs(self.obj_value),1e-10)
+        status=int(self.model.status)
+        # The master is optimal for the LP recourse: the first stage is proven optimal only if the integer recourse closes the gap
+        if status==2 and gap>self.tolerance:
+            status=13
+        output = {
+            "StatusCode":status,
+            "Status":STATUS[status],
+            "ObjValue":round(self.obj_value,2),
+            "Solutions":int(self.model.SolCount),
+            "Nodes":int(self.model.NodeCount),
+            "Cuts":int(self.model._cut_count),
+            "Runtime":round(self.runtime,2),
+            "MIPGap": float('{:0.2e}'.format(gap)),
+            "Solution": self.solution,
+            "Printers": int(self.solution["y"].sum())
+        }
+        return output
+
+    # Lazy constraint callback: for an integer master solution, add the optimality cut of each scenario whose theta[s] is
+    # above the value of its second stage LP
+    def __benders_callback(model, where):
+        if where != gb.GRB.Callback.MIPSOL:
+            return
+        solver=model._solver
+        a=np.array(model.cbGetSolution(solver._a))
+        a_b=model.cbGetSolution(solver._a_b)
+        y=np.array(model.cbGetSolution(solver._y))
+        theta=model.cbGetSolution(solver._theta)
+        for scenario,value,constant,coef_a,coef_a_b,coef_y in solver._subproblems.solve(a,a_b,y):
+            if theta[scenario]>value+1e-6*max(1.0,abs(value)):
+                model.cbLazy(solver._theta[scenario]<=constant+gb.LinExpr(coef_a.tolist()+[coef_a_b]+coef_y.tolist(),solver._a+[solver._a_b]+solver._y))
+                model._cut_count+=1
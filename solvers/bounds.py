@@ -0,0 +1,233 @@
+import numpy as np
+import gurobipy as gb
+from timeit import default_timer as timer
+from concurrent.futures import ThreadPoolExecutor
+from solvers.solver import Solver
+from solvers.formulation import constraint_blocks, objective_vector, variable_layout
+from solvers.heuristic import HeuristicSolver, lp_relaxation_bound
+from solvers.evaluation import StochasticEvaluator, _single_scenario
+
+# --------------------------------------------------------- Bounds module ------------------------------------------------------------
+#
+# This module computes upper bounds of a TSS-3DKP instance without solving the deterministic equivalent, e.g. to sort the instances
+# before a long MIP run, to set the Cutoff parameter of the MIP (model.setParam('Cutoff',ObjValue) discards the nodes below a known
+# feasible value) or to report the gap of an instance that reached the time limit.
+#  - LP bound: LP relaxation of the deterministic equivalent (solvers.heuristic.lp_relaxation_bound, scipy/HiGHS).
+#  - Lagrangian bound: every scenario s gets its own copy (a^s, a_b^s, y^s) of the first stage and the nonanticipativity
+#    constraints x^s=x (x=(a,a_b,y)) are relaxed with multipliers lambda[s], with sum_s q[s]*lambda[s]=0 so that x drops out:
+#        L(lambda)=sum_s q[s]*max{ f_s(x^s)-lambda[s]*x^s : x^s feasible for the single-scenario TSS-3DKP }>=RP.
+#    The S integer subproblems are the single-scenario model (constraints (12)-(20), with the printers upperbound of the whole
+#    instance) built once for each chunk of scenarios: only the demand rows and the objective of a, a_b and y change. The chunks
+#    are solved by parallel threads, each with its own Gurobi environment (as solvers.benders). With a MIPGap>0 the bound of each
+#    subproblem is its ObjBound, so L(lambda) is always valid.
+#    The multipliers follow a projected subgradient method with Polyak steps: lambda[s]+=step*(x^s-x_mean)*(L-LB)/||x-x_mean||^2
+#    (norm weighted by q), where x_mean=sum_s q[s]*x^s and LB is the best feasible value; "step" is halved after "patience"
+#    iterations without improvement of the bound. When all the scenarios agree on x the bound is attained and x is optimal.
+#  - Feasible first stage: floor(x_mean) (with a_b=0 if no printer is left) is feasible for constraints (12)-(14) and (20), since
+#    every x^s is; the x^s closest to x_mean is feasible as well. Each new candidate is evaluated with the integer second stage of every scenario (solvers.evaluation); the
+#    solution of HeuristicSolver is the first candidate.
+#
+# -- Classes --
+#  -LagrangianBound(data_instance,...): solve() runs the subgradient method and returns a dict with LagrangianBound, ObjValue (value
+#                                       of the best first stage found), MIPGap between the two, the first stage Solution (a, a_b, y),
+#                                       Printers, Iterations, Runtime and the Multipliers (a[s,i], a_b[s], y[s,p]).
+#
+# -- Functions --
+#  -lp_bound(data_instance,printers_upperbound=None): value of the LP relaxation of the deterministic equivalent.
+#  -instance_bounds(data_instance,lagrangian=True,**kwargs): LPBound, LagrangianBound, the best Bound, ObjValue, MIPGap and Solution
+#                                                           of an instance (kwargs are passed to LagrangianBound).
+#  -feasible_first_stage(data_instance,x_mean): a, a_b, y of floor(x_mean), for a mean of feasible first stages.
+#  -first_stage_feasible(data_instance,x): True if the integer first stage x=(a, a_b, y) satisfies (12)-(14) and (20).
+#  -optimality_gap(obj_value,bound): relative gap of a solution value (e.g. the ObjValue of a solve that timed out) from a bound.
+#
+# ------------------------------------------------------------------------------------------------------------------------------------
+
+def _big_M(data_instance):
+    return int(min(data_instance.W/data_instance.w_b,data_instance.V/data_instance.v_b)+2)
+
+# Feasible first stage (a, a_b, y) from a q-weighted mean of first stages (a, a_b, y) that are feasible for (12)-(14) and (20)
+def feasible_first_stage(data_instance,x_mean):
+    N=data_instance.N
+    x=np.floor(np.asarray(x_mean)+1e-9).astype(int)
+    a,a_b,y=x[:N],int(x[N]),x[N+1:]
+    return a,(a_b if y.sum()>0 else 0),y
+
+def first_stage_feasible(data_instance,x):
+    N=data_instance.N
+    x=np.asarray(x)
+    a,a_b,y=x[:N],x[N],x[N+1:]
+    printers=y.sum()
+    return bool(np.all(x>=0) and np.all(y<=1) and np.all(y[1:]<=y[:-1]) and (a_b==0 or printers>0)
+                and np.dot(data_instance.w,a)+data_instance.w_b*a_b+data_instance.w_p*printers<=data_instance.W
+                and np.dot(data_instance.v,a)+data_instance.v_b*a_b+data_instance.v_p*printers<=data_instance.V)
+
+def lp_bound(data_instance,printers_upperbound=None):
+    printers_upperbound=Solver.smart_upperbound(data_instance) if printers_upperbound is None else printers_upperbound
+    return lp_relaxation_bound(data_instance,printers_upperbound,_big_M(data_instance))
+
+def optimality_gap(obj_value,bound):
+    return max(0.0,bound-obj_value)/max(abs(obj_value),1e-10)
+
+# Single-scenario TSS-3DKP with the first stage in the objective: max f_s(x)-lambda*x. Columns in the order of
+# solvers.formulation.variable_layout for one scenario.
+class _ScenarioSubproblem:
+
+    def __init__(self,data,printers_upperbound,M,MIPGap,env):
+        U=printers_upperbound
+        layout=variable_layout(data,U)
+        model=gb.Model(env=env)
+        if MIPGap is not None:
+            model.setParam('MIPGap',MIPGap)
+        variables=model.addMVar(layout["size"],ub=np.concatenate([np.full(layout["y"],gb.GRB.INFINITY),np.ones(U)]),vtype=gb.GRB.INTEGER,name="x")
+        blocks=constraint_blocks(data,U,M)
+        self.rows=dict()
+        for name,A,b in blocks:
+            self.rows[name]=model.addMConstr(A,None,gb.GRB.LESS_EQUAL,b)
+        self.c=objective_vector(data,U)
+        model.setMObjective(None,self.c,0.0,sense=gb.GRB.MAXIMIZE)
+        model.update()
+        self.variables=variables
+        # Columns of the first stage: a, a_b, y
+        self.first_stage=np.concatenate([np.arange(layout["a"],layout["p"]),np.arange(layout["y"],layout["size"])])
+        self.model=model
+
+    # Bound of the subproblem and its first stage
+    def solve(self,demand,multipliers):
+        self.rows["(15)-(16)"].RHS=np.asarray(demand,dtype=float)
+        c=self.c.copy()
+        c[self.first_stage]-=multipliers
+        self.variables.setAttr("Obj",c)
+        self.model.optimize()
+        return float(self.model.ObjBound),np.asarray(self.variables.X)[self.first_stage]
+
+class _ScenarioSubproblems:
+
+    def __init__(self,data,printers_upperbound,M,MIPGap,workers):
+        self.data=data
+        self.chunks=[chunk for chunk in np.array_split(np.arange(data.S),max(1,workers)) if len(chunk)>0]
+        single=_single_scenario(data,0)
+        self.envs,self.models=list(),list()
+        for _ in self.chunks:
+            env=gb.Env(empty=True)
+            env.setParam('OutputFlag',0)
+            env.setParam('Threads',1)
+            env.start()
+            self.envs.append(env)
+            self.models.append(_ScenarioSubproblem(single,printers_upperbound,M,MIPGap,env))
+        self.pool=ThreadPoolExecutor(max_workers=len(self.chunks)) if len(self.chunks)>1 else None
+
+    def _solve_chunk(self,indx,multipliers):
+        return [self.models[indx].solve(self.data.demand[scenario],multipliers[scenario]) for scenario in self.chunks[indx]]
+
+    # Bounds[s] and first stages x[s] of all the scenarios
+    def solve(self,multipliers):
+        if self.pool is None:
+            results=self._solve_chunk(0,multipliers)
+        else:
+            results=[result for chunk in self.pool.map(lambda indx: self._solve_chunk(indx,multipliers),range(len(self.chunks))) for result in chunk]
+        return np.array([result[0] for result in results]),np.array([result[1] for result in results])
+
+    def dispose(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+        for model,env in zip(self.models,self.envs):
+            model.model.dispose()
+            env.dispose()
+
+class LagrangianBound:
+
+    def __init__(self,data_instance,printers_upperbound=None,workers=1,MIPGap=1e-4,max_iterations=50,max_time=None,step=1.0,patience=5,tolerance=1e-4,log=False):
+        self.data_instance=data_instance
+        self.printers_upperbound=Solver.smart_upperbound(data_instance) if printers_upperbound is None else printers_upperbound
+        self.M=_big_M(data_instance)
+        self.workers=workers
+        self.MIPGap=MIPGap
+        self.max_iterations=max_iterations
+        self.max_time=max_time
+        self.step=step
+        self.patience=patience
+        self.tolerance=tolerance
+        self.log=log
+
+    def _evaluate(self,a,a_b,y):
+        key=(tuple(a),a_b,int(y.sum()))
+        if key not in self._values:
+            self._values[key]=StochasticEvaluator(self.data_instance,workers=self.workers,printers_upperbound=self.printers_upperbound).second_stage_obj_value(a,a_b,int(y.sum()))
+            if self._values[key]>self.obj_value:
+                self.obj_value,self.solution=self._values[key],{"a":np.asarray(a),"a_b":int(a_b),"y":np.asarray(y)}
+        return self._values[key]
+
+    def solve(self):
+        start=timer()
+        data=self.data_instance
+        N,S,U=data.N,data.S,self.printers_upperbound
+        q=np.asarray(data.q,dtype=float)
+        self._values=dict()
+        self.obj_value,self.solution=-np.inf,None
+        heuristic=HeuristicSolver(data,printers_upperbound=U,lp_bound=False).solve()["Solution"]
+        self._evaluate(heuristic["a"],heuristic["a_b"],np.asarray(heuristic["y"]))
+        multipliers=np.zeros((S,N+1+U))
+        best_multipliers=multipliers
+        self.bound=np.inf
+        step=self.step
+        without_improvement=0
+        iteration=0
+        subproblems=_ScenarioSubproblems(data,U,self.M,self.MIPGap,self.workers)
+        try:
+            for iteration in range(1,self.max_iterations+1):
+                bounds,x=subproblems.solve(multipliers)
+                value=float(np.dot(q,bounds))
+                if value<self.bound-1e-9:
+                    self.bound,best_multipliers,without_improvement=value,multipliers.copy(),0
+                else:
+                    without_improvement+=1
+                x_mean=q@x
+                self._evaluate(*feasible_first_stage(data,x_mean))
+                closest=x[np.argmin(np.sum((x-x_mean[None,:])**2,axis=1))]
+                self._evaluate(*feasible_first_stage(data,closest))
+                if self.log:
+                    print("Iteration "+str(iteration)+": bound "+str(round(value,2))+", best bound "+str(round(self.bound,2))+", best value "+str(round(self.obj_value,2)))
+                subgradient=x-x_mean[None,:]
+                norm=float(np.dot(q,np.sum(subgradient**2,axis=1)))
+                # All the scenarios take the same first stage: x_mean is optimal (up to the MIPGap of the subproblems)
+                if norm<=1e-12 or optimality_gap(self.obj_value,self.bound)<=self.tolerance:
+                    break
+                if self.max_time is not None and timer()-start>self.max_time:
+                    break
+                if without_improvement>=self.patience:
+                    step,without_improvement=step/2,0
+                multipliers=multipliers+step*max(value-self.obj_value,self.tolerance*max(abs(value),1.0))/norm*subgradient
+        finally:
+            subproblems.dispose()
+        self.iterations=iteration
+        self.multipliers=best_multipliers
+        self.runtime=timer()-start
+        return self._get_output()
+
+    def _get_output(self):
+        N=self.data_instance.N
+        output = {
+            "LagrangianBound":round(self.bound,2),
+            "ObjValue":round(float(self.obj_value),2),
+            "MIPGap":float('{:0.2e}'.format(optimality_gap(self.obj_value,self.bound))),
+            "Solution":self.solution,
+            "Printers":int(self.solution["y"].sum()),
+            "Iterations":self.iterations,
+            "Runtime":round(self.runtime,2),
+            "Multipliers":{"a":self.multipliers[:,:N],"a_b":self.multipliers[:,N],"y":self.multipliers[:,N+1:]}
+        }
+        return output
+
+# LP bound and, with lagrangian=True, Lagrangian bound and feasible first stage of an instance. Bound is the best of the two.
+def instance_bounds(data_instance,lagrangian=True,printers_upperbound=None,**kwargs):
+    printers_upperbound=Solver.smart_upperbound(data_instance) if printers_upperbound is None else printers_upperbound
+    start=timer()
+    bounds={"LPBound":round(lp_bound(data_instance,printers_upperbound),2)}
+    bounds["LPRuntime"]=round(timer()-start,2)
+    bounds["Bound"]=bounds["LPBound"]
+    if lagrangian:
+        output=LagrangianBound(data_instance,printers_upperbound=printers_upperbound,**kwargs).solve()
+        bounds.update(output)
+        bounds["Bound"]=min(bounds["LPBound"],output["LagrangianBound"])
+        bounds["MIPGap"]=float('{:0.2e}'.format(optimality_gap(output["ObjValue"],bounds["Bound"])))
+    return bounds
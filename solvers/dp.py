@@ -0,0 +1,448 @@
+import functools
+import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import linprog
+from timeit import default_timer as timer
+from solvers.solver import Solver
+from solvers.formulation import aggregated_constraint_blocks, aggregated_objective_vector, aggregated_variable_layout, size_gcd
+
+# ------------------------------------------------------- Dynamic programming solver -------------------------------------------------
+#
+# This class solves small TSS-3DKP instances exactly with dynamic programming written in NumPy, without any MIP solver licence.
+#
+# -- Knapsack tables --
+#   All the DP tables are NumPy arrays over one capacity (scaled by the gcd of the sizes) updated in place, so only the current
+#   layer is stored. The bounded items are split in binary copies (1,2,4,... units). With choices=True every copy also stores a
+#   bitset (np.packbits) of the cells where it improved the table, and the units of an optimal solution are rebuilt with a single
+#   backward pass over the bitsets.
+#
+# -- Second stage --
+#   Since alpha<=1, in each scenario the carried items are used first (a_s=min(a,demand)) and the residual demand of the printable
+#   items is printed with the time of the n printers (n*T) and the material a_b. The material is moved to the objective with a
+#   price (Lagrangian relaxation), so every price gives a knapsack on the time alone, and the best price is found with cutting
+#   planes; the prints of every price that use at most a_b and can be packed on the n printers are solutions. If the best of them
+#   does not reach the bound, a depth first search on the units of each item, bounded by the knapsacks on the time of the items
+#   left at price 0 and at the best price, finds the optimum. The packing is a depth first search too (units by decreasing time,
+#   printers with the same load are equivalent, failed states are remembered).
+#
+# -- First stage --
+#   For each number of printers n the units of all the items are fixed by a depth first search (items by decreasing expected
+#   revenue, children by decreasing bound) and at a leaf the material left is a_b=min(capacity left, largest residual need), since
+#   the printing value does not decrease with a_b. The bound of a node is a Lagrangian relaxation: the volume (or the weight) and
+#   the printing time and material of every scenario are moved to the objective with the duals of the LP relaxation of the
+#   aggregated formulation (solvers.formulation) as multipliers, so the value of every item becomes a function of its units only
+#   and the items left are a knapsack on the weight (or the volume) alone. Its tables, one for each depth, are indexed by the
+#   capacity left, so the states grow with W+V and not with W*V. The best of the two relaxations is used. A leaf is pruned with
+#   the printing bounds of its scenarios (knapsacks on the time at price 0 and at the price of the LP, then the cutting planes)
+#   before the exact printing. The numbers of printers are explored by decreasing LP bound, and a search starts only if its root
+#   bound can improve the best solution. The solution is optimal: Status is always OPTIMAL and MIPGap 0.
+#
+# -- Limits --
+#   The tables of the bounds have (N+1)*(W/gcd(w)+V/gcd(v)+2) states for each number of printers: instances with more than
+#   "max_states" states are rejected with a ValueError. alpha must be <=1. The search is exponential in the worst case: the solver
+#   is meant for instances up to a few tens of items.
+#
+# -- Parent Class --
+#   The class DPSolver inherit some methods from the abstract class "Solver" (solvers.solver.Solver)
+#
+# -- Methods --
+#  -solve(): solve the problem and retrieve a dict with the same keys of GurobiSolver.solve() (Nodes are the nodes of the search,
+#            Solutions the leaves evaluated, Cuts is 0).
+#  -print_solution(): print the solution found. Must be called after solve() method.
+#
+# ------------------------------------------------------------------------------------------------------------------------------------
+
+TOLERANCE=1e-9
+
+def _improves(value,best):
+    return value>best+TOLERANCE*max(1.0,abs(best))
+
+# Binary copies of the bounded items (item and units of every copy): every number of units up to counts[item] is a sum of
+# distinct copies
+def _copies(counts):
+    units=[_split(count) for count in counts]
+    return np.repeat(np.arange(len(counts)),[len(split) for split in units]),np.array([unit for split in units for unit in split],dtype=int)
+
+@functools.lru_cache(maxsize=None)
+def _split(count):
+    units,size=list(),1
+    while count>0:
+        units.append(min(size,count))
+        count-=units[-1]
+        size*=2
+    return tuple(units)
+
+# Bounded knapsack for every capacity up to "capacity", added to a copy of "table" if given. Only the current layer is stored;
+# with choices=True it also returns the copies and their bitsets (one row for each copy, packed with np.packbits) of the cells
+# where the copy improved the table, for _knapsack_solution.
+def _knapsack_table(capacity,sizes,values,counts,table=None,choices=False):
+    dp=np.zeros(capacity+1) if table is None else table.copy()
+    items,units=_copies(counts)
+    shifts=(units*np.asarray(sizes,dtype=int)[items]).tolist()
+    gains=(units*np.asarray(values,dtype=float)[items]).tolist()
+    mask=np.zeros((len(shifts),capacity+1),dtype=bool) if choices else None
+    for copy,(shift,gain) in enumerate(zip(shifts,gains)):
+        if gain<=0 or shift>capacity:
+            continue
+        candidate=dp[:capacity+1-shift]+gain
+        if choices:
+            mask[copy,shift:]=candidate>dp[shift:]
+        np.maximum(dp[shift:],candidate,out=dp[shift:])
+    return (dp,(items,units,shifts,np.packbits(mask,axis=1))) if choices else dp
+
+# Units of each item of the optimal solution of _knapsack_table at "capacity", in one backward pass over the bitsets
+def _knapsack_solution(capacity,choices,num_items):
+    items,units,shifts,bits=choices
+    x=np.zeros(num_items,dtype=int)
+    for copy in range(len(shifts)-1,-1,-1):
+        if (bits[copy,capacity>>3]>>(7-(capacity&7)))&1:
+            x[items[copy]]+=units[copy]
+            capacity-=shifts[copy]
+    return x
+
+# Bounded knapsacks of the items depth,depth+1,... for every depth (row len(counts) has no item), in one pass from the last item
+def _suffix_tables(capacity,sizes,values,counts):
+    items,units=_copies(counts)
+    shifts=(units*np.asarray(sizes,dtype=int)[items]).tolist()
+    gains=(units*np.asarray(values,dtype=float)[items]).tolist()
+    tables=np.zeros((len(counts)+1,capacity+1))
+    copy=len(shifts)-1
+    for item in range(len(counts)-1,-1,-1):
+        dp=tables[item]
+        dp[:]=tables[item+1]
+        while copy>=0 and items[copy]==item:
+            if gains[copy]>0 and shifts[copy]<=capacity:
+                np.maximum(dp[shifts[copy]:],dp[:capacity+1-shifts[copy]]+gains[copy],out=dp[shifts[copy]:])
+            copy-=1
+    return tables
+
+# Table of a multiple choice item added to "table" (one capacity): result[c]=max_k table[c-k*size]+values[k]
+def _choice_table(size,values,table):
+    capacity=len(table)-1
+    result=table+values[0]
+    for units in range(1,len(values)):
+        if units*size>capacity:
+            break
+        np.maximum(result[units*size:],table[:capacity+1-units*size]+values[units],out=result[units*size:])
+    return result
+
+# Prints p[printer,item] of the units x on the printers, or None if they can not be packed in time T
+def _pack(x,t,printers,T):
+    units=np.repeat(np.arange(len(x)),x)
+    units=units[np.argsort(-t[units],kind="stable")]
+    if t[units].sum()>printers*T:
+        return None
+    times=t[units].tolist()
+    loads,assignment,failed=[0]*printers,[-1]*len(units),set()
+    index=0
+    while index<len(units):
+        time,previous=times[index],assignment[index]
+        if previous>=0:
+            loads[previous]-=time
+        key=(index,tuple(sorted(loads)))
+        printer=previous+1 if key not in failed else printers
+        while printer<printers and (loads[printer]+time>T or loads[printer] in loads[:printer]):
+            printer+=1
+        if printer<printers:
+            loads[printer]+=time
+            assignment[index]=printer
+            index+=1
+        else:
+            failed.add(key)
+            assignment[index]=-1
+            index-=1
+            if index<0:
+                return None
+    p=np.zeros((printers,len(x)),dtype=int)
+    np.add.at(p,(np.array(assignment,dtype=int),units),1)
+    return p
+
+class DPSolver(Solver):
+
+    def __init__(self,data_instance,printers_upperbound=None,max_states=5*10**7):
+        Solver.__init__(self,data_instance,printers_upperbound)
+        if data_instance.alpha>1:
+            raise ValueError("DPSolver requires alpha<=1")
+        self.max_states=max_states
+        self._model_generator()
+
+    # Carried values, printing sizes and the LP relaxation of the aggregated formulation, whose number of printers is fixed by
+    # its bounds in _relaxations
+    def _model_generator(self):
+        data=self.data_instance
+        self.demand=np.asarray(data.demand,dtype=int)
+        self.q,r=np.asarray(data.q,dtype=float),np.asarray(data.r,dtype=float)
+        self.printable=np.asarray(data.N_p,dtype=int)
+        self.max_units=self.demand.max(axis=0) if data.S>0 else np.zeros(data.N,dtype=int)
+        self.carried=[r[item]*np.array([self.q@np.minimum(k,self.demand[:,item]) for k in range(self.max_units[item]+1)]) for item in range(data.N)]
+        self.order=np.argsort([-carried[-1] for carried in self.carried],kind="stable")
+        self.g_w,self.g_v=size_gcd(list(data.w)+[data.w_b]),size_gcd(list(data.v)+[data.v_b])
+        states=(data.N+1)*(int(data.W)//self.g_w+int(data.V)//self.g_v+2)
+        if states>self.max_states:
+            raise ValueError("Instance too large for DPSolver: "+str(states)+" states")
+        # Printing sizes divided by their gcd and values of the printable items
+        t,m=np.asarray(data.t,dtype=int)[self.printable],np.rint(np.asarray(data.m)[self.printable]).astype(int)
+        self.g_t,self.g_m=size_gcd(t),size_gcd(m)
+        self.t,self.m=t//self.g_t,m//self.g_m
+        self.values=data.alpha*r[self.printable]
+        self.capacity=np.where(t>0,int(data.T)//np.maximum(t,1),np.iinfo(np.int64).max)
+        M=int(min(data.W/data.w_b if data.w_b>0 else np.inf,data.V/data.v_b if data.v_b>0 else np.inf,(self.demand[:,self.printable]@m).max(initial=0))+2)
+        self.blocks=aggregated_constraint_blocks(data,self.printers_upperbound,M)
+        self.A=sp.vstack([block for _,block,_ in self.blocks],format="csr")
+        self.b=np.concatenate([b for _,_,b in self.blocks])
+        self.c=aggregated_objective_vector(data,self.printers_upperbound)
+        self.layout=aggregated_variable_layout(data,self.printers_upperbound)
+        self.model=None
+
+    # LP relaxation of the aggregated formulation with the number of printers fixed
+    def _lp(self,printers):
+        bounds=np.zeros((self.layout["size"],2))
+        bounds[:,1]=np.inf
+        bounds[self.layout["n"]]=printers
+        return linprog(-self.c,A_ub=self.A,b_ub=self.b,bounds=bounds,method="highs")
+
+    # For the weight and the volume, the value of every item and of the material in the Lagrangian relaxation that keeps only that
+    # capacity, with the duals of the LP as multipliers, and the tables of the items order[depth:]. The prices of the material in
+    # the printing of each scenario are the duals of (18).
+    def _relaxations(self,printers,lp):
+        data=self.data_instance
+        layout=self.layout
+        duals=np.maximum(-lp.ineqlin.marginals,0) if lp.status==0 else np.zeros(len(self.b))
+        kept=dict()
+        offset=0
+        for name,block,_ in self.blocks:
+            kept[name]=np.arange(offset,offset+block.shape[0])
+            offset+=block.shape[0]
+        self.prices=duals[kept["(18)"]]/np.maximum(self.q,1e-12)*self.g_m
+        # (15)-(17) are kept in the items, the capacities of the printers bound the prints
+        duals[kept["(15)-(16)"]]=0
+        duals[kept["(17)"]]=0
+        duals[kept["(19)-capacity"]]=0
+        S,N_p=data.S,len(self.printable)
+        weight,volume=int(data.W)-printers*data.w_p,int(data.V)-printers*data.v_p
+        need=int((self.demand[:,self.printable]@(self.m*self.g_m)).max(initial=0)) if printers>0 else 0
+        limit=np.minimum((self.demand[:,self.printable]),(self.capacity*printers)[None,:])
+        relaxations=list()
+        for dimension,row,capacity,g,sizes,size_b in ((0,kept["(12)"],weight,self.g_w,data.w,data.w_b),(1,kept["(13)"],volume,self.g_v,data.v,data.v_b)):
+            y=duals.copy()
+            y[row]=0
+            reduced=self.c-self.A.T@y
+            const=float(y@(self.b-self.A[:,layout["n"]].toarray().ravel()*printers))
+            x=reduced[layout["x"]:layout["a_s"]].reshape(S,N_p)
+            values=list()
+            for item in range(data.N):
+                units=np.arange(self.max_units[item]+1)
+                value=self.carried[item]+reduced[layout["a"]+item]*units
+                position=np.flatnonzero(self.printable==item)
+                if printers>0 and len(position)>0:
+                    prints=np.minimum(np.maximum(self.demand[:,item][None,:]-units[:,None],0),limit[:,position[0]][None,:])
+                    value=value+prints@np.maximum(x[:,position[0]],0)
+                values.append(value)
+            material=reduced[layout["a_b"]]
+            table=np.zeros(capacity//g+1)
+            if material>0:
+                table=material*(np.minimum(np.arange(capacity//g+1)*g//size_b,need) if size_b>0 else np.full(capacity//g+1,need))
+            tables=[table]
+            for item in self.order[::-1]:
+                tables.append(_choice_table(int(sizes[item])//g,values[item],tables[-1]))
+            relaxations.append((dimension,g,const,values,tables[::-1]))
+        return relaxations
+
+    # Value and prints of the knapsack on the time of the residual demand with the material priced at "price" (Lagrangian
+    # relaxation of the material), remembered since the same residuals and prices come back with other capacities of the material
+    def _priced_prints(self,residual,printers,price):
+        key=(printers,price,residual.tobytes())
+        if key not in self.priced:
+            time=printers*(int(self.data_instance.T)//self.g_t)
+            dp,choices=_knapsack_table(time,self.t,self.values-price*self.m,residual.tolist(),choices=True)
+            self.priced[key]=(float(dp[time]),_knapsack_solution(time,choices,len(residual)))
+        return self.priced[key]
+
+    # Upper bound of the printing of a scenario: the knapsacks on the time with the material priced at 0 and at the price of the LP
+    def _printing_bound(self,residual,material,price,printers):
+        material=min(material//self.g_m,int(residual@self.m))
+        return min(self._priced_prints(residual,printers,value_price)[0]+value_price*material for value_price in (0.0,price))
+
+    # Lagrangian dual of the material in the printing of the residual demand of a scenario, minimized with cutting planes: every
+    # price gives the prints of a knapsack on the time, an upper bound and, if the prints use at most the material and can be
+    # packed, a solution. Returns the bound, the best solution (value and prints [printer,item]) and the best price.
+    def _printing_dual(self,residual,material,printers):
+        T=int(self.data_instance.T)//self.g_t
+        time,material=printers*T,min(material//self.g_m,int(residual@self.m))
+        key=(printers,material,residual.tobytes())
+        if key in self.duals:
+            return self.duals[key]
+        counts=residual.tolist()
+        best=[0.0,np.zeros((printers,len(counts)),dtype=int)]
+        def line(price):
+            x=self._priced_prints(residual,printers,price)[1]
+            value=float(x@self.values)
+            if x@self.m<=material and _improves(value,best[0]):
+                p=_pack(x,self.t,printers,T)
+                if p is not None:
+                    best[0],best[1]=value,p
+            return value,float(material-x@self.m)
+        low=line(0.0)
+        price,upper=0.0,low[0]
+        if low[1]<0:
+            # Above the largest value per unit of material only the items without material are printed
+            high_price=float(np.max(self.values/np.maximum(self.m,1)))+1.0
+            high=line(high_price)
+            upper=min(upper,high[0]+high_price*high[1])
+            while True:
+                price=(high[0]-low[0])/(low[1]-high[1])
+                new=line(price)
+                upper=min(upper,new[0]+price*new[1])
+                if not _improves(new[0]+price*new[1],low[0]+price*low[1]):
+                    break
+                if new[1]<0:
+                    low=new
+                else:
+                    high=new
+        self.duals[key]=(upper,best[0],best[1],price)
+        return self.duals[key]
+
+    # Exact printing of the residual demand of a scenario with the material and the printers: value and prints [printer,item].
+    # If the best solution of the dual does not reach its bound, a depth first search on the units of each item (items by decreasing
+    # value per time at the best price), bounded by the knapsacks on the time of the items left at price 0 and at the best price,
+    # finds the optimum.
+    def _printing(self,residual,material,printers):
+        T=int(self.data_instance.T)//self.g_t
+        time,material=printers*T,min(material//self.g_m,int(residual@self.m))
+        key=(printers,material,residual.tobytes())
+        if key in self.cache:
+            return self.cache[key]
+        upper,value,p,price=self._printing_dual(residual,material*self.g_m,printers)
+        if not _improves(upper,value):
+            self.cache[key]=(value,p)
+            return self.cache[key]
+        order=[item for item in np.argsort(-(self.values-price*self.m)/np.maximum(self.t,1),kind="stable") if residual[item]>0]
+        counts,t,m,values=residual[order],self.t[order],self.m[order],self.values[order]
+        prices=np.array([0.0,price])
+        suffix=np.stack([_suffix_tables(time,t,values-item_price*m,counts) for item_price in prices],axis=1)
+        best=[value,p]
+        x=np.zeros(len(self.t),dtype=int)
+        def search(depth,time,material,value):
+            if depth==len(order):
+                p=_pack(x,self.t,printers,T)
+                if p is not None:
+                    best[0],best[1]=value,p
+                return
+            units=np.arange(counts[depth],-1,-1)
+            units=units[(units*t[depth]<=time)&(units*m[depth]<=material)]
+            times,materials,child_values=time-units*t[depth],material-units*m[depth],value+units*values[depth]
+            bounds=(child_values[:,None]+materials[:,None]*prices[None,:]+suffix[depth+1][:,times].T).min(axis=1)
+            for child in np.argsort(-bounds,kind="stable"):
+                if not _improves(bounds[child],best[0]):
+                    break
+                x[order[depth]]=units[child]
+                search(depth+1,int(times[child]),int(materials[child]),float(child_values[child]))
+            x[order[depth]]=0
+        search(0,time,material,0.0)
+        self.cache[key]=(best[0],best[1])
+        return self.cache[key]
+
+    def _search(self,printers,depth,a,weight,volume,value,fixed,residual):
+        self.nodes+=1
+        if depth==len(self.order):
+            return self._leaf(printers,a,weight,volume,value,residual)
+        data=self.data_instance
+        item=self.order[depth]
+        units=np.arange(self.max_units[item]+1)
+        units=units[(units*int(data.w[item])<=weight)&(units*int(data.v[item])<=volume)]
+        weights,volumes=weight-units*int(data.w[item]),volume-units*int(data.v[item])
+        bounds=np.full(len(units),np.inf)
+        children=list()
+        for (dimension,g,const,values,tables),base in zip(self.relaxations,fixed):
+            fixed_child=base+values[item][units]
+            children.append(fixed_child)
+            np.minimum(bounds,const+fixed_child+tables[depth+1][(weights if dimension==0 else volumes)//g],out=bounds)
+        position=np.flatnonzero(self.printable==item)
+        for child in np.argsort(-bounds,kind="stable"):
+            if not _improves(bounds[child],self.obj_value):
+                break
+            a[item]=units[child]
+            child_residual=residual
+            if len(position)>0:
+                child_residual=residual.copy()
+                child_residual[:,position[0]]=np.maximum(self.demand[:,item]-units[child],0)
+            self._search(printers,depth+1,a,int(weights[child]),int(volumes[child]),value+self.carried[item][units[child]],
+                         [values[child] for values in children],child_residual)
+        a[item]=0
+
+    # All the units fixed: the material fills the capacity left up to the largest residual need of the scenarios. The exact
+    # printing of the scenarios replaces their bounds one at a time, while the leaf can still improve the best solution.
+    def _leaf(self,printers,a,weight,volume,value,residual):
+        data=self.data_instance
+        self.evaluated+=1
+        a_b=0
+        if printers>0:
+            a_b=int((residual@(self.m*self.g_m)).max(initial=0))
+            if data.w_b>0:
+                a_b=min(a_b,weight//data.w_b)
+            if data.v_b>0:
+                a_b=min(a_b,volume//data.v_b)
+            bounds=[self._printing_bound(scenario,a_b,price,printers) for scenario,price in zip(residual,self.prices)]
+            upper=value+self.q@bounds
+            # Cheap bounds, then the duals of the material, then the exact printing: each scenario tightens the bound of the leaf
+            for stage in (lambda scenario:self._printing_dual(scenario,a_b,printers)[0],lambda scenario:self._printing(scenario,a_b,printers)[0]):
+                for index,(q,scenario) in enumerate(zip(self.q,residual)):
+                    if not _improves(upper,self.obj_value):
+                        return
+                    tighter=stage(scenario)
+                    upper-=q*(bounds[index]-tighter)
+                    bounds[index]=tighter
+            value=upper
+        if _improves(value,self.obj_value):
+            self.obj_value=float(value)
+            self.best=(printers,a.copy(),a_b)
+
+    def solve(self):
+        start=timer()
+        data=self.data_instance
+        self.nodes,self.evaluated,self.cache,self.duals,self.priced=0,0,dict(),dict(),dict()
+        self.obj_value=0.0
+        self.best=(0,np.zeros(data.N,dtype=int),0)
+        residual=self.demand[:,self.printable]
+        candidates=list()
+        for printers in range(0,self.printers_upperbound+1 if len(self.printable)>0 else 1):
+            if int(data.W)-printers*data.w_p<0 or int(data.V)-printers*data.v_p<0:
+                break
+            lp=self._lp(printers)
+            candidates.append((-lp.fun if lp.status==0 else np.inf,printers,lp))
+        for bound,printers,lp in sorted(candidates,key=lambda candidate:-candidate[0]):
+            if not _improves(bound*(1+1e-6)+1e-6,self.obj_value):
+                continue
+            self.relaxations=self._relaxations(printers,lp)
+            weight,volume=int(data.W)-printers*data.w_p,int(data.V)-printers*data.v_p
+            self._search(printers,0,np.zeros(data.N,dtype=int),weight,volume,0.0,[0.0]*len(self.relaxations),residual.copy())
+        self.solution,self.printers=self._solution()
+        self.runtime=timer()-start
+        return self._get_output()
+
+    # Solution of the best leaf with the exact printing of every scenario
+    def _solution(self):
+        data=self.data_instance
+        printers,a,a_b=self.best
+        a_s=np.minimum(a[None,:],self.demand)
+        P=np.zeros((data.S,self.printers_upperbound,len(self.printable)),dtype=int)
+        if printers>0:
+            for scenario,residual in enumerate(self.demand[:,self.printable]-a_s[:,self.printable]):
+                P[scenario,:printers]=self._printing(residual,a_b,printers)[1]
+        y=(np.arange(self.printers_upperbound)<printers).astype(int)
+        return {"a":a,"a_b":int(a_b),"p":P,"a_s":a_s,"y":y},printers
+
+    def _get_output(self):
+        output = {
+            "StatusCode":2,
+            "Status":"OPTIMAL",
+            "ObjValue":round(float(self.obj_value),2),
+            "Solutions":int(self.evaluated),
+            "Nodes":int(self.nodes),
+            "Cuts":0,
+            "Runtime":round(float(self.runtime),2),
+            "MIPGap":0.0,
+            "Solution":self.solution,
+            "Printers":int(self.printers),
+        }
+        return output
@@ -0,0 +1,190 @@
+import numpy as np
+import scipy.sparse as sp
+import gurobipy as gb
+from concurrent.futures import ProcessPoolExecutor
+from solvers.solver import Solver
+from solvers.gurobi import GurobiSolver
+from solvers.formulation import pack_printers
+
+# ------------------------------------------------------ Evaluation module -----------------------------------------------------------
+#
+# This module computes the stochastic programming measures of a TSS-3DKP instance (see "Introduction to stochastic programming",
+# page 44) without building a new model for every scenario:
+#  - WS (wait and see): the single-scenario model is built once (with the printers upperbound of the whole instance, valid for
+#    every scenario) and the demand of each scenario is swapped in through the right hand side of constraints (15)/(16).
+#  - EEV (expected result of the expected value solution): once a, a_b and the printers are fixed the second stage splits by
+#    scenario, so it is solved as S small problems that share one model, again swapping the demand in the right hand side.
+#  - RP (recourse problem): the deterministic equivalent solved by GurobiSolver.
+#  - EVPI=WS-RP and VSS=RP-EEV.
+# The scenarios are split in "workers" chunks solved by parallel processes; every process builds its model once.
+#
+# -- Classes --
+#  -SecondStageModel: second stage problem of one scenario for a fixed first stage (a, a_b, number of printers).
+#  -StochasticEvaluator: compute WS, EEV, RP, EVPI and VSS of a Data instance.
+#
+# -- Functions --
+#  -pack_aggregated_solution(data_instance,a,a_b,printers,x,a_s): per-printer solution of the aggregated formulation (see
+#                                                                solvers.formulation).
+#
+# ------------------------------------------------------------------------------------------------------------------------------------
+
+# Instance with only the given scenario: a view that shares the arrays of the original instance
+def _single_scenario(data_instance,scenario):
+    return data_instance.scenario(scenario)
+
+def _chunks(scenarios,workers):
+    return [chunk for chunk in np.array_split(np.asarray(scenarios),max(1,workers)) if len(chunk)>0]
+
+# Second stage of a single scenario with a, a_b and the number of printers fixed. Variables: p[j,i] (printer j, printable item i),
+# a_s[i] with upper bound a[i] (Constraint (7)). The demand rows (Constraints (5)/(6)) are the only ones that change between
+# scenarios.
+class SecondStageModel:
+
+    def __init__(self,data_instance,a,a_b,printers,MIPGap=None,threads=None):
+        self.data_instance=data_instance
+        self.a=np.asarray(a)
+        self.printers=int(printers)
+        data=data_instance
+        N,N_p,n=data.N,len(data.N_p),self.printers
+        if n==0:
+            # Without printers the second stage is a_s=min(a,demand), no model is needed
+            self.model=None
+            return
+        mask,position=data.get_printable_index()
+        printable=np.asarray(data.N_p,dtype=int)
+        model=gb.Model()
+        model.setParam('OutputFlag',0)
+        if MIPGap is not None:
+            model.setParam('MIPGap',MIPGap)
+        if threads is not None:
+            model.setParam('Threads',threads)
+        model.addMVar((n,N_p),vtype=gb.GRB.INTEGER,name="p")
+        model.addMVar(N,vtype=gb.GRB.INTEGER,ub=self.a,name="a_s")
+        P=np.arange(n*N_p).reshape(n,N_p)
+        a_s=n*N_p+np.arange(N)
+        size=n*N_p+N
+        #Constraint (5) and Constraint (6)
+        p_rows=np.broadcast_to(np.flatnonzero(mask)[None,:],(n,N_p))
+        A=sp.csr_matrix((np.ones(N+n*N_p),(np.concatenate([np.arange(N),p_rows.ravel()]),np.concatenate([a_s,P[:,position[mask]].ravel()]))),shape=(N,size))
+        self.demand_constraints=model.addMConstr(A,None,gb.GRB.LESS_EQUAL,np.asarray(data.demand[0],dtype=float))
+        #Constraint (8)
+        A=sp.csr_matrix((np.tile(np.asarray(data.m,dtype=float)[printable],n),(np.zeros(n*N_p,dtype=int),P.ravel())),shape=(1,size))
+        model.addMConstr(A,None,gb.GRB.LESS_EQUAL,np.array([a_b],dtype=float))
+        #Constraint (9)
+        A=sp.csr_matrix((np.tile(np.asarray(data.t,dtype=float)[printable],n),(np.repeat(np.arange(n),N_p),P.ravel())),shape=(n,size))
+        model.addMConstr(A,None,gb.GRB.LESS_EQUAL,np.full(n,float(data.T)))
+        #Objective function
+        r=np.asarray(data.r,dtype=float)
+        model.setMObjective(None,np.concatenate([np.tile(data.alpha*r[printable],n),r]),0.0,sense=gb.GRB.MAXIMIZE)
+        self.model=model
+
+    def obj_value(self,demand):
+        if self.model is None:
+            return float(np.dot(self.data_instance.r,np.minimum(self.a,demand)))
+        self.demand_constraints.RHS=np.asarray(demand,dtype=float)
+        self.model.optimize()
+        return float(self.model.ObjVal)
+
+    # Objective value and solution (p[j,i] for the carried printers, a_s[i]) of the second stage for the given demand
+    def solve(self,demand):
+        data=self.data_instance
+        if self.model is None:
+            a_s=np.minimum(self.a,demand)
+            return float(np.dot(data.r,a_s)),np.zeros((0,len(data.N_p)),dtype=int),a_s.astype(int)
+        obj_value=self.obj_value(demand)
+        x=np.rint(self.model.getAttr("X",self.model.getVars())).astype(int)
+        n,N_p=self.printers,len(data.N_p)
+        return obj_value,x[:n*N_p].reshape(n,N_p),x[n*N_p:]
+
+# Prints x[s,i] and a_s[s,i] of the aggregated formulation assigned to the printers. The scenarios that first fit decreasing
+# cannot pack are solved again with SecondStageModel, which finds the packing if there is one (same value) and otherwise the best
+# second stage for the first stage (a, a_b, printers). Returns p[s,j,i], a_s[s,i] and the expected value lost by the repair.
+def pack_aggregated_solution(data_instance,a,a_b,printers,x,a_s):
+    data=data_instance
+    p,residual=pack_printers(data,x,printers)
+    a_s=np.array(a_s,dtype=int)
+    failed=np.flatnonzero(residual.any(axis=1))
+    if len(failed)==0:
+        return p.astype(int),a_s,0.0
+    r=np.asarray(data.r,dtype=float)
+    values=a_s[failed]@r+np.asarray(x)[failed]@(data.alpha*r[np.asarray(data.N_p,dtype=int)])
+    model=SecondStageModel(data,a,a_b,printers,MIPGap=0)
+    for indx,scenario in enumerate(failed):
+        value,p[scenario],a_s[scenario]=model.solve(data.demand[scenario])
+        values[indx]-=value
+    return p.astype(int),a_s,float(np.dot(np.asarray(data.q,dtype=float)[failed],np.maximum(values,0)))
+
+def _wait_and_see_chunk(data_instance,scenarios,printers_upperbound,MIPGap,threads):
+    solver=GurobiSolver(_single_scenario(data_instance,int(scenarios[0])),MIPGap=MIPGap,printers_upperbound=printers_upperbound,builder="matrix",threads=threads)
+    demand_constraints=solver.constraints["(15)-(16)"]
+    values=list()
+    for scenario in scenarios:
+        demand_constraints.RHS=np.asarray(data_instance.demand[scenario],dtype=float)
+        values.append(solver.solve()["ObjValue"])
+    return values
+
+def _second_stage_chunk(data_instance,scenarios,a,a_b,printers,threads):
+    model=SecondStageModel(data_instance,a,a_b,printers,threads=threads)
+    return [model.obj_value(data_instance.demand[scenario]) for scenario in scenarios]
+
+def _second_stage_solution_chunk(data_instance,scenarios,a,a_b,printers,threads):
+    model=SecondStageModel(data_instance,a,a_b,printers,threads=threads)
+    return [model.solve(data_instance.demand[scenario]) for scenario in scenarios]
+
+class StochasticEvaluator:
+
+    def __init__(self,data_instance,MIPGap=0.001,workers=1,threads=1,printers_upperbound=None):
+        self.data_instance=data_instance
+        self.MIPGap=MIPGap
+        self.workers=workers
+        self.threads=threads
+        self.printers_upperbound=Solver.smart_upperbound(data_instance) if printers_upperbound is None else printers_upperbound
+
+    # Run "function" on chunks of the scenarios (in parallel if workers>1) and return the results in the order of the scenarios
+    def _map_scenarios_list(self,function,*args):
+        chunks=_chunks(range(self.data_instance.S),self.workers)
+        if len(chunks)==1:
+            return list(function(self.data_instance,chunks[0],*args))
+        with ProcessPoolExecutor(max_workers=len(chunks)) as pool:
+            results=pool.map(function,[self.data_instance]*len(chunks),chunks,*[[arg]*len(chunks) for arg in args])
+            return [result for values in results for result in values]
+
+    def _map_scenarios(self,function,*args):
+        return np.array(self._map_scenarios_list(function,*args))
+
+    # Objective value of each scenario solved alone and their expected value
+    def wait_and_see_obj_values(self):
+        return self._map_scenarios(_wait_and_see_chunk,self.printers_upperbound,self.MIPGap,self.threads)
+
+    def wait_and_see_obj_value(self):
+        return float(np.dot(self.wait_and_see_obj_values(),self.data_instance.q))
+
+    # Solution of the expected value problem (one scenario with the expected demand)
+    def expected_value_solution(self,log=False):
+        return GurobiSolver(self.data_instance.expected(),MIPGap=self.MIPGap,log=log,builder="matrix",threads=self.threads).solve()
+
+    # Expected value of the second stage over all the scenarios for a fixed first stage
+    def second_stage_obj_values(self,a,a_b,printers):
+        return self._map_scenarios(_second_stage_chunk,np.asarray(a),int(a_b),int(printers),self.threads)
+
+    def second_stage_obj_value(self,a,a_b,printers):
+        return float(np.dot(self.second_stage_obj_values(a,a_b,printers),self.data_instance.q))
+
+    # Values and solutions of the second stage of every scenario: values[s], p[s,j,i] (carried printers only), a_s[s,i]
+    def second_stage_solutions(self,a,a_b,printers):
+        solutions=self._map_scenarios_list(_second_stage_solution_chunk,np.asarray(a),int(a_b),int(printers),self.threads)
+        return np.array([s[0] for s in solutions]),np.array([s[1] for s in solutions]),np.array([s[2] for s in solutions])
+
+    def EEVS_obj_value(self,log=False):
+        solution=self.expected_value_solution(log=log)
+        return round(self.second_stage_obj_value(solution["Solution"]["a"],solution["Solution"]["a_b"],solution["Printers"]),2)
+
+    def recourse_obj_value(self):
+        return GurobiSolver(self.data_instance,MIPGap=self.MIPGap,builder="matrix",threads=self.threads).solve()["ObjValue"]
+
+    # WS, EEV, RP, EVPI and VSS of the instance. RP can be passed if the instance has already been solved.
+    def evaluate(self,RP=None):
+        WS=self.wait_and_see_obj_value()
+        EEV=self.EEVS_obj_value()
+        RP=self.recourse_obj_value() if RP is None else RP
+        return {"WS":WS,"EEV":EEV,"RP":RP,"EVPI":WS-RP,"VSS":RP-EEV}
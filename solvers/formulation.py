@@ -0,0 +1,244 @@
+import math
+import numpy as np
+import scipy.sparse as sp
+
+# ------------------------------------------------------- Formulation module ---------------------------------------------------------
+#
+# This module builds the TSS-3DKP deterministic equivalent (constraints (12)-(20) of
+# https://www.sciencedirect.com/science/article/pii/S0305054821001337 ) as sparse coefficient matrices, directly from the arrays
+# of a managers.data.Data instance. It is used by the matrix-based builders of the solvers, which add whole blocks of constraints
+# with a single call instead of one constraint at a time.
+#
+# -- Variable layout --
+#  The columns follow the order in which GurobiSolver creates the variables: a[i], a_b, p[s,p,i], a_s[s,i], y[p].
+#  Multi-index variables are flattened in row-major (C) order.
+#
+# -- Functions --
+#  -variable_layout(data,printers_upperbound): offsets of every group of variables and total number of columns.
+#  -constraint_blocks(data,printers_upperbound,M): list of (name, A, b) with A a CSR matrix, one for each family of
+#                                                  constraints in the form A x <= b.
+#  -objective_vector(data,printers_upperbound): dense vector c of the objective coefficients (maximisation).
+#  -solution_vector(data,printers_upperbound,solution): values of the columns for a Solution dict (e.g. for a MIP start).
+#
+# -- Aggregated formulation --
+#  The printers are identical, so the model above has U! equivalent solutions for every assignment of the prints to the printers
+#  (only partly removed by constraint (20)). The aggregated formulation replaces y[p] with the integer number of printers n and
+#  p[s,p,i] with the total prints x[s,i] of each scenario. Columns: a[i], a_b, x[s,i], a_s[s,i], n. Constraint (19) becomes
+#  sum_i t[i]*x[s,i]<=T*n, with the valid bin packing constraints x[s,i]<=floor(T/t[i])*n (a printer prints at most
+#  floor(T/t[i]) units of item i) and sum_i u_k(t[i])*x[s,i]<=T*n for the dual feasible functions u_k of Fekete and Schepers.
+#  These constraints are a relaxation of the per-printer ones: pack_printers assigns the prints to the printers (first fit
+#  decreasing) and returns the units that do not fit, if any.
+#  -aggregated_variable_layout(data,printers_upperbound), aggregated_constraint_blocks(data,printers_upperbound,M),
+#   aggregated_objective_vector(data,printers_upperbound), aggregated_solution_vector(data,printers_upperbound,solution): as
+#   above, for the aggregated formulation.
+#  -pack_printers(data,x,printers): p[s,j,i] of the prints x[s,i] on the given number of printers, for all the scenarios at once.
+#
+# -- Helpers --
+#  -size_gcd(values): greatest common divisor of the positive sizes (1 if none), used by the DPs to scale their capacities.
+#
+# ------------------------------------------------------------------------------------------------------------------------------------
+
+def variable_layout(data,printers_upperbound):
+    N,S,N_p,U=data.N,data.S,len(data.N_p),printers_upperbound
+    layout={"a":0,"a_b":N,"p":N+1}
+    layout["a_s"]=layout["p"]+S*U*N_p
+    layout["y"]=layout["a_s"]+S*N
+    layout["size"]=layout["y"]+U
+    return layout
+
+def _block(rows,cols,values,num_rows,num_cols):
+    return sp.csr_matrix((np.asarray(values,dtype=float),(np.asarray(rows),np.asarray(cols))),shape=(num_rows,num_cols))
+
+def constraint_blocks(data,printers_upperbound,M):
+    N,S,U=data.N,data.S,printers_upperbound
+    N_p=len(data.N_p)
+    layout=variable_layout(data,U)
+    size=layout["size"]
+    mask,position=data.get_printable_index()
+    printable=np.asarray(data.N_p,dtype=int)
+    a=layout["a"]+np.arange(N)
+    y=layout["y"]+np.arange(U)
+    a_s=layout["a_s"]+np.arange(S*N).reshape(S,N)
+    P=layout["p"]+np.arange(S*U*N_p).reshape(S,U,N_p)
+    blocks=list()
+
+    #Constraint (12) and Constraint (13)
+    for name,item_coef,b_coef,p_coef,rhs in (("(12)",data.w,data.w_b,data.w_p,data.W),("(13)",data.v,data.v_b,data.v_p,data.V)):
+        cols=np.concatenate([a,[layout["a_b"]],y])
+        values=np.concatenate([np.asarray(item_coef,dtype=float),[b_coef],np.full(U,p_coef,dtype=float)])
+        blocks.append((name,_block(np.zeros(len(cols),dtype=int),cols,values,1,size),np.array([rhs],dtype=float)))
+
+    #Constraint (14)
+    cols=np.concatenate([[layout["a_b"]],y])
+    values=np.concatenate([[1.0],np.full(U,-M,dtype=float)])
+    blocks.append(("(14)",_block(np.zeros(len(cols),dtype=int),cols,values,1,size),np.zeros(1)))
+
+    #Constraint (15) and Constraint (16): one row for each (scenario,item), P columns only for printable items
+    rows=np.arange(S*N).reshape(S,N)
+    p_rows=np.broadcast_to(rows[:,mask][:,None,:],(S,U,N_p))
+    p_cols=P[:,:,position[mask]]
+    blocks.append(("(15)-(16)",_block(np.concatenate([rows.ravel(),p_rows.ravel()]),np.concatenate([a_s.ravel(),p_cols.ravel()]),
+                   np.ones(S*N+S*U*N_p),S*N,size),np.asarray(data.demand,dtype=float).ravel()))
+
+    #Constraint (17)
+    blocks.append(("(17)",_block(np.concatenate([rows.ravel(),rows.ravel()]),np.concatenate([a_s.ravel(),np.tile(a,S)]),
+                   np.concatenate([np.ones(S*N),-np.ones(S*N)]),S*N,size),np.zeros(S*N)))
+
+    #Constraint (18)
+    m_for_printable=np.asarray(data.m,dtype=float)[printable]
+    rows=np.arange(S)
+    blocks.append(("(18)",_block(np.concatenate([np.repeat(rows,U*N_p),rows]),np.concatenate([P.ravel(),np.full(S,layout["a_b"])]),
+                   np.concatenate([np.tile(m_for_printable,S*U),-np.ones(S)]),S,size),np.zeros(S)))
+
+    #Constraint (19)
+    t_for_printable=np.asarray(data.t,dtype=float)[printable]
+    rows=np.arange(S*U)
+    blocks.append(("(19)",_block(np.concatenate([np.repeat(rows,N_p),rows]),np.concatenate([P.ravel(),np.tile(y,S)]),
+                   np.concatenate([np.tile(t_for_printable,S*U),np.full(S*U,-float(data.T))]),S*U,size),np.zeros(S*U)))
+
+    #Constraint (20)
+    rows=np.arange(U-1)
+    blocks.append(("(20)",_block(np.concatenate([rows,rows]),np.concatenate([y[1:],y[:-1]]),
+                   np.concatenate([np.ones(U-1),-np.ones(U-1)]),U-1,size),np.zeros(U-1)))
+    return blocks
+
+def objective_vector(data,printers_upperbound):
+    S,U=data.S,printers_upperbound
+    layout=variable_layout(data,U)
+    printable=np.asarray(data.N_p,dtype=int)
+    q=np.asarray(data.q,dtype=float)
+    r=np.asarray(data.r,dtype=float)
+    c=np.zeros(layout["size"])
+    c[layout["p"]:layout["a_s"]]=(q[:,None,None]*data.alpha*np.broadcast_to(r[printable],(S,U,len(printable)))).ravel()
+    c[layout["a_s"]:layout["y"]]=(q[:,None]*r[None,:]).ravel()
+    return c
+
+# Vector x of a Solution dict (keys a, a_b, p, a_s, y as returned by the solvers) in the layout of the columns. The solution can
+# have fewer printers than printers_upperbound (missing printers are not carried).
+def solution_vector(data,printers_upperbound,solution):
+    S,N_p,U=data.S,len(data.N_p),printers_upperbound
+    layout=variable_layout(data,U)
+    y=np.asarray(solution["y"],dtype=float)
+    P=np.asarray(solution["p"],dtype=float).reshape(S,len(y),N_p)
+    if len(y)>U and (y[U:].any() or P[:,U:].any()):
+        raise ValueError("The solution uses more printers than printers_upperbound")
+    x=np.zeros(layout["size"])
+    x[layout["a"]:layout["a_b"]]=solution["a"]
+    x[layout["a_b"]]=solution["a_b"]
+    p=np.zeros((S,U,N_p))
+    p[:,:min(U,len(y))]=P[:,:U]
+    x[layout["p"]:layout["a_s"]]=p.ravel()
+    x[layout["a_s"]:layout["y"]]=np.asarray(solution["a_s"],dtype=float).ravel()
+    x[layout["y"]:layout["y"]+min(U,len(y))]=y[:U]
+    return x
+
+def aggregated_variable_layout(data,printers_upperbound):
+    N,S,N_p=data.N,data.S,len(data.N_p)
+    layout={"a":0,"a_b":N,"x":N+1}
+    layout["a_s"]=layout["x"]+S*N_p
+    layout["n"]=layout["a_s"]+S*N
+    layout["size"]=layout["n"]+1
+    return layout
+
+def aggregated_constraint_blocks(data,printers_upperbound,M):
+    N,S=data.N,data.S
+    N_p=len(data.N_p)
+    layout=aggregated_variable_layout(data,printers_upperbound)
+    size=layout["size"]
+    mask,position=data.get_printable_index()
+    printable=np.asarray(data.N_p,dtype=int)
+    a=layout["a"]+np.arange(N)
+    n=layout["n"]
+    a_s=layout["a_s"]+np.arange(S*N).reshape(S,N)
+    X=layout["x"]+np.arange(S*N_p).reshape(S,N_p)
+    blocks=list()
+
+    #Constraint (12) and Constraint (13)
+    for name,item_coef,b_coef,p_coef,rhs in (("(12)",data.w,data.w_b,data.w_p,data.W),("(13)",data.v,data.v_b,data.v_p,data.V)):
+        cols=np.concatenate([a,[layout["a_b"],n]])
+        values=np.concatenate([np.asarray(item_coef,dtype=float),[b_coef,p_coef]])
+        blocks.append((name,_block(np.zeros(len(cols),dtype=int),cols,values,1,size),np.array([rhs],dtype=float)))
+
+    #Constraint (14)
+    blocks.append(("(14)",_block([0,0],[layout["a_b"],n],[1.0,-float(M)],1,size),np.zeros(1)))
+
+    #Constraint (15) and Constraint (16)
+    rows=np.arange(S*N).reshape(S,N)
+    x_rows=rows[:,mask]
+    x_cols=X[:,position[mask]]
+    blocks.append(("(15)-(16)",_block(np.concatenate([rows.ravel(),x_rows.ravel()]),np.concatenate([a_s.ravel(),x_cols.ravel()]),
+                   np.ones(S*N+S*N_p),S*N,size),np.asarray(data.demand,dtype=float).ravel()))
+
+    #Constraint (17)
+    blocks.append(("(17)",_block(np.concatenate([rows.ravel(),rows.ravel()]),np.concatenate([a_s.ravel(),np.tile(a,S)]),
+                   np.concatenate([np.ones(S*N),-np.ones(S*N)]),S*N,size),np.zeros(S*N)))
+
+    #Constraint (18)
+    m_for_printable=np.asarray(data.m,dtype=float)[printable]
+    rows=np.arange(S)
+    blocks.append(("(18)",_block(np.concatenate([np.repeat(rows,N_p),rows]),np.concatenate([X.ravel(),np.full(S,layout["a_b"])]),
+                   np.concatenate([np.tile(m_for_printable,S),-np.ones(S)]),S,size),np.zeros(S)))
+
+    #Constraint (19): total printing time of the n printers
+    t_for_printable=np.asarray(data.t,dtype=float)[printable]
+    blocks.append(("(19)",_block(np.concatenate([np.repeat(rows,N_p),rows]),np.concatenate([X.ravel(),np.full(S,n)]),
+                   np.concatenate([np.tile(t_for_printable,S),np.full(S,-float(data.T))]),S,size),np.zeros(S)))
+
+    #Bin packing constraints: units of item i on one printer, items that need a whole printer (only for items with t>0)
+    timed=np.flatnonzero(t_for_printable>0)
+    rows=np.arange(S*len(timed))
+    capacity=np.floor(float(data.T)/t_for_printable[timed])
+    blocks.append(("(19)-capacity",_block(np.concatenate([rows,rows]),np.concatenate([X[:,timed].ravel(),np.full(len(rows),n)]),
+                   np.concatenate([np.ones(len(rows)),-np.tile(capacity,S)]),len(rows),size),np.zeros(len(rows))))
+    # Dual feasible functions u_k of Fekete and Schepers (k=1..3): sum_i u_k(t[i])*x[s,i]<=T*n. With k=1 every unit longer than
+    # T/2 takes a whole printer.
+    rows=np.arange(S)
+    for k in range(1,4):
+        scaled=(k+1)*t_for_printable/max(float(data.T),1e-12)
+        u=np.where(np.isclose(scaled,np.round(scaled)),t_for_printable,np.floor(scaled+1e-9)*float(data.T)/k)
+        blocks.append(("(19)-dff"+str(k),_block(np.concatenate([np.repeat(rows,N_p),rows]),np.concatenate([X.ravel(),np.full(S,n)]),
+                       np.concatenate([np.tile(u,S),np.full(S,-float(data.T))]),S,size),np.zeros(S)))
+    return blocks
+
+def aggregated_objective_vector(data,printers_upperbound):
+    layout=aggregated_variable_layout(data,printers_upperbound)
+    printable=np.asarray(data.N_p,dtype=int)
+    q=np.asarray(data.q,dtype=float)
+    r=np.asarray(data.r,dtype=float)
+    c=np.zeros(layout["size"])
+    c[layout["x"]:layout["a_s"]]=(q[:,None]*data.alpha*r[None,printable]).ravel()
+    c[layout["a_s"]:layout["n"]]=(q[:,None]*r[None,:]).ravel()
+    return c
+
+def aggregated_solution_vector(data,printers_upperbound,solution):
+    layout=aggregated_variable_layout(data,printers_upperbound)
+    y=np.asarray(solution["y"],dtype=float)
+    x=np.zeros(layout["size"])
+    x[layout["a"]:layout["a_b"]]=solution["a"]
+    x[layout["a_b"]]=solution["a_b"]
+    x[layout["x"]:layout["a_s"]]=np.asarray(solution["p"],dtype=float).reshape(data.S,len(y),len(data.N_p)).sum(axis=1).ravel()
+    x[layout["a_s"]:layout["n"]]=np.asarray(solution["a_s"],dtype=float).ravel()
+    x[layout["n"]]=y.sum()
+    return x
+
+# First fit decreasing: the units are taken in decreasing order of t and each one goes to the first printer with enough time left.
+# All the units of an item are placed before the next item, so each printer takes min(units left, time left//t) of them.
+# Returns p[s,j,i] and the units of x that do not fit in the printers (all zero when the packing succeeds).
+def pack_printers(data,x,printers):
+    x=np.asarray(x,dtype=np.int64)
+    S,N_p=x.shape
+    t=np.asarray(data.t,dtype=np.int64)[np.asarray(data.N_p,dtype=int)]
+    p=np.zeros((S,printers,N_p),dtype=np.int64)
+    residual=x.copy()
+    time=np.full((S,printers),int(data.T),dtype=np.int64)
+    for item in np.argsort(-t,kind="stable"):
+        for printer in range(printers):
+            units=residual[:,item] if t[item]==0 else np.minimum(residual[:,item],time[:,printer]//t[item])
+            p[:,printer,item]=units
+            residual[:,item]-=units
+            time[:,printer]-=units*t[item]
+    return p,residual
+
+def size_gcd(values):
+    values=[int(value) for value in values if int(value)>0]
+    return math.gcd(*values) if len(values)>0 else 1
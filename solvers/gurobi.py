@@ -1,12 +1,37 @@
+import numpy as np
+import scipy.sparse as sp
 import gurobipy as gb
-import copy
 from solvers.solver import Solver
+from solvers.formulation import constraint_blocks, objective_vector, solution_vector, variable_layout
+from solvers.formulation import aggregated_constraint_blocks, aggregated_objective_vector, aggregated_solution_vector, aggregated_variable_layout
+from solvers.heuristic import HeuristicSolver
+from solvers.metrics import SolveMetrics
+from timeit import default_timer as timer
 
 # ---------------------------------------------------------- Solver class -----------------------------------------------------------
 # 
 # This class implement the TSS-3DKP formulation defined in https://www.sciencedirect.com/science/article/pii/S0305054821001337 
 # with Gurobi. In order to initialise an object of the class we need to pass an instance of the managers.data.Data class. 
 # In addition we can set a maximum execution time with "max_time" (s) and explicit a gap value to limit the MIP solver with "MIPGap".
+# The number of threads used by Gurobi can be limited with "threads" (default: all the available cores).
+# The "builder" argument selects how the model is built:
+#   - "loop": constraints are added one at a time (original implementation).
+#   - "matrix": constraints (12)-(20) are added by family with the Gurobi matrix API, using the sparse matrices of
+#               solvers.formulation. The model is the same as the "loop" one (same variables, names and constraints).
+# The "formulation" argument selects the model:
+#   - "standard": the formulation of the paper, with one binary y[p] and the prints p[s,p,i] of each printer.
+#   - "aggregated": the number of printers n and the total prints x[s,i] of each scenario, without the symmetric solutions of
+#                   the identical printers (see solvers.formulation). It is always built with the matrix API. The prints are
+#                   assigned to the printers after the solve, so the Solution has the same keys. The aggregated time
+#                   constraints are a relaxation: when the prints of a scenario cannot be packed on the printers, the standard
+#                   model is solved starting from the repaired solution and bounded by the aggregated one (self.fallback), so
+#                   the result is always the one of the standard formulation. update_parameters is not available for this formulation.
+# With second_stage_solution=False the Solution returned by solve() contains only the first stage (a, a_b, y), e.g. when only the
+# aggregate values of the output are needed.
+# With metrics=True the output of solve() has a "Metrics" dict (solvers.metrics): time to build the model, incumbent/bound trace
+# over time, peak memory during the solve and the time spent to collect them.
+# A MIP start can be given with "start": a Solution dict (as the one returned by solve()) or "heuristic" to compute it with
+# solvers.heuristic.HeuristicSolver.
 # 
 # -- Parent Class --
 #   The class Gurobi Solver inherit some methods from the abstract class "Solver" (solvers.solver.Solver)
@@ -22,22 +47,49 @@ from solvers.solver import Solver
 #            - Cuts: Number of cuts performed by the B&C algorithm during the optimization.
 #            - Runtime: Total run time of the optimization.
 #            - Mipgap: MIPGap value of the solver at the termination of the optimization. 
-#            - Solution: Solution found as dict. The dict contains the following keys:
+#            - Solution: Solution found as dict of NumPy arrays. The dict contains the following keys:
 #                        - a: vector of the quantities of the items carried.
 #                        - a_b: units of printing materials carried.
 #                        - p: matrix [s,p,i] -> Define how many items (i) will be printed by printer (p) in the scenario (s)
 #                        - a_s: matrix [s,i] -> Define how many items (i) will be used in scenario (s) (a_s[s,i]=min(a[i],demand[s,i])
 #                        - y: binary vector. y[i]=1 if we bring printer (i), else y[i]=0.
+#  -set_start(solution): set the Start attributes of the variables from a Solution dict, or from the heuristic with "heuristic".
+#  -update_parameters(**parameters): change alpha, r, w, v, w_p, v_p, w_b, v_b, m, T, W, V or demand in the built model (objective
+#            and constraint coefficients, right hand sides) instead of building a new one. The solver works on a view (Data.with_params) of
+#            the Data instance with the new values; the previous solution is set as MIP start of the next solve(). A ValueError
+#            is raised if the new parameters need more printers than printers_upperbound.
 #  -print_solution(): print the solution found. Must be called after solve() method.
 
 # ------------------------------------------------------------------------------------------------------------------------------------
 
+#From: https://www.gurobi.com/documentation/9.5/refman/optimization_status_codes.html
+STATUS ={   1: 'LOADED', 2: 'OPTIMAL', 3: 'INFEASIBLE', 4: 'INF_OR_UNBD',
+            5: 'UNBOUNDED', 6: 'CUTOFF', 7: 'ITERATION_LIMIT', 8: 'NODE_LIMIT',
+            9: 'TIME_LIMIT', 10: 'SOLUTION_LIMIT', 11: 'INTERRUPTED', 12: 'NUMERIC', 
+            13: 'SUBOPTIMAL', 14: 'INPROGRESS', 15: 'USER_OBJ_LIMIT'} 
+
 class GurobiSolver(Solver):
-    def __init__(self,data_instance,max_time=None, log=False, MIPGap=None, printers_upperbound=None):
+    def __init__(self,data_instance,max_time=None, log=False, MIPGap=None, printers_upperbound=None, builder="loop", threads=None, start=None, second_stage_solution=True, formulation="standard", metrics=False):
         
         Solver.__init__(self,data_instance,printers_upperbound)
+        if builder not in ("loop","matrix"):
+            raise ValueError("Unknown builder: "+str(builder))
+        if formulation not in ("standard","aggregated"):
+            raise ValueError("Unknown formulation: "+str(formulation))
+        self.formulation=formulation
+        self.fallback=None
+        self.max_time,self.log,self.MIPGap=max_time,log,MIPGap
+        self.builder=builder
+        self.threads=threads
+        self.second_stage_solution=second_stage_solution
         self.M=int(min(data_instance.W/data_instance.w_b,data_instance.V/data_instance.v_b)+2)
+        self.metrics=metrics
+        start_time=timer()
         self._model_generator()
+        # Gurobi applies the pending modifications lazily: the update is part of the build
+        self.model.update()
+        self.build_time=timer()-start_time
+        self._metrics=None
         if log:
             _=self.model.setParam('OutputFlag',1)  
 
@@ -45,24 +97,42 @@ class GurobiSolver(Solver):
             _=self.model.setParam('TimeLimit', max_time)
         if MIPGap is not None:
             _=self.model.setParam('MIPGap',MIPGap)
+        if threads is not None:
+            _=self.model.setParam('Threads',threads)
+        if start is not None:
+            self.set_start(start)
 
+    # The variables of both builders are in the order of solvers.formulation.variable_layout
+    def set_start(self,solution):
+        if isinstance(solution,str) and solution=="heuristic":
+            solution=HeuristicSolver(self.data_instance,printers_upperbound=self.printers_upperbound,lp_bound=False).solve()["Solution"]
+        vector=aggregated_solution_vector if self.formulation=="aggregated" else solution_vector
+        self.model.setAttr("Start",self._variable_handles()["all"],vector(self.data_instance,self.printers_upperbound,solution).tolist())
 
+    # All the values are read with a single getAttr call on the variable handles; with second_stage_solution=False only a, a_b
+    # and y are read and the Solution has no "p" and "a_s".
     def _get_output(self):
-        Solution= {
-            "a":[ int(self.model.getVarByName("a["+str(i)+"]").X) for i in range(self.data_instance.N)], #self.model.getVarByName('A'),
-            "a_b":int(self.model.getVarByName("a_b").X),
-            "p":[[[int(self.model.getVarByName("p["+str(s)+","+str(p)+","+str(i)+"]").X) for i in range(len(self.data_instance.N_p))] for p in range(self.printers_upperbound)]for s in range(self.data_instance.S) ],
-            "a_s":[[int(self.model.getVarByName("a_s["+str(s)+","+str(i)+"]").X) for i in range(self.data_instance.N)] for s in range(self.data_instance.S)],
-            "y":[int(self.model.getVarByName("y["+str(p)+"]").X) for p in range(self.printers_upperbound)]      
-        }      
-        #From: https://www.gurobi.com/documentation/9.5/refman/optimization_status_codes.html
-        Status ={   1: 'LOADED', 2: 'OPTIMAL', 3: 'INFEASIBLE', 4: 'INF_OR_UNBD',
-                    5: 'UNBOUNDED', 6: 'CUTOFF', 7: 'ITERATION_LIMIT', 8: 'NODE_LIMIT',
-                    9: 'TIME_LIMIT', 10: 'SOLUTION_LIMIT', 11: 'INTERRUPTED', 12: 'NUMERIC', 
-                    13: 'SUBOPTIMAL', 14: 'INPROGRESS', 15: 'USER_OBJ_LIMIT'} 
+        if self.fallback is not None:
+            output=self.fallback._get_output()
+            output["Nodes"]+=int(self.model.NodeCount)
+            output["Runtime"]=round(output["Runtime"]+float(self.model.Runtime),2)
+            return output
+        if self.formulation=="aggregated":
+            return self._aggregated_output()
+        variables=self._variable_handles()
+        data=self.data_instance
+        S,N,N_p,U=data.S,data.N,len(data.N_p),self.printers_upperbound
+        if self.second_stage_solution:
+            values=np.rint(self.model.getAttr("X",variables["all"])).astype(int)
+            layout=variable_layout(data,U)
+            Solution={"a":values[layout["a"]:layout["a_b"]],"a_b":int(values[layout["a_b"]]),"p":values[layout["p"]:layout["a_s"]].reshape(S,U,N_p),
+                      "a_s":values[layout["a_s"]:layout["y"]].reshape(S,N),"y":values[layout["y"]:layout["size"]]}
+        else:
+            values=np.rint(self.model.getAttr("X",variables["first_stage"])).astype(int)
+            Solution={"a":values[:N],"a_b":int(values[N]),"y":values[N+1:]}
         output = {
             "StatusCode":int(self.model.status),
-            "Status":Status[self.model.status],
+            "Status":STATUS[self.model.status],
             "ObjValue":round(float(self.model.ObjVal),2),
             "Solutions":int(self.model.SolCount),
             "Nodes":int(self.model.NodeCount),
@@ -70,74 +140,175 @@ class GurobiSolver(Solver):
             "Runtime":round(float(self.model.Runtime),2),
             "MIPGap": float('{:0.2e}'.format(float(self.model.MIPGap),2)),
             "Solution": Solution,
-            "Printers": Solution["y"].count(1)
+            "Printers": int(Solution["y"].sum())
         }
+        if self._metrics is not None:
+            output["Metrics"]=self._metrics.output(self.model)
         return output
     
-    def solve(self):
-        self.model._cut_count=0
-        _=self.model.optimize(GurobiSolver.__cut_counter)
-        return self._get_output()
+    # The prints x[s,i] are packed on the n printers (solvers.evaluation.pack_aggregated_solution, imported here since that module
+    # imports GurobiSolver); the value lost by the scenarios that cannot be packed is removed from ObjValue.
+    def _aggregated_output(self,second_stage_solution=None):
+        from solvers.evaluation import pack_aggregated_solution
+        data=self.data_instance
+        S,N,N_p,U=data.S,data.N,len(data.N_p),self.printers_upperbound
+        layout=aggregated_variable_layout(data,U)
+        values=np.rint(self.model.getAttr("X",self._variable_handles()["all"])).astype(int)
+        printers=int(values[layout["n"]])
+        a=values[layout["a"]:layout["a_b"]]
+        p,a_s,lost=pack_aggregated_solution(data,a,values[layout["a_b"]],printers,values[layout["x"]:layout["a_s"]].reshape(S,N_p),values[layout["a_s"]:layout["n"]].reshape(S,N))
+        obj_value=float(self.model.ObjVal)-lost
+        status=int(self.model.status) if lost<=1e-6 else 13
+        gap=float(self.model.MIPGap) if lost<=1e-6 else abs(float(self.model.ObjBound)-obj_value)/max(abs(obj_value),1e-10)
+        Solution={"a":a,"a_b":int(values[layout["a_b"]]),"y":(np.arange(U)<printers).astype(int)}
+        if self.second_stage_solution if second_stage_solution is None else second_stage_solution:
+            Solution["p"]=np.zeros((S,U,N_p),dtype=int)
+            Solution["p"][:,:printers]=p
+            Solution["a_s"]=a_s
+        output = {
+            "StatusCode":status,
+            "Status":STATUS[status],
+            "ObjValue":round(obj_value,2),
+            "Solutions":int(self.model.SolCount),
+            "Nodes":int(self.model.NodeCount),
+            "Cuts":int(self.model._cut_count),
+            "Runtime":round(float(self.model.Runtime),2),
+            "MIPGap": float('{:0.2e}'.format(gap)),
+            "Solution": Solution,
+            "Printers": printers
+        }
+        if self._metrics is not None:
+            output["Metrics"]=self._metrics.output(self.model)
+        return output
 
-    def wait_and_see_obj_value(self):
-        S=self.data_instance.S
-        ws_obj=0
-        for scenario in range(S):
-            data_instance=copy.deepcopy(self.data_instance)
-            data_instance.set_only_one_scenario(scenario)
-            ws_obj=ws_obj+GurobiSolver(data_instance, MIPGap=0.001).solve()["ObjValue"]*self.data_instance.q[scenario]
-        return ws_obj
-    
-    def EEVS_obj_value(self,log=False):
-        data_instance=copy.deepcopy(self.data_instance)
-        data_instance.set_only_expected_scenario()
-        solution=GurobiSolver(data_instance, MIPGap=0.001).solve()
-
-        num_of_printers=solution["Printers"]
-        a=solution["Solution"]["a"]
-        a_b=solution["Solution"]["a_b"]
-        second_stage_problem= gb.Model()
-        if not log:
-            _=second_stage_problem.setParam('OutputFlag',0)
-            
-        second_stage_problem.modelSense=gb.GRB.MAXIMIZE
-        data= self.data_instance
-        P=second_stage_problem.addVars([(s,p,i) for s in range(data.S) for p in range(num_of_printers) for i in range(len(data.N_p))],vtype=gb.GRB.INTEGER,name="p")
-        A_s=second_stage_problem.addVars([(s,i) for s in range(data.S) for i in range(data.N)],vtype=gb.GRB.INTEGER,name="a_s")
+    # Variables and constraints of the model grouped by family, in the shape of their indexes (e.g. (19): [s,p]). Both builders
+    # create the variables in the order of solvers.formulation.variable_layout; the loop builder adds the constraints of each
+    # scenario together ((15)/(16) and (17) for every item, (18), (19) for every printer), the matrix builder by family.
+    def _variable_handles(self):
+        if getattr(self,"_variables",None) is None and self.formulation=="aggregated":
+            self.model.update()
+            self._variables={"all":self.model.getVars()}
+        if getattr(self,"_variables",None) is None:
+            self.model.update()
+            data=self.data_instance
+            N,S,N_p,U=data.N,data.S,len(data.N_p),self.printers_upperbound
+            layout=variable_layout(data,U)
+            all_variables=self.model.getVars()
+            variables=np.array(all_variables,dtype=object)
+            self._variables={"a":variables[layout["a"]:layout["a_b"]],"a_b":variables[layout["a_b"]],
+                             "p":variables[layout["p"]:layout["a_s"]].reshape(S,U,N_p),"a_s":variables[layout["a_s"]:layout["y"]].reshape(S,N),
+                             "y":variables[layout["y"]:layout["size"]],"all":all_variables,
+                             "first_stage":all_variables[layout["a"]:layout["p"]]+all_variables[layout["y"]:layout["size"]]}
+        return self._variables
 
- 
-        for scenario in range(data.S):
-            for item in range(data.N): 
-                if item not in data.N_p: 
-                    #Constraint (5)
-                    second_stage_problem.addConstr(A_s[scenario,item]<=data.demand[scenario,item])
-                else: 
-                    #Constraint (6)
-                    second_stage_problem.addConstr(A_s[scenario,item]+gb.quicksum([P[scenario,p,data.N_p.index(item)] for p in range(num_of_printers)])<=data.demand[scenario,item])
-                    
-            #Constraint (7)
-            for item in range(data.N):
-                second_stage_problem.addConstr(A_s[scenario,item]<=a[item])
- 
-        m_for_printable=list(filter(lambda item: item is not None, [data.m[indx] if indx in data.N_p else None for indx in range(data.N)]))
-        t_for_printable=list(filter(lambda item: item is not None, [data.t[indx] if indx in data.N_p else None for indx in range(data.N)]))
+    def _handles(self):
+        if getattr(self,"_rows",None) is not None:
+            return self._variables,self._rows
+        self._variable_handles()
+        data=self.data_instance
+        N,S,U=data.N,data.S,self.printers_upperbound
+        constrs=np.array(self.model.getConstrs(),dtype=object)
+        if self.builder=="matrix":
+            sizes={"(12)":1,"(13)":1,"(14)":1,"(15)-(16)":S*N,"(17)":S*N,"(18)":S,"(19)":S*U,"(20)":U-1}
+            offsets=np.cumsum([0]+list(sizes.values()))
+            rows={name:constrs[offsets[indx]:offsets[indx+1]] for indx,name in enumerate(sizes)}
+        else:
+            scenarios=constrs[3:3+S*(2*N+1+U)].reshape(S,2*N+1+U)
+            rows={"(12)":constrs[0:1],"(13)":constrs[1:2],"(14)":constrs[2:3],"(15)-(16)":scenarios[:,0:2*N:2],"(17)":scenarios[:,1:2*N:2],
+                  "(18)":scenarios[:,2*N],"(19)":scenarios[:,2*N+1:],"(20)":constrs[3+S*(2*N+1+U):]}
+        shapes={"(15)-(16)":(S,N),"(17)":(S,N),"(19)":(S,U)}
+        self._rows={name:constr.reshape(shapes[name]) if name in shapes else constr for name,constr in rows.items()}
+        return self._variables,self._rows
 
-        for scenario in range(data.S):
-            #Constraint (8)
-            second_stage_problem.addConstr(gb.quicksum([gb.quicksum([P[scenario,p,i]*m_for_printable[i] for i in range(len(data.N_p))]) for p in range(num_of_printers)])<=a_b)
-            #Constraint (9)
-            for printer in range(num_of_printers):
-                second_stage_problem.addConstr(gb.quicksum([P[scenario,printer,i]*t_for_printable[i] for i in range(len(data.N_p))])<=data.T)
-        
-        #Objective Function
-        r_for_printable=list(filter(lambda item: item is not None, [data.r[indx] if indx in data.N_p else None for indx in range(data.N)]))
-        second_stage_problem.setObjective(gb.quicksum([data.q[s]*(gb.quicksum([A_s[s,i]*data.r[i] for i in range(data.N)])+ gb.quicksum([(gb.quicksum([(data.alpha*P[s,j,i]*r_for_printable[i])  for i in range(len(r_for_printable))])) for j in range(num_of_printers)]))for s in range(data.S)]))
+    def update_parameters(self,**parameters):
+        names={"alpha","r","w","v","w_p","v_p","w_b","v_b","m","T","W","V","demand"}
+        if not set(parameters)<=names:
+            raise ValueError("Unknown parameters: "+str(sorted(set(parameters)-names)))
+        if self.formulation=="aggregated":
+            raise ValueError("update_parameters is available only for the standard formulation")
+        variables,rows=self._handles()
+        start=self.model.getAttr("X",variables["all"]) if self.model.SolCount>0 else None
+        data=self.data_instance.with_params(**parameters)
+        printers=Solver.smart_upperbound(data)
+        if printers>self.printers_upperbound:
+            raise ValueError("The new parameters need "+str(printers)+" printers, the model has "+str(self.printers_upperbound)+": build it with a greater printers_upperbound")
+        self.data_instance=data
+        model,U=self.model,self.printers_upperbound
+        printable=np.asarray(data.N_p,dtype=int)
+        q=np.asarray(data.q,dtype=float)
+        r=np.asarray(data.r,dtype=float)
+        #Objective function
+        if {"alpha","r"}&set(parameters):
+            model.setAttr("Obj",variables["p"].ravel().tolist(),(q[:,None,None]*data.alpha*np.broadcast_to(r[printable],(data.S,U,len(printable)))).ravel().tolist())
+            model.setAttr("Obj",variables["a_s"].ravel().tolist(),(q[:,None]*r[None,:]).ravel().tolist())
+        #Constraint (12) and Constraint (13)
+        for constr,rhs,item_coef,b_coef,p_coef,changed in ((rows["(12)"][0],"W","w","w_b","w_p",("W","w","w_b","w_p")),(rows["(13)"][0],"V","v","v_b","v_p",("V","v","v_b","v_p"))):
+            if rhs in parameters:
+                constr.RHS=float(getattr(data,rhs))
+            if item_coef in parameters:
+                for var,coef in zip(variables["a"],np.asarray(getattr(data,item_coef),dtype=float)):
+                    model.chgCoeff(constr,var,coef)
+            if b_coef in parameters:
+                model.chgCoeff(constr,variables["a_b"],float(getattr(data,b_coef)))
+            if p_coef in parameters:
+                for var in variables["y"]:
+                    model.chgCoeff(constr,var,float(getattr(data,p_coef)))
+        #Constraint (14): M depends on W, V, w_b and v_b
+        M=int(min(data.W/data.w_b,data.V/data.v_b)+2)
+        if M!=self.M:
+            self.M=M
+            for var in variables["y"]:
+                model.chgCoeff(rows["(14)"][0],var,-float(M))
+        #Constraint (15) and Constraint (16)
+        if "demand" in parameters:
+            model.setAttr("RHS",rows["(15)-(16)"].ravel().tolist(),np.asarray(data.demand,dtype=float).ravel().tolist())
+        #Constraint (18)
+        if "m" in parameters:
+            m=np.asarray(data.m,dtype=float)[printable]
+            for scenario in range(data.S):
+                for var,coef in zip(variables["p"][scenario].ravel(),np.tile(m,U)):
+                    model.chgCoeff(rows["(18)"][scenario],var,coef)
+        #Constraint (19)
+        if "T" in parameters:
+            for scenario in range(data.S):
+                for printer in range(U):
+                    model.chgCoeff(rows["(19)"][scenario,printer],variables["y"][printer],-float(data.T))
+        # The previous solution is the MIP start of the next solve (Gurobi repairs it if it is no longer feasible)
+        if start is not None:
+            model.setAttr("Start",variables["all"],start)
+        model.update()
 
-        second_stage_problem.optimize()
+    def solve(self):
+        self.model._cut_count=0
+        self.fallback=None
+        self._metrics=self.model._metrics=SolveMetrics(self.build_time) if self.metrics else None
+        _=self.model.optimize(GurobiSolver.__callback)
+        if self.formulation=="aggregated" and self.model.SolCount>0:
+            output=self._aggregated_output(second_stage_solution=True)
+            if output["StatusCode"]==13:
+                max_time=None if self.max_time is None else max(self.max_time-float(self.model.Runtime),1)
+                self.fallback=GurobiSolver(self.data_instance,max_time=max_time,log=self.log,MIPGap=self.MIPGap,printers_upperbound=self.printers_upperbound,
+                                           builder="matrix",threads=self.threads,start=output["Solution"],second_stage_solution=self.second_stage_solution,metrics=self.metrics)
+                # The bound of the aggregated model is valid for the standard model
+                self.fallback.model.addMConstr(sp.csr_matrix(objective_vector(self.data_instance,self.printers_upperbound)[None,:]),None,gb.GRB.LESS_EQUAL,np.array([float(self.model.ObjBound)]))
+                self.fallback.solve()
+        return self._get_output()
 
-        return round(float(second_stage_problem.ObjVal),2)
+    # Wait & See and EEVS values are computed by solvers.evaluation.StochasticEvaluator, which reuses one model for all the
+    # scenarios instead of building a new solver for each of them (imported here since that module imports GurobiSolver).
+    def wait_and_see_obj_value(self,workers=1):
+        from solvers.evaluation import StochasticEvaluator
+        return StochasticEvaluator(self.data_instance,MIPGap=0.001,workers=workers,threads=self.threads).wait_and_see_obj_value()
+    
+    def EEVS_obj_value(self,log=False,workers=1):
+        from solvers.evaluation import StochasticEvaluator
+        return StochasticEvaluator(self.data_instance,MIPGap=0.001,workers=workers,threads=self.threads).EEVS_obj_value(log=log)
 
     def _model_generator(self):
+        if self.formulation=="aggregated":
+            return self._aggregated_model_generator()
+        if self.builder=="matrix":
+            return self._matrix_model_generator()
  
         two_stage_stoc_knapsack= gb.Model()
         two_stage_stoc_knapsack.setParam('OutputFlag',0)      
@@ -195,12 +366,53 @@ class GurobiSolver(Solver):
             for j in range(self.printers_upperbound)]))for s in range(data.S)]))
 
         self.model=two_stage_stoc_knapsack
+
+    # Same model of _model_generator, built with the Gurobi matrix API. Variables are added in the same order and with the same
+    # names; every family of constraints is a single addMConstr call and the handles are kept in self.constraints.
+    def _matrix_model_generator(self):
+        two_stage_stoc_knapsack= gb.Model()
+        two_stage_stoc_knapsack.setParam('OutputFlag',0)
+        data= self.data_instance
+        U=self.printers_upperbound
+        #Variables definition 1 stage + Constraint (22)+ Constraint (23)
+        two_stage_stoc_knapsack.addMVar(data.N,vtype=gb.GRB.INTEGER, name='a')
+        two_stage_stoc_knapsack.addVar(vtype=gb.GRB.INTEGER,name="a_b")
+        #Variable definition 2 stage + Constraint (24) + Constraint (25):
+        two_stage_stoc_knapsack.addMVar((data.S,U,len(data.N_p)),vtype=gb.GRB.INTEGER,name="p")
+        two_stage_stoc_knapsack.addMVar((data.S,data.N),vtype=gb.GRB.INTEGER,name="a_s")
+        #Variable definition for the equivalent formulation + Constraint(21):
+        two_stage_stoc_knapsack.addMVar(U,vtype=gb.GRB.BINARY,name="y")
+        #Constraints (12)-(20)
+        self.constraints=dict()
+        for name,A,b in constraint_blocks(data,U,self.M):
+            self.constraints[name]=two_stage_stoc_knapsack.addMConstr(A,None,gb.GRB.LESS_EQUAL,b)
+        #Objective function:
+        two_stage_stoc_knapsack.setMObjective(None,objective_vector(data,U),0.0,sense=gb.GRB.MAXIMIZE)
+        two_stage_stoc_knapsack.update()
+        self.model=two_stage_stoc_knapsack
         
-    # Cut counter callback for B&C algorithm. From: https://groups.google.com/g/gurobi/c/cHzpcT-3rPk
-    def __cut_counter(model, where):
-        cut_names = {'Clique:', 'Cover:', 'Flow cover:', 'Flow path:', 'Gomory:', 'GUB cover:', 'Inf proof:', 'Implied bound:', 'Lazy constraints:', 'Learned:', 'MIR:', 'Mod-K:', 'Network:', 'Projected Implied bound:', 'StrongCG:', 'User:', 'Zero half:'}
-        if where == gb.GRB.Callback.MESSAGE:
-            # Message callback
-            msg = model.cbGet(gb.GRB.Callback.MSG_STRING)
-            if any(name in msg for name in cut_names):
-                model._cut_count += int(msg.split(':')[1])
\ No newline at end of file
+    # Aggregated formulation of solvers.formulation: n printers (integer, at most printers_upperbound) and prints x[s,i]
+    def _aggregated_model_generator(self):
+        two_stage_stoc_knapsack= gb.Model()
+        two_stage_stoc_knapsack.setParam('OutputFlag',0)
+        data= self.data_instance
+        U=self.printers_upperbound
+        two_stage_stoc_knapsack.addMVar(data.N,vtype=gb.GRB.INTEGER, name='a')
+        two_stage_stoc_knapsack.addVar(vtype=gb.GRB.INTEGER,name="a_b")
+        two_stage_stoc_knapsack.addMVar((data.S,len(data.N_p)),vtype=gb.GRB.INTEGER,name="x")
+        two_stage_stoc_knapsack.addMVar((data.S,data.N),vtype=gb.GRB.INTEGER,name="a_s")
+        two_stage_stoc_knapsack.addVar(ub=U,vtype=gb.GRB.INTEGER,name="n")
+        self.constraints=dict()
+        for name,A,b in aggregated_constraint_blocks(data,U,self.M):
+            self.constraints[name]=two_stage_stoc_knapsack.addMConstr(A,None,gb.GRB.LESS_EQUAL,b)
+        two_stage_stoc_knapsack.setMObjective(None,aggregated_objective_vector(data,U),0.0,sense=gb.GRB.MAXIMIZE)
+        two_stage_stoc_knapsack.update()
+        self.model=two_stage_stoc_knapsack
+
+    # Callback of the B&C algorithm: the number of cutting planes applied is read in the MIP callback (MIP_CUTCNT) and the trace of
+    # solvers.metrics is recorded when metrics=True
+    def __callback(model, where):
+        if where == gb.GRB.Callback.MIP:
+            model._cut_count = int(model.cbGet(gb.GRB.Callback.MIP_CUTCNT))
+        if model._metrics is not None:
+            model._metrics.callback(model, where)
@@ -0,0 +1,210 @@
+import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import linprog
+from timeit import default_timer as timer
+from solvers.solver import Solver
+from solvers.formulation import constraint_blocks, objective_vector, variable_layout
+
+# ------------------------------------------------------- Heuristic solver -----------------------------------------------------------
+#
+# This class finds a good feasible solution of the TSS-3DKP in a fraction of the time of the MIP, to be used alone or as MIP start
+# of GurobiSolver/XPressSolver (argument "start").
+#  - Construction: for each number of printers n in 0..printers_upperbound and each material a_b on a grid, the items are taken
+#    unit by unit in order of expected marginal revenue r[i]*P(demand[i]>=k) over their normalized size w[i]/W+v[i]/V, while they
+#    fit in the capacity left by the printers and the material.
+#  - Second stage: in every scenario the carried items are used first (a_s=min(a,demand)), then the residual demand of the
+#    printable items is printed greedily, printer after printer, in order of alpha*r[i] over normalized time and material. All the
+#    scenarios are processed at once as NumPy arrays.
+#  - Local search: starting from the best construction, first improvement moves that remove a unit of an item (or some material)
+#    and refill the knapsack greedily with the other items, until no move improves or "max_iterations"/"max_time" are reached.
+# The quality of the solution is measured against the LP relaxation of the deterministic equivalent (solved with scipy/HiGHS).
+#
+# -- Parent Class --
+#   The class HeuristicSolver inherit some methods from the abstract class "Solver" (solvers.solver.Solver)
+#
+# -- Methods --
+#  -solve(): find the solution and retrieve a dict with the same keys of GurobiSolver.solve(). MIPGap is the gap with the LP bound
+#            (None with lp_bound=False), Solutions the number of solutions evaluated, Nodes and Cuts are 0.
+#  -print_solution(): print the solution found. Must be called after solve() method.
+#
+# -- Functions --
+#  -lp_relaxation_bound(data,printers_upperbound,M): value of the LP relaxation of the deterministic equivalent.
+#
+# ------------------------------------------------------------------------------------------------------------------------------------
+
+def lp_relaxation_bound(data,printers_upperbound,M):
+    blocks=constraint_blocks(data,printers_upperbound,M)
+    A=sp.vstack([A for _,A,_ in blocks],format="csr")
+    b=np.concatenate([b for _,_,b in blocks])
+    layout=variable_layout(data,printers_upperbound)
+    upper=np.full(layout["size"],np.inf)
+    upper[layout["y"]:]=1
+    result=linprog(-objective_vector(data,printers_upperbound),A_ub=A,b_ub=b,bounds=np.stack([np.zeros(layout["size"]),upper],axis=1),method="highs")
+    return float(-result.fun)
+
+class HeuristicSolver(Solver):
+
+    def __init__(self,data_instance,printers_upperbound=None,a_b_grid=8,max_iterations=100,max_time=None,lp_bound=True):
+        Solver.__init__(self,data_instance,printers_upperbound)
+        self.M=int(min(data_instance.W/data_instance.w_b,data_instance.V/data_instance.v_b)+2)
+        self.a_b_grid=a_b_grid
+        self.max_iterations=max_iterations
+        self.max_time=max_time
+        self.lp_bound=lp_bound
+        self._model_generator()
+
+    # Arrays used by the construction and by the evaluation of the solutions
+    def _model_generator(self):
+        data=self.data_instance
+        self.printable=np.asarray(data.N_p,dtype=int)
+        self.demand=np.asarray(data.demand)
+        self.q=np.asarray(data.q,dtype=float)
+        self.r=np.asarray(data.r,dtype=float)
+        self.w,self.v=np.asarray(data.w,dtype=float),np.asarray(data.v,dtype=float)
+        self.m,self.t=np.asarray(data.m,dtype=float)[self.printable],np.asarray(data.t,dtype=float)[self.printable]
+        # Marginal expected revenue of the k-th unit of each item: marginal[i,k-1]=r[i]*P(demand[i]>=k)
+        max_units=int(self.demand.max()) if self.demand.size>0 else 0
+        self.marginal=self.r[:,None]*np.stack([self.q@(self.demand>=k) for k in range(1,max_units+1)],axis=1) if max_units>0 else np.zeros((data.N,0))
+        size=self.w/max(data.W,1)+self.v/max(data.V,1)
+        self.score=self.marginal/np.where(size>0,size,1e-12)[:,None]
+        self.max_material=float(np.dot(self.m,self.demand[:,self.printable].max(axis=0))) if len(self.printable)>0 else 0.0
+        self.model=None
+
+    # Complete the first stage "a" with the units of the items (except "excluded") in order of score, while they fit
+    def _greedy_first_stage(self,weight,volume,a=None,excluded=None):
+        a=np.zeros(self.data_instance.N,dtype=int) if a is None else a.copy()
+        items,units=np.nonzero(self.marginal>0)
+        keep=units>=a[items]
+        if excluded is not None:
+            keep&=items!=excluded
+        items,units=items[keep],units[keep]
+        order=np.argsort(-self.score[items,units],kind="stable")
+        weight,volume=weight-np.dot(self.w,a),volume-np.dot(self.v,a)
+        for item in items[order]:
+            if self.w[item]<=weight and self.v[item]<=volume:
+                a[item]+=1
+                weight,volume=weight-self.w[item],volume-self.v[item]
+        return a
+
+    # Greedy printing of the residual demand of every scenario with n printers and a_b material. Returns p[s,j,i] and the printing
+    # revenue of each scenario.
+    def _greedy_printing(self,residual,a_b,printers):
+        data=self.data_instance
+        S,N_p=residual.shape
+        P=np.zeros((S,printers,N_p),dtype=int)
+        if printers==0 or N_p==0:
+            return P,np.zeros(S)
+        values=data.alpha*self.r[self.printable]
+        order=np.argsort(-values/(self.t/max(data.T,1e-12)+self.m/max(a_b,1)),kind="stable")
+        residual=residual.copy()
+        material=np.full(S,float(a_b))
+        for printer in range(printers):
+            time=np.full(S,float(data.T))
+            for item in order:
+                x=residual[:,item].astype(float)
+                if self.t[item]>0:
+                    x=np.minimum(x,np.floor(time/self.t[item]+1e-9))
+                if self.m[item]>0:
+                    x=np.minimum(x,np.floor(material/self.m[item]+1e-9))
+                x=np.maximum(x,0).astype(int)
+                P[:,printer,item]=x
+                residual[:,item]-=x
+                time-=x*self.t[item]
+                material-=x*self.m[item]
+        return P,P.sum(axis=1)@values
+
+    def _evaluate(self,a,a_b,printers):
+        a_s=np.minimum(a[None,:],self.demand)
+        P,printing=self._greedy_printing(self.demand[:,self.printable]-a_s[:,self.printable],a_b,printers)
+        self.evaluated+=1
+        return float(self.q@(a_s@self.r+printing)),(a,a_b,printers,P,a_s)
+
+    def _capacity(self,a_b,printers):
+        data=self.data_instance
+        return data.W-printers*data.w_p-a_b*data.w_b,data.V-printers*data.v_p-a_b*data.v_b
+
+    def _max_a_b(self,printers):
+        data=self.data_instance
+        weight,volume=self._capacity(0,printers)
+        return int(min([capacity//unit for capacity,unit in ((weight,data.w_b),(volume,data.v_b)) if unit>0]+[np.ceil(self.max_material)]))
+
+    def _construct(self):
+        best_value,best=-np.inf,None
+        for printers in range(self.printers_upperbound+1):
+            weight,volume=self._capacity(0,printers)
+            if weight<0 or volume<0:
+                break
+            max_a_b=self._max_a_b(printers) if printers>0 else 0
+            for a_b in np.unique(np.rint(np.linspace(0,max(max_a_b,0),self.a_b_grid+1)).astype(int)):
+                a=self._greedy_first_stage(*self._capacity(a_b,printers))
+                value,solution=self._evaluate(a,int(a_b),printers)
+                if value>best_value:
+                    best_value,best=value,solution
+        return best_value,best
+
+    # Neighbours of a solution: one unit of an item less (or some material less) and the knapsack refilled with the other items
+    def _neighbours(self,solution,step):
+        a,a_b,printers,_,_=solution
+        for item in np.flatnonzero(a>0):
+            b=a.copy()
+            b[item]-=1
+            yield self._greedy_first_stage(*self._capacity(a_b,printers),a=b,excluded=item),a_b,printers
+        if printers>0:
+            for delta in (-step,step):
+                new_a_b=a_b+delta
+                if new_a_b<0 or new_a_b>self._max_a_b(printers):
+                    continue
+                weight,volume=self._capacity(new_a_b,printers)
+                b=a.copy()
+                # Remove units of the items with the lowest score until the new material fits
+                while np.dot(self.w,b)>weight or np.dot(self.v,b)>volume:
+                    carried=np.flatnonzero(b>0)
+                    b[carried[np.argmin(self.score[carried,b[carried]-1])]]-=1
+                yield self._greedy_first_stage(weight,volume,a=b),new_a_b,printers
+
+    def _local_search(self,value,solution,start):
+        step=max(1,self._max_a_b(solution[2])//self.a_b_grid) if solution[2]>0 else 1
+        for _ in range(self.max_iterations):
+            improved=False
+            for a,a_b,printers in self._neighbours(solution,step):
+                new_value,new_solution=self._evaluate(a,a_b,printers)
+                if new_value>value+1e-9:
+                    value,solution,improved=new_value,new_solution,True
+                    break
+                if self.max_time is not None and timer()-start>self.max_time:
+                    return value,solution
+            if not improved:
+                if step==1:
+                    break
+                step=max(1,step//2)
+        return value,solution
+
+    def solve(self):
+        start=timer()
+        self.evaluated=0
+        value,solution=self._construct()
+        self.obj_value,self.solution=self._local_search(value,solution,start)
+        self.runtime=timer()-start
+        self.bound=lp_relaxation_bound(self.data_instance,self.printers_upperbound,self.M) if self.lp_bound else None
+        return self._get_output()
+
+    def _get_output(self):
+        data=self.data_instance
+        a,a_b,printers,P,a_s=self.solution
+        p=np.zeros((data.S,self.printers_upperbound,len(data.N_p)),dtype=int)
+        p[:,:printers]=P
+        gap=None if self.bound is None else max(0.0,self.bound-self.obj_value)/max(abs(self.obj_value),1e-10)
+        optimal=gap is not None and gap<=1e-9
+        output = {
+            "StatusCode":2 if optimal else 13,
+            "Status":"OPTIMAL" if optimal else "SUBOPTIMAL",
+            "ObjValue":round(float(self.obj_value),2),
+            "Solutions":int(self.evaluated),
+            "Nodes":0,
+            "Cuts":0,
+            "Runtime":round(float(self.runtime),2),
+            "MIPGap":None if gap is None else float('{:0.2e}'.format(gap)),
+            "Solution":{"a":a,"a_b":int(a_b),"p":p,"a_s":a_s,"y":(np.arange(self.printers_upperbound)<printers).astype(int)},
+            "Printers":int(printers)
+        }
+        return output
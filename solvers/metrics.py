@@ -0,0 +1,102 @@
+import sys
+import resource
+import numpy as np
+import gurobipy as gb
+from timeit import default_timer as timer
+
+# -------------------------------------------------------- Metrics module ------------------------------------------------------------
+#
+# This module collects the telemetry of a Gurobi solve when a solver is created with metrics=True:
+#  - the trace of the incumbent and of the bound over time (with the explored nodes and the memory used), from the MIP and MIPSOL
+#    callbacks. A point is recorded only when the incumbent or the bound changes, so the trace stays small.
+#  - the resident memory of the process, sampled in the callback at most every SAMPLE_INTERVAL seconds, before and after the solve.
+#  - the time spent in the callback to record the trace (CallbackTime), to measure the cost of the collection itself.
+# SolveMetrics.output() returns a dict with the time needed to build the model (BuildTime), the time of the solve (SolveTime), the
+# memory in MB and the trace as NumPy arrays:
+#  - PeakMemory: peak memory of Gurobi (MaxMemUsed attribute). The memory of Gurobi (MaxMemUsed, and MEMUSED in the callback) is
+#    only available from Gurobi 10.0: with older versions (as the pinned 9.5.2) PeakMemory is NaN and the "memory" of the trace
+#    is the resident memory of the process.
+#  - ProcessPeakMemory: peak resident memory of the process sampled during the solve; ProcessMemoryDelta: its increase over the
+#    resident memory before the solve. The current resident memory is read from /proc/self/statm (Linux); on the other systems
+#    only the peak of the whole life of the process is available (ru_maxrss), so the delta is the increase of that peak.
+# The traces can be saved, loaded and plotted with utils.utils (save_traces, load_traces, plot_trace).
+#
+# -- Classes --
+#  -SolveMetrics(build_time): metrics of one solve. callback(model,where) is called by the callback of the solver.
+#
+# ------------------------------------------------------------------------------------------------------------------------------------
+
+TRACE_FIELDS=("time","incumbent","bound","nodes","memory")
+SAMPLE_INTERVAL=0.05
+
+# Peak resident memory of the process in MB (ru_maxrss is in KB on Linux, in bytes on macOS)
+def process_peak_memory():
+    peak=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak/(1024*1024) if sys.platform=="darwin" else peak/1024
+
+# Current resident memory of the process in MB (the peak when /proc is not available)
+def process_memory():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1])*resource.getpagesize()/(1024*1024)
+    except (OSError,ValueError,IndexError):
+        return process_peak_memory()
+
+class SolveMetrics:
+
+    def __init__(self,build_time=None):
+        self.build_time=build_time
+        self.callback_time=0.0
+        self.trace={field:list() for field in TRACE_FIELDS}
+        # MEMUSED and MaxMemUsed exist from Gurobi 10.0
+        self._memory=getattr(gb.GRB.Callback,"MEMUSED",None)
+        self._last=(None,None)
+        self._start_memory=self._peak_memory=self._memory_used=process_memory()
+        self._next_sample=timer()+SAMPLE_INTERVAL
+
+    def _sample(self,now):
+        self._memory_used=process_memory()
+        self._peak_memory=max(self._peak_memory,self._memory_used)
+        self._next_sample=now+SAMPLE_INTERVAL
+
+    @staticmethod
+    def _same(value,last):
+        return value==last or (value!=value and last is not None and last!=last)
+
+    # Only the incumbent and the bound are read at every call; the other values when a point is recorded
+    def _record(self,model,incumbent,bound,runtime,nodes):
+        # No incumbent (or bound) yet: Gurobi returns +-GRB.INFINITY
+        incumbent=float("nan") if abs(incumbent)>=gb.GRB.INFINITY else incumbent
+        bound=float("nan") if abs(bound)>=gb.GRB.INFINITY else bound
+        if self._same(incumbent,self._last[0]) and self._same(bound,self._last[1]):
+            return
+        self._last=(incumbent,bound)
+        trace=self.trace
+        trace["time"].append(model.cbGet(runtime))
+        trace["incumbent"].append(incumbent)
+        trace["bound"].append(bound)
+        trace["nodes"].append(model.cbGet(nodes))
+        trace["memory"].append(model.cbGet(self._memory)*1024 if self._memory is not None else self._memory_used)
+
+    def callback(self,model,where):
+        start=timer()
+        if start>=self._next_sample:
+            self._sample(start)
+        if where==gb.GRB.Callback.MIP:
+            self._record(model,model.cbGet(gb.GRB.Callback.MIP_OBJBST),model.cbGet(gb.GRB.Callback.MIP_OBJBND),gb.GRB.Callback.RUNTIME,gb.GRB.Callback.MIP_NODCNT)
+        elif where==gb.GRB.Callback.MIPSOL:
+            self._record(model,model.cbGet(gb.GRB.Callback.MIPSOL_OBJBST),model.cbGet(gb.GRB.Callback.MIPSOL_OBJBND),gb.GRB.Callback.RUNTIME,gb.GRB.Callback.MIPSOL_NODCNT)
+        self.callback_time+=timer()-start
+
+    def output(self,model):
+        self._sample(timer())
+        trace={field:np.asarray(values,dtype=float) for field,values in self.trace.items()}
+        return {
+            "BuildTime":self.build_time,
+            "SolveTime":float(model.Runtime),
+            "CallbackTime":self.callback_time,
+            "PeakMemory":float(model.MaxMemUsed)*1024 if hasattr(gb.GRB.Attr,"MaxMemUsed") else np.nan,
+            "ProcessPeakMemory":self._peak_memory,
+            "ProcessMemoryDelta":self._peak_memory-self._start_memory,
+            "Trace":trace
+        }
@@ -0,0 +1,195 @@
+import numpy as np
+from scipy.stats import norm
+from timeit import default_timer as timer
+from solvers.formulation import pack_printers, size_gcd
+
+# ---------------------------------------------------- Out-of-sample evaluation ------------------------------------------------------
+#
+# This module values a first stage (a, a_b, number of printers) on thousands of new demand scenarios, drawn from the distribution
+# of Data.__instance_generator, without solving a MIP for each of them. In the generator the demand of item i is uniform on
+# {0,...,max_demand[i]}, independently for every item and scenario; max_demand is not stored in Data, so it is estimated with
+# the largest demand of the item in the scenarios of the instance (or it can be given).
+# The second stage of every scenario is computed on batches of scenarios with NumPy:
+#  - the carried items are used first, a_s=min(a,demand) (optimal for alpha<=1): without printers this is the exact value.
+#  - the residual demand of the printable items is printed with a bounded knapsack DP over the time of all the printers together
+#    (n*T) and the a_b material, computed for a whole batch of scenarios at once (tables of shape batch x time x material; the
+#    material is added to the tables only for the scenarios whose printing without it needs more than a_b). This is an upper
+#    bound of the printing, and the exact value when first fit decreasing packs its prints on the n printers
+#    (solvers.formulation.pack_printers), always the case with one printer.
+#  - in the other scenarios the prints that do not fit are dropped and the time left on each printer is filled with the same DP,
+#    one printer after the other: a feasible (lower) value, with the DP as upper bound.
+# The size of the batches is chosen so that the DP tables have at most "max_states" states; when the tables would have more than
+# "resolution" units of material, the material is counted in larger units (a feasible value, and an upper bound).
+#
+# -- Classes --
+#  -OutOfSampleEvaluator(data_instance,scenarios=10000,seed=None,...): evaluate(solution) returns a dict with the number of
+#       Scenarios, Mean, StdDev, ConfidenceInterval (normal approximation, "confidence" level), Quantiles, Exact (fraction of the
+#       scenarios whose value is exact, the others are lower values), UpperBound (mean of the upper bounds, only if some values
+#       are not exact) and Runtime. The solution
+#       is the output of the solve() method of any solver, or its Solution dict (a, a_b, y). values(solution) returns the value
+#       of every scenario. The demand is sampled once, so all the solutions are compared on the same scenarios.
+#
+# -- Functions --
+#  -sample_demand(data_instance,scenarios,seed=None,max_demand=None): matrix [scenarios,N] of new demands.
+#  -second_stage_values(data_instance,demand,a,a_b,printers,max_states=10**7,resolution=500): values of the second stage for each
+#                                                 row of demand, their upper bounds and a mask of the exact values.
+#
+# ------------------------------------------------------------------------------------------------------------------------------------
+
+def sample_demand(data_instance,scenarios,seed=None,max_demand=None):
+    rng=seed if isinstance(seed,np.random.Generator) else np.random.default_rng(seed)
+    max_demand=np.asarray(data_instance.demand).max(axis=0) if max_demand is None else np.asarray(max_demand)
+    return np.ceil(rng.random((scenarios,data_instance.N))*(max_demand+1)-1).astype("int")
+
+# First stage (a, a_b, printers) of the output of a solver or of its Solution dict
+def _first_stage(solution):
+    solution=solution.get("Solution",solution)
+    return np.asarray(solution["a"],dtype=int),int(solution["a_b"]),int(np.asarray(solution["y"]).sum())
+
+# Bounded knapsack max values*x, size_1*x<=capacity_1[b], size_2*x<=capacity_2[b], x<=residual[b] for a batch of rows b, with a
+# DP table of shape (batch, capacity_1, capacity_2). Returns the values and x.
+def _knapsack_table(capacity_1,capacity_2,size_1,size_2,values,residual):
+    B,N_p=residual.shape
+    C1,C2=int(capacity_1.max()),int(capacity_2.max())
+    dp=np.zeros((B,C1+1,C2+1))
+    choices=list()
+    for item in range(N_p):
+        choice=np.zeros(dp.shape,dtype=np.uint16)
+        bound=int(residual[:,item].max())
+        if size_1[item]>0:
+            bound=min(bound,C1//size_1[item])
+        if size_2[item]>0:
+            bound=min(bound,C2//size_2[item])
+        if bound>0 and values[item]>0:
+            old=dp.copy()
+            for k in range(1,bound+1):
+                candidate=old[:,:C1+1-k*size_1[item],:C2+1-k*size_2[item]]+k*values[item]
+                target=dp[:,k*size_1[item]:,k*size_2[item]:]
+                # Units beyond the residual demand of the row are not allowed
+                improved=(candidate>target)&(residual[:,item]>=k)[:,None,None]
+                target[improved]=candidate[improved]
+                choice[:,k*size_1[item]:,k*size_2[item]:][improved]=k
+        choices.append(choice)
+    rows=np.arange(B)
+    c_1,c_2=capacity_1.astype(int),capacity_2.astype(int)
+    value=dp[rows,c_1,c_2]
+    x=np.zeros((B,N_p),dtype=int)
+    for item in range(N_p-1,-1,-1):
+        x[:,item]=choices[item][rows,c_1,c_2]
+        c_1,c_2=c_1-x[:,item]*size_1[item],c_2-x[:,item]*size_2[item]
+    return value,x
+
+def _batched_table(capacity_1,capacity_2,size_1,size_2,values,residual,max_states):
+    B,N_p=residual.shape
+    value,x=np.zeros(B),np.zeros((B,N_p),dtype=int)
+    batch=max(1,max_states//((int(capacity_1.max(initial=0))+1)*(int(capacity_2.max(initial=0))+1)*(N_p+2)))
+    for start in range(0,B,batch):
+        rows=slice(start,start+batch)
+        value[rows],x[rows]=_knapsack_table(capacity_1[rows],capacity_2[rows],size_1,size_2,values,residual[rows])
+    return value,x
+
+# _knapsack_table on batches of rows with at most max_states states. The second capacity (the material) is first dropped: only
+# the rows whose solution exceeds it are solved again with both capacities. If these tables would have more than "resolution"
+# units of the second capacity, its unit is enlarged: the sizes rounded up give a feasible x (completed greedily), the sizes
+# rounded down an upper bound. Returns the values of x, x and the upper bounds.
+def _bounded_knapsack(capacity_1,capacity_2,size_1,size_2,values,residual,max_states,resolution):
+    g_1,g_2=size_gcd(size_1),size_gcd(size_2)
+    size_1,size_2=np.asarray(size_1,dtype=int)//g_1,np.asarray(size_2,dtype=int)//g_2
+    capacity_1,capacity_2=np.asarray(capacity_1,dtype=int)//g_1,np.asarray(capacity_2,dtype=int)//g_2
+    capacity_1=np.minimum(capacity_1,residual@size_1)
+    value,x=_batched_table(capacity_1,np.zeros_like(capacity_1),size_1,np.zeros_like(size_2),values,residual,max_states)
+    upper=value.copy()
+    rows=np.flatnonzero(x@size_2>capacity_2)
+    if len(rows)>0:
+        capacity_1,capacity_2,residual=capacity_1[rows],np.minimum(capacity_2[rows],residual[rows]@size_2),residual[rows]
+        unit=max(1,-(-int(capacity_2.max())//resolution))
+        value[rows],x[rows]=_batched_table(capacity_1,capacity_2//unit,size_1,-(-size_2//unit),values,residual,max_states)
+        if unit==1:
+            upper[rows]=value[rows]
+        else:
+            upper[rows]=_batched_table(capacity_1,capacity_2//unit,size_1,size_2//unit,values,residual,max_states)[0]
+            # The capacities left by the rounding are filled greedily, the most valuable items first
+            left_1,left_2=capacity_1-x[rows]@size_1,capacity_2-x[rows]@size_2
+            for item in np.argsort(-values):
+                k=residual[:,item]-x[rows,item]
+                if size_1[item]>0:
+                    k=np.minimum(k,left_1//size_1[item])
+                if size_2[item]>0:
+                    k=np.minimum(k,left_2//size_2[item])
+                x[rows,item]+=k
+                left_1,left_2=left_1-k*size_1[item],left_2-k*size_2[item]
+            value[rows]=x[rows]@values
+    return value,x,upper
+
+def second_stage_values(data_instance,demand,a,a_b,printers,max_states=10**7,resolution=500):
+    data=data_instance
+    demand=np.asarray(demand)
+    r=np.asarray(data.r,dtype=float)
+    a_s=np.minimum(np.asarray(a)[None,:],demand)
+    obj_values=a_s@r
+    printable=np.asarray(data.N_p,dtype=int)
+    if printers==0 or len(printable)==0:
+        return obj_values,obj_values.copy(),np.ones(len(demand),dtype=bool)
+    m,t=np.rint(np.asarray(data.m)[printable]).astype(int),np.asarray(data.t,dtype=int)[printable]
+    # Without material only the items with m=0 can be printed
+    if a_b==0 and np.all(m>0):
+        return obj_values,obj_values.copy(),np.ones(len(demand),dtype=bool)
+    values=data.alpha*r[printable]
+    residual=demand[:,printable]-a_s[:,printable]
+    S=len(demand)
+    # Printing with a_b material and the time of all the printers together: an upper bound, and the exact value when first fit
+    # decreasing packs its prints on the printers
+    printing,x,upper=_bounded_knapsack(np.full(S,printers*int(data.T)),np.full(S,a_b),t,m,values,residual,max_states,resolution)
+    p,left=pack_printers(data,x,printers)
+    exact=~left.any(axis=1)
+    printing=np.where(exact,printing,(x-left)@values)
+    # In the other scenarios the time left on each printer is filled with the residual demand, one printer after the other
+    others=np.flatnonzero(~exact)
+    if len(others)>0:
+        placed=x[others]-left[others]
+        residual=residual[others]-placed
+        material=a_b-placed@m
+        time=int(data.T)-np.einsum("bji,i->bj",p[others],t)
+        for printer in range(printers):
+            value,x,_=_bounded_knapsack(time[:,printer],material,t,m,values,residual,max_states,resolution)
+            printing[others]+=value
+            residual-=x
+            material-=x@m
+    return obj_values+printing,obj_values+upper,exact&(printing>=upper-1e-9)
+
+class OutOfSampleEvaluator:
+
+    def __init__(self,data_instance,scenarios=10000,seed=None,max_demand=None,confidence=0.95,quantiles=(0.05,0.25,0.5,0.75,0.95),max_states=10**7,resolution=500):
+        if data_instance.alpha>1:
+            raise ValueError("OutOfSampleEvaluator requires alpha<=1")
+        self.data_instance=data_instance
+        self.demand=sample_demand(data_instance,scenarios,seed,max_demand)
+        self.confidence=confidence
+        self.quantiles=quantiles
+        self.max_states=max_states
+        self.resolution=resolution
+
+    def values(self,solution):
+        a,a_b,printers=_first_stage(solution)
+        return second_stage_values(self.data_instance,self.demand,a,a_b,printers,self.max_states,self.resolution)[0]
+
+    def evaluate(self,solution):
+        start=timer()
+        a,a_b,printers=_first_stage(solution)
+        values,upper,exact=second_stage_values(self.data_instance,self.demand,a,a_b,printers,self.max_states,self.resolution)
+        K=len(values)
+        mean=float(values.mean())
+        std=float(values.std(ddof=1)) if K>1 else 0.0
+        half_width=float(norm.ppf(0.5+self.confidence/2))*std/np.sqrt(K)
+        evaluation={
+            "Scenarios":K,
+            "Mean":mean,
+            "StdDev":std,
+            "ConfidenceInterval":(mean-half_width,mean+half_width),
+            "Quantiles":{quantile:float(value) for quantile,value in zip(self.quantiles,np.quantile(values,self.quantiles))},
+            "Exact":float(exact.mean()),
+        }
+        if not exact.all():
+            evaluation["UpperBound"]=float(upper.mean())
+        evaluation["Runtime"]=timer()-start
+        return evaluation
@@ -0,0 +1,265 @@
+import numpy as np
+import scipy.sparse as sp
+import gurobipy as gb
+import multiprocessing as mp
+from timeit import default_timer as timer
+from solvers.solver import Solver
+from solvers.gurobi import STATUS
+from solvers.formulation import constraint_blocks, objective_vector, variable_layout
+from solvers.bounds import feasible_first_stage, first_stage_feasible
+from solvers.evaluation import StochasticEvaluator, _single_scenario
+
+# -------------------------------------------------- Progressive Hedging solver ------------------------------------------------------
+#
+# This class solves the TSS-3DKP with the Progressive Hedging algorithm of Rockafellar and Wets, for numbers of scenarios whose
+# deterministic equivalent does not fit in memory. Every scenario s has its own single-scenario model (constraints (12)-(20) with
+# the printers upperbound of the whole instance) with a copy x^s=(a^s, a_b^s, y^s) of the first stage. At every iteration:
+#  - x_mean=sum_s q[s]*x^s and the weights w[s]+=rho*(x^s-x_mean) (so that sum_s q[s]*w[s]=0);
+#  - every scenario solves max f_s(x^s)-w[s]*x^s-rho/2*||x^s-x_mean||^2 (a MIQP), changing only the objective of its model.
+# rho is given for each first stage variable as rho times the value of one unit of the variable (r[i] for a[i], the best
+# alpha*r/m of the printable items for a_b, alpha*T times the best r/t for y), as suggested by Watson and Woodruff. A large rho
+# makes the scenarios agree in few iterations on a worse first stage, a small rho needs more iterations (default: 0.1).
+#
+# -- Parallelism --
+#   The scenarios are split in "workers" chunks; each chunk lives in its own process (with its own Gurobi environment and
+#   "threads" threads), which builds the models of its scenarios once and keeps them between the iterations: the processes only
+#   receive the weights, x_mean and the fixed variables and send back the first stages. With workers=1 the models are kept in
+#   the main process.
+#
+# -- Termination --
+#   The algorithm stops when the distance sum_s q[s]*||x^s-x_mean||_1 is at most "tolerance" times max(1,||x_mean||_1), after
+#   "max_iterations" iterations or after "max_time" seconds. A first stage variable that takes the same value in all the scenarios
+#   for "fix_iterations" consecutive iterations is fixed to that value in every model (fix_iterations=None never fixes).
+#   The first stage of the solution is x_mean rounded if the scenarios agree and the rounding is feasible (the first stage of the
+#   scenario closest to x_mean if it is not), otherwise floor(x_mean) (solvers.bounds.feasible_first_stage);
+#   it is evaluated with the integer second stage of every scenario (solvers.evaluation), which gives ObjValue, "p" and "a_s".
+#   With bound=True the subproblems are solved once more with the final weights, without the penalty and the fixings: since
+#   sum_s q[s]*w[s]=0 this is a Lagrangian upper bound of the problem, and MIPGap is the gap from it (None with bound=False).
+#
+# -- Parent Class --
+#   The class ProgressiveHedgingSolver inherit some methods from the abstract class "Solver" (solvers.solver.Solver)
+#
+# -- Methods --
+#  -solve(): solve the problem and retrieve a dict with the same keys of GurobiSolver.solve(), plus "Iterations". "Nodes" is the
+#            total of the nodes of the subproblems, "Cuts" is 0. StatusCode is OPTIMAL when the gap from the bound is within
+#            tolerance, TIME_LIMIT or ITERATION_LIMIT when the scenarios did not agree in time, SUBOPTIMAL otherwise.
+#  -print_solution(): print the solution found. Must be called after solve() method.
+#
+# ------------------------------------------------------------------------------------------------------------------------------------
+
+# Models of the single-scenario TSS-3DKP of a chunk of scenarios, with the first stage columns (a, a_b, y) at the given positions
+class _ScenarioModels:
+
+    def __init__(self,data_instance,scenarios,printers_upperbound,M,MIPGap,threads):
+        U=printers_upperbound
+        single=_single_scenario(data_instance,int(scenarios[0]))
+        layout=variable_layout(single,U)
+        self.first_stage=np.concatenate([np.arange(layout["a"],layout["p"]),np.arange(layout["y"],layout["size"])])
+        self.upper=np.concatenate([np.full(layout["y"],gb.GRB.INFINITY),np.ones(U)])
+        self.c=objective_vector(single,U)
+        self.size=layout["size"]
+        self.env=gb.Env(empty=True)
+        self.env.setParam('OutputFlag',0)
+        if threads is not None:
+            self.env.setParam('Threads',threads)
+        self.env.start()
+        blocks=constraint_blocks(single,U,M)
+        A=sp.vstack([A for _,A,_ in blocks],format="csr")
+        b=np.concatenate([b for _,_,b in blocks])
+        # First row of constraints (15)/(16): the rows of (12), (13) and (14) come before
+        demand_rows=3
+        self.models,self.variables=list(),list()
+        for scenario in scenarios:
+            model=gb.Model(env=self.env)
+            if MIPGap is not None:
+                model.setParam('MIPGap',MIPGap)
+            variables=model.addMVar(self.size,ub=self.upper,vtype=gb.GRB.INTEGER,name="x")
+            rhs=b.copy()
+            rhs[demand_rows:demand_rows+data_instance.N]=np.asarray(data_instance.demand[scenario],dtype=float)
+            model.addMConstr(A,None,gb.GRB.LESS_EQUAL,rhs)
+            self.models.append(model)
+            self.variables.append(variables)
+
+    # First stage, bound and nodes of every scenario for max f_s(x)-w[s]*x-rho/2*||x-x_mean||^2 (penalty only if rho is given)
+    def solve(self,weights,x_mean,rho,fixed,values):
+        lower=np.zeros(self.size)
+        upper=self.upper.copy()
+        lower[self.first_stage[fixed]]=upper[self.first_stage[fixed]]=values[fixed]
+        Q=None
+        if rho is not None:
+            diagonal=np.zeros(self.size)
+            diagonal[self.first_stage]=-rho/2
+            Q=sp.diags(diagonal,format="csr")
+        results=list()
+        for model,variables,w in zip(self.models,self.variables,weights):
+            c=self.c.copy()
+            c[self.first_stage]-=w
+            constant=0.0
+            if rho is not None:
+                c[self.first_stage]+=rho*x_mean
+                constant=-float(np.dot(rho/2,x_mean**2))
+            variables.setAttr("LB",lower)
+            variables.setAttr("UB",upper)
+            model.setMObjective(Q,c,constant,sense=gb.GRB.MAXIMIZE)
+            model.optimize()
+            results.append((np.asarray(variables.X)[self.first_stage],float(model.ObjBound),int(model.NodeCount)))
+        return results
+
+    def dispose(self):
+        for model in self.models:
+            model.dispose()
+        self.env.dispose()
+
+# Process that keeps the models of a chunk of scenarios and solves them on request, until it receives None
+def _worker(connection,data_instance,scenarios,printers_upperbound,M,MIPGap,threads):
+    models=_ScenarioModels(data_instance,scenarios,printers_upperbound,M,MIPGap,threads)
+    try:
+        while True:
+            request=connection.recv()
+            if request is None:
+                break
+            connection.send(models.solve(*request))
+    finally:
+        models.dispose()
+        connection.close()
+
+class _ScenarioWorkers:
+
+    def __init__(self,data_instance,printers_upperbound,M,MIPGap,workers,threads):
+        self.chunks=[chunk for chunk in np.array_split(np.arange(data_instance.S),max(1,workers)) if len(chunk)>0]
+        self.local,self.processes,self.connections=None,list(),list()
+        if len(self.chunks)==1:
+            self.local=_ScenarioModels(data_instance,self.chunks[0],printers_upperbound,M,MIPGap,threads)
+            return
+        for chunk in self.chunks:
+            connection,child=mp.Pipe()
+            # Each process receives only the demand of its scenarios
+            chunk_data=data_instance.scenarios(chunk,q=np.asarray(data_instance.q)[chunk])
+            process=mp.Process(target=_worker,args=(child,chunk_data,np.arange(len(chunk)),printers_upperbound,M,MIPGap,threads),daemon=True)
+            process.start()
+            child.close()
+            self.processes.append(process)
+            self.connections.append(connection)
+
+    # First stages x[s], bounds[s] and total nodes of all the scenarios
+    def solve(self,weights,x_mean,rho,fixed,values):
+        if self.local is not None:
+            results=self.local.solve(weights,x_mean,rho,fixed,values)
+        else:
+            for connection,chunk in zip(self.connections,self.chunks):
+                connection.send((weights[chunk],x_mean,rho,fixed,values))
+            results=[result for connection in self.connections for result in connection.recv()]
+        return np.array([result[0] for result in results]),np.array([result[1] for result in results]),sum(result[2] for result in results)
+
+    def dispose(self):
+        if self.local is not None:
+            self.local.dispose()
+        for connection,process in zip(self.connections,self.processes):
+            connection.send(None)
+            connection.close()
+            process.join()
+
+class ProgressiveHedgingSolver(Solver):
+
+    def __init__(self,data_instance,max_time=None,log=False,MIPGap=None,printers_upperbound=None,workers=1,threads=1,rho=0.1,max_iterations=100,tolerance=1e-4,fix_iterations=3,bound=True):
+        Solver.__init__(self,data_instance,printers_upperbound)
+        self.M=int(min(data_instance.W/data_instance.w_b,data_instance.V/data_instance.v_b)+2)
+        self.max_time,self.log,self.MIPGap=max_time,log,MIPGap
+        self.workers,self.threads=workers,threads
+        self.max_iterations=max_iterations
+        self.tolerance=tolerance
+        self.fix_iterations=fix_iterations
+        self.bound=bound
+        self._model_generator()
+        self.rho=rho*self.rho_scale
+
+    # Penalty of one unit of each first stage variable (a, a_b, y); the scenario models are built by the workers in solve()
+    def _model_generator(self):
+        data=self.data_instance
+        printable=np.asarray(data.N_p,dtype=int)
+        r=np.asarray(data.r,dtype=float)
+        m=np.asarray(data.m,dtype=float)[printable]
+        t=np.asarray(data.t,dtype=float)[printable]
+        material=float(np.max(data.alpha*r[printable]/np.maximum(m,1))) if len(printable)>0 else 0.0
+        printer=float(data.alpha*data.T*np.max(r[printable]/np.maximum(t,1))) if len(printable)>0 else 0.0
+        self.rho_scale=np.maximum(np.concatenate([r,[material],np.full(self.printers_upperbound,printer)]),1e-6)
+        self.model=None
+
+    def solve(self):
+        start=timer()
+        data=self.data_instance
+        S,U=data.S,self.printers_upperbound
+        q=np.asarray(data.q,dtype=float)
+        columns=data.N+1+U
+        weights=np.zeros((S,columns))
+        fixed=np.zeros(columns,dtype=bool)
+        agreed=np.zeros(columns,dtype=int)
+        self.nodes=0
+        self.reason="ITERATION_LIMIT"
+        workers=_ScenarioWorkers(data,U,self.M,self.MIPGap,self.workers,self.threads)
+        try:
+            # Iteration 0: every scenario alone
+            x,_,nodes=workers.solve(weights,np.zeros(columns),None,fixed,np.zeros(columns))
+            self.nodes+=nodes
+            x_mean=q@x
+            self.iterations=0
+            for iteration in range(1,self.max_iterations+1):
+                weights+=self.rho*(x-x_mean[None,:])
+                x,_,nodes=workers.solve(weights,x_mean,self.rho,fixed,np.rint(x_mean))
+                self.nodes+=nodes
+                x_mean=q@x
+                self.iterations=iteration
+                distance=float(q@np.abs(x-x_mean[None,:]).sum(axis=1))
+                if self.log:
+                    print("Iteration "+str(iteration)+": distance "+str(round(distance,4))+", fixed "+str(int(fixed.sum()))+"/"+str(columns))
+                if distance<=self.tolerance*max(1.0,float(np.abs(x_mean).sum())):
+                    self.reason=None
+                    break
+                if self.max_time is not None and timer()-start>self.max_time:
+                    self.reason="TIME_LIMIT"
+                    break
+                if self.fix_iterations is not None:
+                    same=np.all(np.abs(x-np.rint(x_mean)[None,:])<=1e-6,axis=0)
+                    agreed=np.where(same,agreed+1,0)
+                    fixed|=agreed>=self.fix_iterations
+            self.upper_bound=float(q@workers.solve(weights,x_mean,None,np.zeros(columns,dtype=bool),x_mean)[1]) if self.bound else None
+        finally:
+            workers.dispose()
+        candidate=x_mean
+        if self.reason is None:
+            # The scenarios agree within the tolerance, but rounding x_mean can still break (12)-(14) or (20): then the first stage
+            # of the scenario closest to x_mean is used, which is feasible
+            candidate=np.rint(x_mean)
+            if not first_stage_feasible(data,candidate):
+                candidate=np.rint(x[np.argmin(np.sum((x-x_mean[None,:])**2,axis=1))])
+        a,a_b,y=feasible_first_stage(data,candidate)
+        values,p,a_s=StochasticEvaluator(data,workers=self.workers,threads=self.threads,printers_upperbound=U).second_stage_solutions(a,a_b,int(y.sum()))
+        P=np.zeros((S,U,len(data.N_p)),dtype=int)
+        P[:,:p.shape[1],:]=p
+        self.solution={"a":a,"a_b":int(a_b),"p":P,"a_s":a_s.astype(int),"y":y}
+        self.obj_value=float(np.dot(values,q))
+        self.runtime=timer()-start
+        return self._get_output()
+
+    def _get_output(self):
+        gap=None if self.upper_bound is None else max(0.0,self.upper_bound-self.obj_value)/max(abs(self.obj_value),1e-10)
+        if gap is not None and gap<=self.tolerance:
+            status=2
+        elif self.reason is not None:
+            status=9 if self.reason=="TIME_LIMIT" else 7
+        else:
+            status=13
+        output = {
+            "StatusCode":status,
+            "Status":STATUS[status],
+            "ObjValue":round(self.obj_value,2),
+            "Solutions":1,
+            "Nodes":int(self.nodes),
+            "Cuts":0,
+            "Runtime":round(self.runtime,2),
+            "MIPGap":None if gap is None else float('{:0.2e}'.format(gap)),
+            "Solution": self.solution,
+            "Printers": int(self.solution["y"].sum()),
+            "Iterations": self.iterations
+        }
+        return output
@@ -1,4 +1,5 @@
 import sys
+import numpy as np
 from abc import ABC, abstractmethod
 
 class Solver(ABC):
@@ -26,30 +27,44 @@ class Solver(ABC):
 
     #Find the smart upperbound defined in the paper
     def _smart_upperbound(self):
+        self.printers_upperbound=Solver.smart_upperbound(self.data_instance)
+
+    #Smart upperbound of a Data instance, without building a solver. The first fit packing of the paper (printable items in
+    #increasing index order, each printer filled until the next unit does not fit) is computed for all the scenarios at once:
+    #for each item the units that fit in the current printer are min(floor(time_left/t),demand), the others open
+    #ceil(residual/floor(T/t)) new printers, and the last one is left with T-t*(units in the last printer).
+    #Items with t>T can never be printed and items with t=0 take no time, so both are skipped.
+    @staticmethod
+    def smart_upperbound(data_instance):
         max_num_of_printers=0
-        for scenario in range(self.data_instance.S):
-            num_of_printers=1
-            time_counter=self.data_instance.T;
-            if time_counter==0:
-                self.printers_upperbound=1
-                return 
-            for item in range(self.data_instance.N):
-                if item in self.data_instance.N_p:
-                    total_items=self.data_instance.demand[scenario][item]
-                    while total_items>0:
-                        num_of_items=min(int(time_counter/self.data_instance.t[item]),total_items)
-                        if num_of_items>0:
-                            time_counter=time_counter-num_of_items*self.data_instance.t[item]
-                            total_items=total_items-num_of_items
-                        if num_of_items==0:
-                            num_of_printers=num_of_printers+1
-                            time_counter=self.data_instance.T
-            if (num_of_printers>max_num_of_printers):
-                max_num_of_printers=num_of_printers;
+        if data_instance.S>0:
+            if data_instance.T==0:
+                return 1
+            demand=np.asarray(data_instance.demand)
+            num_of_printers=np.ones(data_instance.S,dtype=np.int64)
+            time_counter=np.full(data_instance.S,float(data_instance.T))
+            mask,_=data_instance.get_printable_index()
+            for item in np.flatnonzero(mask):
+                t=data_instance.t[item]
+                if t<=0 or t>data_instance.T:
+                    continue
+                total_items=demand[:,item]
+                num_of_items=np.minimum(np.floor(time_counter/t),total_items)
+                time_counter=time_counter-num_of_items*t
+                residual=total_items-num_of_items
+                capacity=data_instance.T//t
+                new_printers=np.ceil(residual/capacity)
+                last=residual-(new_printers-1)*capacity
+                # Guard against the rounding of the division for fractional (expected) demands
+                new_printers,last=np.where(last>capacity,new_printers+1,new_printers),np.where(last>capacity,last-capacity,last)
+                opened=residual>0
+                num_of_printers=num_of_printers+np.where(opened,new_printers,0).astype(np.int64)
+                time_counter=np.where(opened,data_instance.T-last*t,time_counter)
+            max_num_of_printers=int(num_of_printers.max())
         # If we cannot bring any printers,there will be no variables P[scenario][printer][item] and so a lot of constraints would change.
         # So,in addition to the paper formulation and in order to keep the code cleaner, the value 1 is taken as minimum if one of the 
         # other values is 0. This doesn't affect the result (due to constraint (12)) but just slows the solver in this particular case.
-        self.printers_upperbound=max(min(max_num_of_printers,sys.maxsize if self.data_instance.w_p==0 else int(self.data_instance.W/self.data_instance.w_p),sys.maxsize if self.data_instance.v_p==0 else int(self.data_instance.V/self.data_instance.v_p)),1)
+        return max(min(max_num_of_printers,sys.maxsize if data_instance.w_p==0 else int(data_instance.W/data_instance.w_p),sys.maxsize if data_instance.v_p==0 else int(data_instance.V/data_instance.v_p)),1)
 
     def print_solution(self):
         output=self._get_output()
@@ -61,7 +76,7 @@ class Solver(ABC):
         print("Units of printing material to take: "+ str(solution["a_b"]))
         print("Number of printers to take: "+  str(sum( [  solution["y"][i] for i in range(self.printers_upperbound)]) ))
         print("Total revenue gained: "+ str(obj_value))
-        if sum( [  solution["y"][i]  for i in range(self.printers_upperbound)])>0:
+        if sum( [  solution["y"][i]  for i in range(self.printers_upperbound)])>0 and "p" in solution:
             print("----------------- Scenarios -----------------")
             for scenario in range(data.S):
                 print("Scenario "+str(scenario)+" -------")
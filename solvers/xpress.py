@@ -1,12 +1,25 @@
 from solvers.solver import Solver
+from solvers.formulation import objective_vector, solution_vector, variable_layout
+from solvers.formulation import aggregated_constraint_blocks, aggregated_objective_vector, aggregated_solution_vector, aggregated_variable_layout
+from solvers.heuristic import HeuristicSolver
 import xpress as xp
 import numpy as np
+import scipy.sparse as sp
 
 # ---------------------------------------------------------- Solver class -----------------------------------------------------------
 # 
 # This class implement the TSS-3DKP formulation defined in https://www.sciencedirect.com/science/article/pii/S0305054821001337 
 # with Xpress FICO. In order to initialise an object of the class we need to pass an instance of the managers.data.Data class. 
 # In addition we can set a maximum execution time with "max_time" (s) and explicit a gap value to limit the MIP solver with "MIPGap".
+# The number of threads used by Xpress can be limited with "threads". The number of printers of the model is computed with
+# Solver.smart_upperbound unless "printers_upperbound" is given.
+# With second_stage_solution=False the Solution returned by solve() contains only the first stage (a, a_b, y).
+# A MIP start can be given with "start": a Solution dict (as the one returned by solve()) or "heuristic" to compute it with
+# solvers.heuristic.HeuristicSolver.
+# With formulation="aggregated" the model has the number of printers and the total prints of each scenario instead of the
+# per-printer variables (see solvers.formulation and GurobiSolver): the prints are packed on the printers after the solve and, if
+# a scenario cannot be packed, the standard model is solved starting from the repaired solution and bounded by the aggregated one
+# (self.fallback).
 # 
 # -- Parent Class --
 #   The class XPressSolver inherit some methods from the abstract class "Solver" (solvers.solver.Solver)
@@ -17,12 +30,14 @@ import numpy as np
 #            - StatusCode: Gurobi status code defined in https://www.gurobi.com/documentation/9.5/refman/optimization_status_codes.html .
 #            - Status: Gurobi status relative to the StatusCode.
 #            - ObjValue: Value of the Objective Function at the solution.
-#            - Solution: Solution found as dict. The dict contains the following keys:
+#            - MIPGap: relative gap between the best bound (bestbound) and the solution (mipobjval) at the termination.
+#            - Solution: Solution found as dict of NumPy arrays. The dict contains the following keys:
 #                        - a: vector of the quantities of the items carried.
 #                        - a_b: units of printing materials carried.
 #                        - p: matrix [s,p,i] -> Define how many items (i) will be printed by printer (p) in the scenario (s)
 #                        - a_s: matrix [s,i] -> Define how many items (i) will be used in scenario (s) (a_s[s,i]=min(a[i],demand[s,i])
 #                        - y: binary vector. y[i]=1 if we bring printer (i), else y[i]=0.
+#  -set_start(solution): add a Solution dict (or the solution of the heuristic with "heuristic") as MIP solution to the problem.
 #  -print_solution(): print the solution found. Must be called after solve() method.
 
 # ------------------------------------------------------------------------------------------------------------------------------------
@@ -30,8 +45,14 @@ import numpy as np
 
 class XPressSolver(Solver):
     
-    def __init__(self,data_instance,log=False,max_time=None,MIPGap=None,N_p=None):
-        Solver.__init__(self,data_instance)
+    def __init__(self,data_instance,log=False,max_time=None,MIPGap=None,N_p=None,threads=None,start=None,second_stage_solution=True,formulation="standard",printers_upperbound=None):
+        Solver.__init__(self,data_instance,printers_upperbound)
+        if formulation not in ("standard","aggregated"):
+            raise ValueError("Unknown formulation: "+str(formulation))
+        self.formulation=formulation
+        self.fallback=None
+        self.log,self.max_time,self.MIPGap,self.threads=log,max_time,MIPGap,threads
+        self.second_stage_solution=second_stage_solution
         self._model_generator()
         if not log:
             _=self.model.setControl('outputlog', 0)
@@ -41,33 +62,85 @@ class XPressSolver(Solver):
             _=self.model.setControl('MIPRELSTOP',MIPGap)
         if N_p is not None:
             self.N_p=N_p
+        if threads is not None:
+            _=self.model.setControl('THREADS',threads)
+        if start is not None:
+            self.set_start(start)
+
+    def set_start(self,solution):
+        if isinstance(solution,str) and solution=="heuristic":
+            solution=HeuristicSolver(self.data_instance,printers_upperbound=self.printers_upperbound,lp_bound=False).solve()["Solution"]
+        vector=aggregated_solution_vector if self.formulation=="aggregated" else solution_vector
+        self.model.addmipsol(vector(self.data_instance,self.printers_upperbound,solution).tolist(),self.variables)
 
     def get_model(self):
         return self.model
 
     def solve(self):
+        self.fallback=None
         _=self.model.solve()
+        if self.formulation=="aggregated" and self.model.attributes.mipsols>0:
+            Solution,lost=self._aggregated_solution(second_stage_solution=True)
+            if lost>1e-6:
+                self.fallback=XPressSolver(self.data_instance,log=self.log,max_time=self.max_time,MIPGap=self.MIPGap,threads=self.threads,
+                                           start=Solution,second_stage_solution=self.second_stage_solution,
+                                           printers_upperbound=self.printers_upperbound)
+                # The bound of the aggregated model is valid for the standard model
+                self.fallback.model.addConstraint(xp.Dot(np.array(self.fallback.variables,dtype=xp.npvar),objective_vector(self.data_instance,self.printers_upperbound))<=float(self.model.attributes.bestbound))
+                self.fallback.solve()
         return self._get_output()
 
+    # Solution of the aggregated model with the prints packed on the printers (solvers.evaluation.pack_aggregated_solution) and
+    # the value lost by the scenarios that cannot be packed
+    def _aggregated_solution(self,second_stage_solution):
+        from solvers.evaluation import pack_aggregated_solution
+        data=self.data_instance
+        S,N,N_p,U=data.S,data.N,len(data.N_p),self.printers_upperbound
+        layout=aggregated_variable_layout(data,U)
+        values=np.rint(np.asarray(self.model.getSolution(self.variables),dtype=float)).astype(int)
+        printers=int(values[layout["n"]])
+        a=values[layout["a"]:layout["a_b"]]
+        p,a_s,lost=pack_aggregated_solution(data,a,values[layout["a_b"]],printers,values[layout["x"]:layout["a_s"]].reshape(S,N_p),values[layout["a_s"]:layout["n"]].reshape(S,N))
+        Solution={"a":a,"a_b":int(values[layout["a_b"]]),"y":(np.arange(U)<printers).astype(int)}
+        if second_stage_solution:
+            Solution["p"]=np.zeros((S,U,N_p),dtype=int)
+            Solution["p"][:,:printers]=p
+            Solution["a_s"]=a_s
+        return Solution,lost
+
+    # All the values are read with a single getSolution call on the variables kept by _model_generator; with
+    # second_stage_solution=False only a, a_b and y are read and the Solution has no "p" and "a_s".
     def _get_output(self):
-        Solution= {
-            "a":[ int(self.model.getSolution("a_"+str(i))) for i in range(self.data_instance.N)],  
-            "a_b":int(self.model.getSolution("a_b")),
-            "p":[[[int(self.model.getSolution("p_"+str(s)+"_"+str(p)+"_"+str(i))) for i in range(len(self.data_instance.N_p))] for p in range(self.printers_upperbound)]for s in range(self.data_instance.S) ],
-            "a_s":[[int(self.model.getSolution("a_s_"+str(s)+"_"+str(i)) ) for i in range(self.data_instance.N)] for s in range(self.data_instance.S)],
-            "y":[int(self.model.getSolution("y_"+str(p) )) for p in range(self.printers_upperbound)]      
-        }      
+        if self.fallback is not None:
+            return self.fallback._get_output()
+        data=self.data_instance
+        S,N,N_p,U=data.S,data.N,len(data.N_p),self.printers_upperbound
+        if self.formulation=="aggregated":
+            Solution,_=self._aggregated_solution(self.second_stage_solution)
+        elif self.second_stage_solution:
+            values=np.rint(np.asarray(self.model.getSolution(self.variables),dtype=float)).astype(int)
+            layout=variable_layout(data,U)
+            Solution={"a":values[layout["a"]:layout["a_b"]],"a_b":int(values[layout["a_b"]]),"p":values[layout["p"]:layout["a_s"]].reshape(S,U,N_p),
+                      "a_s":values[layout["a_s"]:layout["y"]].reshape(S,N),"y":values[layout["y"]:layout["size"]]}
+        else:
+            values=np.rint(np.asarray(self.model.getSolution(self.variables[:N+1]+self.variables[-U:]),dtype=float)).astype(int)
+            Solution={"a":values[:N],"a_b":int(values[N]),"y":values[N+1:]}
+        #Relative gap between the best bound and the incumbent, as the MIPGap of Gurobi
+        obj_value,bound=float(self.model.attributes.mipobjval),float(self.model.attributes.bestbound)
         #List of status codes can be found in the XPress Optimizer Manual (https://www.fico.com/fico-xpress-optimization/docs/latest/solver/optimizer/HTML/chapter9.html)
         output = {
             "StatusCode":int(self.model.getProbStatus()),
             "Status":self.model.getProbStatusString(),
             "ObjValue":round(float(self.model.getObjVal()),2),
+            "MIPGap": float('{:0.2e}'.format(abs(bound-obj_value)/max(abs(obj_value),1e-10))),
             "Solution": Solution,
-            "Printers": Solution["y"].count(1)
+            "Printers": int(Solution["y"].sum())
         }
         return output
 
     def _model_generator(self):
+        if self.formulation=="aggregated":
+            return self._aggregated_model_generator()
         two_stage_stoc_knapsack= xp.problem()
         data= self.data_instance
 
@@ -87,6 +160,8 @@ class XPressSolver(Solver):
         two_stage_stoc_knapsack.addVariable(P)
         two_stage_stoc_knapsack.addVariable(y)
         two_stage_stoc_knapsack.addVariable(A_s)
+        # Variables in the order of solvers.formulation.variable_layout (used by set_start and _get_output)
+        self.variables=list(A)+[a_b]+list(P.ravel())+list(A_s.ravel())+list(y)
 
         #Constraint (12)
         two_stage_stoc_knapsack.addConstraint(np.dot(A,data.w)+a_b*data.w_b+xp.Sum(y*data.w_p)<=data.W)
@@ -120,4 +195,24 @@ class XPressSolver(Solver):
         #Objective function:
         r_for_printable=list(filter(lambda item: item is not None, [data.r[indx] if indx in data.N_p else None for indx in range(data.N)]))
         two_stage_stoc_knapsack.setObjective(xp.Sum([data.q[scenario]*(xp.Sum(A_s[scenario]*data.r)+xp.Sum([xp.Sum(data.alpha*np.array(P)[scenario,printer,:]*r_for_printable)  for printer in range(self.printers_upperbound) ])) for scenario in range(data.S)]),sense= xp.maximize)
-        self.model=two_stage_stoc_knapsack
\ No newline at end of file
+        self.model=two_stage_stoc_knapsack
+
+    # Aggregated formulation of solvers.formulation: the rows are added at once from the sparse matrices, in the column order of
+    # aggregated_variable_layout (the order in which the variables are added)
+    def _aggregated_model_generator(self):
+        two_stage_stoc_knapsack= xp.problem()
+        data= self.data_instance
+        U=self.printers_upperbound
+        M=int(min(data.W/data.w_b,data.V/data.v_b)+2)
+        A=np.array([xp.var(vartype=xp.integer, name="a_"+str(i)) for i in range(data.N)], dtype=xp.npvar)
+        a_b= xp.var(vartype=xp.integer, name="a_b")
+        X=np.array([[xp.var(vartype=xp.integer,name="x_"+str(s)+"_"+str(i)) for i in data.N_p] for s in range(data.S)], dtype=xp.npvar)
+        A_s = np.array([[xp.var(vartype=xp.integer,name="a_s_"+str(s)+"_"+str(i)) for i in range(data.N)] for s in range(data.S)], dtype=xp.npvar)
+        n=xp.var(vartype=xp.integer,ub=U,name="n")
+        self.variables=list(A)+[a_b]+list(X.ravel())+list(A_s.ravel())+[n]
+        two_stage_stoc_knapsack.addVariable(self.variables)
+        blocks=aggregated_constraint_blocks(data,U,M)
+        matrix=sp.vstack([block for _,block,_ in blocks],format="csr")
+        two_stage_stoc_knapsack.addrows(["L"]*matrix.shape[0],np.concatenate([b for _,_,b in blocks]).tolist(),matrix.indptr.tolist(),matrix.indices.tolist(),matrix.data.tolist())
+        two_stage_stoc_knapsack.setObjective(xp.Dot(np.array(self.variables,dtype=xp.npvar),aggregated_objective_vector(data,U)),sense=xp.maximize)
+        self.model=two_stage_stoc_knapsack
@@ -0,0 +1,28 @@
+import random
+import numpy as np
+import pytest
+from managers.data import Data
+from solvers.dp import DPSolver
+
+gurobipy=pytest.importorskip("gurobipy")
+from solvers.gurobi import GurobiSolver
+
+def _instance(N,D,S,seed):
+    np.random.seed(seed)
+    random.seed(seed)
+    return Data(N,D,S)
+
+@pytest.mark.parametrize("N,S,seed",[(N,S,seed) for N in (3,5,10) for S in (2,5) for seed in range(3)])
+def test_small_instances_match_gurobi(N,S,seed):
+    data=_instance(N,10,S,seed)
+    expected=GurobiSolver(data,MIPGap=0).solve()
+    result=DPSolver(data).solve()
+    assert result["Status"]=="OPTIMAL" and result["MIPGap"]==0
+    assert result["ObjValue"]==pytest.approx(expected["ObjValue"],abs=1e-6)
+
+def test_default_size_matches_gurobi():
+    data=_instance(30,10,5,0)
+    expected=GurobiSolver(data,MIPGap=0).solve()
+    assert expected["Status"]=="OPTIMAL"
+    result=DPSolver(data).solve()
+    assert result["ObjValue"]==pytest.approx(expected["ObjValue"],abs=1e-6)
@@ -0,0 +1,22 @@
+import random
+import numpy as np
+import pytest
+from managers.data import Data
+from solvers.out_of_sample import second_stage_values
+
+def _instance(N,D,S,seed):
+    np.random.seed(seed)
+    random.seed(seed)
+    return Data(N,D,S)
+
+def test_items_without_material_are_printed_when_a_b_is_zero():
+    data=_instance(10,10,5,0)
+    item=data.N_p[0]
+    data.m=np.where(np.arange(data.N)==item,0,data.m)
+    assert all(data.m[other]>0 for other in data.N_p if other!=item)
+    values,upper,exact=second_stage_values(data,data.demand,np.zeros(data.N,dtype=int),0,1)
+    # With no carried items and no material only the item with m=0 is printed, on the time of the printer
+    expected=data.alpha*data.r[item]*np.minimum(data.demand[:,item],data.T//data.t[item])
+    assert np.all(expected>0)
+    assert values==pytest.approx(expected)
+    assert np.all(exact)
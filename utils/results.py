@@ -0,0 +1,221 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+try:
+    import fcntl
+except ImportError:
+    fcntl=None
+    import msvcrt
+
+# --------------------------------------------------------- Results store ------------------------------------------------------------
+#
+# This module stores the results of the solves in a single typed file, instead of one small CSV for every table cell. The file is
+# an append-only array of NumPy records after a header with the dtype of the records:
+#   - instance, type (str): key and type of the instance (e.g. "3/N100D100S50", "N100D100S50").
+#   - the parameters of the store (float, NaN when a record has not the parameter), e.g. alpha, k, l, m of section 5.
+#   - StatusCode, Status, ObjValue, Runtime, MIPGap, Nodes, Cuts, Printers of the output of the solvers (-1 or NaN when missing).
+# Records are appended in batches under an exclusive lock of the file (fcntl.flock, msvcrt.locking on Windows), so several
+# processes (e.g. the workers of managers.runner) can append to the same store. A record left incomplete by a writer that was
+# killed is removed by the next append.
+# The queries read the records with np.memmap in chunks of "chunk_size" records: only the matching rows (query) or the
+# accumulators of the groups (aggregate) are kept in memory.
+#
+# -- Classes --
+#  -ResultStore(path,parameters=("alpha","k","l","m")): open the store (created if it does not exist; the parameters of an
+#       existing store are the ones in its header). Methods:
+#         -append(records,**common): append a list of dicts (solver outputs with "instance", "type" and the parameters; the
+#                                    other keys are not stored); the values of common are added to every record (e.g.
+#                                    type="N100D100S50", alpha=0.5).
+#         -append_results(results,**common): append the dict key->result of managers.runner (run_jobs, load_results); the type is
+#                                            the second part of the key.
+#         -query(columns=None,where=None): pandas DataFrame of the matching records.
+#         -aggregate(by,values,where=None,functions=("mean",)): pandas DataFrame with one row for each group of the "by" columns
+#                                                              and a column <value>_<function> for count, sum, mean, std, min, max.
+#       "where" is a dict column -> value, list of values, or function of the column returning a boolean mask.
+#
+# ------------------------------------------------------------------------------------------------------------------------------------
+
+MAGIC=b"TSSKPRS1"
+OUTPUT_COLUMNS=[("StatusCode","<i4"),("Status","<U24"),("ObjValue","<f8"),("Runtime","<f8"),("MIPGap","<f8"),("Nodes","<i8"),("Cuts","<i8"),("Printers","<i4")]
+FUNCTIONS=("count","sum","mean","std","min","max")
+
+def _lock(f,exclusive):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(),fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(),msvcrt.LK_LOCK,1)
+
+def _unlock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(),fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(),msvcrt.LK_UNLCK,1)
+
+def _header(dtype):
+    descr=json.dumps({"version":1,"descr":np.lib.format.dtype_to_descr(dtype)}).encode()
+    size=-(-(len(MAGIC)+8+len(descr))//64)*64
+    return MAGIC+np.uint64(size).tobytes()+descr.ljust(size-len(MAGIC)-8)
+
+def _read_header(path):
+    with open(path,"rb") as f:
+        if f.read(len(MAGIC))!=MAGIC:
+            raise ValueError(path+" is not a results store")
+        size=int(np.frombuffer(f.read(8),dtype=np.uint64)[0])
+        header=json.loads(f.read(size-len(MAGIC)-8).decode())
+    return np.dtype([tuple(field) for field in header["descr"]]),size
+
+class ResultStore:
+
+    def __init__(self,path,parameters=("alpha","k","l","m"),chunk_size=2**16):
+        self.path=path
+        self.chunk_size=chunk_size
+        if not os.path.exists(path):
+            dtype=np.dtype([("instance","<U64"),("type","<U32")]+[(name,"<f8") for name in parameters]+OUTPUT_COLUMNS)
+            # The header is written to a temporary file and linked: if another process creates the store first, its header is kept
+            temporary=path+"."+str(os.getpid())+".tmp"
+            with open(temporary,"wb") as f:
+                f.write(_header(dtype))
+            try:
+                os.link(temporary,path)
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(temporary)
+        self.dtype,self.offset=_read_header(path)
+        names=set(self.dtype.names)
+        self.parameters=tuple(name for name in self.dtype.names if name not in ("instance","type") and name not in dict(OUTPUT_COLUMNS))
+        self._strings={name:self.dtype[name].itemsize//4 for name in names if self.dtype[name].kind=="U"}
+
+    @property
+    def columns(self):
+        return list(self.dtype.names)
+
+    def __len__(self):
+        with open(self.path,"rb") as f:
+            _lock(f,False)
+            try:
+                size=os.fstat(f.fileno()).st_size
+            finally:
+                _unlock(f)
+        return (size-self.offset)//self.dtype.itemsize
+
+    def _records(self,records,common):
+        array=np.zeros(len(records),dtype=self.dtype)
+        for name in self.dtype.names:
+            kind=self.dtype[name].kind
+            array[name]=np.nan if kind=="f" else (-1 if kind=="i" else "")
+        unknown=set(common)-set(self.dtype.names)
+        if unknown:
+            raise ValueError("Unknown columns: "+str(sorted(unknown))+" (parameters of the store: "+str(list(self.parameters))+")")
+        # The other keys of the outputs (Solution, Metrics, ...) are not stored
+        for indx,record in enumerate(records):
+            record=dict(record,**common)
+            for name in self.dtype.names:
+                if name in record and record[name] is not None:
+                    value=record[name]
+                    if name in self._strings and len(str(value))>self._strings[name]:
+                        raise ValueError("Value of "+name+" longer than "+str(self._strings[name])+" characters: "+str(value))
+                    array[name][indx]=str(value) if name in self._strings else value
+        return array
+
+    def append(self,records,**common):
+        array=self._records(list(records),common)
+        if len(array)==0:
+            return 0
+        with open(self.path,"r+b") as f:
+            _lock(f,True)
+            try:
+                size=os.fstat(f.fileno()).st_size
+                end=self.offset+(size-self.offset)//self.dtype.itemsize*self.dtype.itemsize
+                # Incomplete record of a writer that was killed
+                if end!=size:
+                    f.truncate(end)
+                f.seek(end)
+                f.write(array.tobytes())
+                f.flush()
+            finally:
+                _unlock(f)
+        return len(array)
+
+    def append_results(self,results,**common):
+        return self.append([dict(result,instance=key,type=key.split("/")[1] if "/" in key else "") for key,result in results.items()],**common)
+
+    def _chunks(self):
+        count=len(self)
+        if count==0:
+            return
+        records=np.memmap(self.path,dtype=self.dtype,mode="r",offset=self.offset,shape=(count,))
+        for start in range(0,count,self.chunk_size):
+            yield records[start:start+self.chunk_size]
+
+    def _mask(self,chunk,where):
+        mask=np.ones(len(chunk),dtype=bool)
+        for name,condition in (where or dict()).items():
+            column=chunk[name]
+            if callable(condition):
+                mask&=np.asarray(condition(column),dtype=bool)
+            elif isinstance(condition,(list,tuple,set,np.ndarray)):
+                mask&=np.isin(column,list(condition))
+            elif isinstance(condition,float) and np.isnan(condition):
+                mask&=np.isnan(column)
+            else:
+                mask&=column==condition
+        return mask
+
+    def query(self,columns=None,where=None):
+        columns=self.columns if columns is None else list(columns)
+        selected=[chunk[columns][self._mask(chunk,where)] for chunk in self._chunks()]
+        array=np.concatenate(selected) if len(selected)>0 else np.zeros(0,dtype=self.dtype)[columns]
+        return pd.DataFrame({name:array[name] for name in columns},columns=columns)
+
+    def aggregate(self,by,values,where=None,functions=("mean",)):
+        by,values=[by] if isinstance(by,str) else list(by),[values] if isinstance(values,str) else list(values)
+        if not set(functions)<=set(FUNCTIONS):
+            raise ValueError("Unknown functions: "+str(sorted(set(functions)-set(FUNCTIONS))))
+        totals=None
+        for chunk in self._chunks():
+            chunk=chunk[self._mask(chunk,where)]
+            if len(chunk)==0:
+                continue
+            frame=pd.DataFrame({name:chunk[name] for name in by})
+            for name in values:
+                column=chunk[name].astype(float)
+                # -1 marks the missing integer values
+                if self.dtype[name].kind=="i":
+                    column[chunk[name]==-1]=np.nan
+                frame[name+"/count"]=~np.isnan(column)
+                frame[name+"/sum"]=np.nan_to_num(column)
+                frame[name+"/squares"]=np.nan_to_num(column)**2
+                frame[name+"/min"]=column
+                frame[name+"/max"]=column
+            grouped=frame.groupby(by,dropna=False)
+            partial=pd.concat([grouped[[name+"/"+field for name in values for field in ("count","sum","squares")]].sum(),
+                               grouped[[name+"/min" for name in values]].min(),grouped[[name+"/max" for name in values]].max()],axis=1)
+            if totals is None:
+                totals=partial
+            else:
+                additive=[name+"/"+field for name in values for field in ("count","sum","squares")]
+                merged=totals[additive].add(partial[additive],fill_value=0)
+                minimum=pd.concat([totals[[name+"/min" for name in values]],partial[[name+"/min" for name in values]]]).groupby(level=list(range(len(by))),dropna=False).min()
+                maximum=pd.concat([totals[[name+"/max" for name in values]],partial[[name+"/max" for name in values]]]).groupby(level=list(range(len(by))),dropna=False).max()
+                totals=pd.concat([merged,minimum,maximum],axis=1)
+        if totals is None:
+            index=pd.MultiIndex.from_tuples([],names=by) if len(by)>1 else pd.Index([],name=by[0])
+            return pd.DataFrame(index=index,columns=[name+"_"+function for name in values for function in functions])
+        table=pd.DataFrame(index=totals.index)
+        for name in values:
+            count,total,squares=totals[name+"/count"],totals[name+"/sum"],totals[name+"/squares"]
+            results={
+                "count":count.astype(int),
+                "sum":total,
+                "mean":total/count.where(count>0),
+                "std":np.sqrt(((squares-total**2/count.where(count>0))/(count-1).where(count>1)).clip(lower=0)),
+                "min":totals[name+"/min"],
+                "max":totals[name+"/max"],
+            }
+            for function in functions:
+                table[name+"_"+function]=results[function]
+        return table.sort_index()
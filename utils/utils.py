@@ -43,4 +43,40 @@ def from_list_to_csv(file_name,list):
 def from_csv_to_list(file_name):
         with open(file_name,newline='') as f:
                 data=csv.reader(f)
-                return [(el[0]) for el in list(data) if len(el)>0]
\ No newline at end of file
+                return [(el[0]) for el in list(data) if len(el)>0]
+
+# Traces of solvers.metrics (dict name -> Metrics dict or Trace dict) in a single compressed .npz file, one array per name and field
+def save_traces(file_name,traces):
+    arrays=dict()
+    for name,trace in traces.items():
+        trace=trace.get("Trace",trace)
+        for field,values in trace.items():
+            arrays[str(name)+"/"+field]=np.asarray(values,dtype=np.float32)
+    np.savez_compressed(file_name,**arrays)
+
+def load_traces(file_name):
+    traces=dict()
+    with np.load(file_name) as arrays:
+        for key in arrays.files:
+            name,field=key.rsplit("/",1)
+            traces.setdefault(name,dict())[field]=arrays[key]
+    return traces
+
+# Incumbent and bound over time (step plot). The relative gap is plotted on a second axis with gap=True.
+def plot_trace(trace, ax=None, title=None, gap=False):
+    trace=trace.get("Trace",trace)
+    if ax is None:
+        fig, ax = plt.subplots(figsize=(8,4))
+    ax.step(trace["time"], trace["incumbent"], where='post', label='Incumbent')
+    ax.step(trace["time"], trace["bound"], where='post', label='Bound')
+    ax.set_xlabel('Time (s)')
+    ax.set_ylabel('Objective value')
+    if gap:
+        gap_ax=ax.twinx()
+        gap_ax.step(trace["time"], np.abs(trace["bound"]-trace["incumbent"])/np.maximum(np.abs(trace["incumbent"]),1e-10), where='post', color='grey', linestyle=':', label='Gap')
+        gap_ax.set_ylabel('Relative gap')
+        gap_ax.set_yscale('log')
+    if title is not None:
+        ax.set_title(title)
+    ax.legend()
+    return ax